@@ -20,6 +20,11 @@ class Settings(BaseSettings):
     DB_NAME: str = os.getenv("DB_NAME", "driverbuddy")
     DB_USER: str = os.getenv("DB_USER", "admin")
     DB_PASSWORD: str = os.getenv("DB_PASSWORD", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    # Optional async SQLAlchemy URL overriding the DB_* settings
+    # (e.g. sqlite+aiosqlite:///./driverbuddy.db for local runs and tests)
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
     
     # AWS
     AWS_REGION: str = os.getenv("AWS_REGION", "eu-north-1")
@@ -27,11 +32,99 @@ class Settings(BaseSettings):
     # SQS Queues
     SQS_EVENTS_QUEUE: str = os.getenv("SQS_EVENTS_QUEUE", "driverbuddy-events-queue")
     SQS_SMS_QUEUE: str = os.getenv("SQS_SMS_QUEUE", "driverbuddy-sms-queue")
+    SQS_ENDPOINT_URL: str = os.getenv("SQS_ENDPOINT_URL", "")  # Override for a local stand-in
+    SQS_CLIENT_THREADS: int = int(os.getenv("SQS_CLIENT_THREADS", "8"))  # Blocking boto3 calls run here
+    
+    # Job queue backend: sqs, memory (in-process, not durable) or sql (queue_messages table)
+    QUEUE_BACKEND: str = os.getenv("QUEUE_BACKEND", "sqs")
+    QUEUE_POLL_INTERVAL_SECONDS: float = float(os.getenv("QUEUE_POLL_INTERVAL_SECONDS", "0.5"))  # sql backend
+    # Queue consumers (event processor, SMS worker)
+    QUEUE_WAIT_SECONDS: int = int(os.getenv("QUEUE_WAIT_SECONDS", "20"))  # Long poll
+    QUEUE_VISIBILITY_TIMEOUT_SECONDS: int = int(os.getenv("QUEUE_VISIBILITY_TIMEOUT_SECONDS", "60"))
+    QUEUE_PREFETCH: bool = os.getenv("QUEUE_PREFETCH", "True").lower() == "true"  # Receive the next batch while handling one
+    # Leases: held messages are kept hidden while handled, for at most QUEUE_MAX_LEASE_SECONDS
+    QUEUE_HEARTBEAT_SECONDS: float = float(os.getenv("QUEUE_HEARTBEAT_SECONDS", "20"))  # capped at a third of the visibility timeout
+    QUEUE_MAX_LEASE_SECONDS: float = float(os.getenv("QUEUE_MAX_LEASE_SECONDS", "900"))
+    # Failed jobs: transient errors are retried with exponential backoff, then dead-lettered
+    RETRY_MAX_ATTEMPTS: int = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+    RETRY_BASE_DELAY_SECONDS: float = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "10"))
+    RETRY_MAX_DELAY_SECONDS: float = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "900"))  # SQS delivery delays are capped at 15 minutes
+    
+    # Ingest pipeline (vehicle-sharded partitions for POST /webhook/samsara)
+    INGEST_PARTITIONS: int = int(os.getenv("INGEST_PARTITIONS", "8"))
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "1000"))  # per partition
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+    INGEST_RETRY_AFTER_SECONDS: int = int(os.getenv("INGEST_RETRY_AFTER_SECONDS", "1"))
+    
+    # Webhook idempotency (recently seen delivery keys)
+    IDEMPOTENCY_CACHE_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "200000"))
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600"))
+    
+    # Outbox relay (delivers outbox rows to SQS)
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    OUTBOX_POLL_INTERVAL_SECONDS: float = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "1.0"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))  # then dead-lettered
+    OUTBOX_RETENTION_HOURS: float = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))  # delivered rows kept
+    
+    # Raw telemetry table (day partitions, buffered COPY writer)
+    TELEMETRY_ENABLED: bool = os.getenv("TELEMETRY_ENABLED", "True").lower() == "true"
+    TELEMETRY_FLUSH_ROWS: int = int(os.getenv("TELEMETRY_FLUSH_ROWS", "5000"))
+    TELEMETRY_FLUSH_INTERVAL_SECONDS: float = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_SECONDS", "1.0"))
+    TELEMETRY_MAX_BUFFER_ROWS: int = int(os.getenv("TELEMETRY_MAX_BUFFER_ROWS", "200000"))  # oldest pings dropped beyond this
+    TELEMETRY_RETENTION_DAYS: int = int(os.getenv("TELEMETRY_RETENTION_DAYS", "90"))
+    TELEMETRY_PARTITIONS_AHEAD_DAYS: int = int(os.getenv("TELEMETRY_PARTITIONS_AHEAD_DAYS", "3"))
+    
+    # Event listing totals (sharded counters per filter key)
+    EVENT_COUNT_SHARDS: int = int(os.getenv("EVENT_COUNT_SHARDS", "8"))
+    
+    # GET /events/{id} response cache
+    EVENT_CACHE_SIZE: int = int(os.getenv("EVENT_CACHE_SIZE", "10000"))  # 0 disables the cache
+    EVENT_CACHE_TTL_SECONDS: float = float(os.getenv("EVENT_CACHE_TTL_SECONDS", "30"))
+    
+    # Spatial event search (geohash cells, refined with haversine)
+    GEOHASH_PRECISION: int = int(os.getenv("GEOHASH_PRECISION", "9"))  # ~5 m cells
+    GEO_MAX_COVER_CELLS: int = int(os.getenv("GEO_MAX_COVER_CELLS", "16"))
+    GEO_MAX_CANDIDATES: int = int(os.getenv("GEO_MAX_CANDIDATES", "100000"))
+    
+    # Stop hotspots (per-day cell aggregates cached in process)
+    HOTSPOT_PRECISION: int = int(os.getenv("HOTSPOT_PRECISION", "6"))  # ~1.2 x 0.6 km cells
+    HOTSPOT_MAX_DAYS: int = int(os.getenv("HOTSPOT_MAX_DAYS", "366"))
+    HOTSPOT_CACHE_DAYS: int = int(os.getenv("HOTSPOT_CACHE_DAYS", "2048"))  # 0 disables the cache
+    HOTSPOT_CACHE_TTL_SECONDS: float = float(os.getenv("HOTSPOT_CACHE_TTL_SECONDS", "3600"))
+    HOTSPOT_RECENT_TTL_SECONDS: float = float(os.getenv("HOTSPOT_RECENT_TTL_SECONDS", "60"))
+    HOTSPOT_SETTLE_SECONDS: float = float(os.getenv("HOTSPOT_SETTLE_SECONDS", "86400"))
+    
+    # Fleet rollups (hourly/daily stats tables) and their compaction job
+    ROLLUP_COMPACT_INTERVAL_SECONDS: float = float(os.getenv("ROLLUP_COMPACT_INTERVAL_SECONDS", "3600"))  # 0 disables
+    ROLLUP_COMPACT_LOOKBACK_HOURS: int = int(os.getenv("ROLLUP_COMPACT_LOOKBACK_HOURS", "48"))
+    ROLLUP_MAX_BUCKETS: int = int(os.getenv("ROLLUP_MAX_BUCKETS", "1000"))
+    
+    # Live event feed (SSE/WebSocket fan-out)
+    LIVE_FEED_BUFFER_SIZE: int = int(os.getenv("LIVE_FEED_BUFFER_SIZE", "256"))  # Per subscriber; full = dropped
+    LIVE_FEED_MAX_SUBSCRIBERS: int = int(os.getenv("LIVE_FEED_MAX_SUBSCRIBERS", "1000"))
+    LIVE_FEED_HEARTBEAT_SECONDS: float = float(os.getenv("LIVE_FEED_HEARTBEAT_SECONDS", "15"))
+    
+    # Event processor: Slack notifications posted at once per batch
+    EVENT_NOTIFY_CONCURRENCY: int = int(os.getenv("EVENT_NOTIFY_CONCURRENCY", "4"))
+    
+    # Side-effect dispatcher (Slack, Twilio and SQS calls made off the request path)
+    DISPATCH_QUEUE_SIZE: int = int(os.getenv("DISPATCH_QUEUE_SIZE", "10000"))
+    DISPATCH_WORKERS: int = int(os.getenv("DISPATCH_WORKERS", "8"))
+    DISPATCH_SLACK_CONCURRENCY: int = int(os.getenv("DISPATCH_SLACK_CONCURRENCY", "2"))
+    DISPATCH_TWILIO_CONCURRENCY: int = int(os.getenv("DISPATCH_TWILIO_CONCURRENCY", "4"))
+    DISPATCH_SQS_CONCURRENCY: int = int(os.getenv("DISPATCH_SQS_CONCURRENCY", "4"))
     
     # Twilio (from environment variables)
     TWILIO_ACCOUNT_SID: str = os.getenv("TWILIO_ACCOUNT_SID", "")
     TWILIO_AUTH_TOKEN: str = os.getenv("TWILIO_AUTH_TOKEN", "")
     TWILIO_NUMBER: str = os.getenv("TWILIO_NUMBER", "")
+    TWILIO_API_BASE_URL: str = os.getenv("TWILIO_API_BASE_URL", "")  # Override for a local stand-in
+    # Async sender: requests in flight, and messages/second per sending number
+    # (Twilio long codes: 1/s; toll-free: 3/s; short codes: 100/s)
+    TWILIO_MAX_CONCURRENCY: int = int(os.getenv("TWILIO_MAX_CONCURRENCY", "10"))
+    TWILIO_RATE_PER_NUMBER: float = float(os.getenv("TWILIO_RATE_PER_NUMBER", "1"))
+    TWILIO_BURST_PER_NUMBER: int = int(os.getenv("TWILIO_BURST_PER_NUMBER", "1"))
+    TWILIO_TIMEOUT_SECONDS: float = float(os.getenv("TWILIO_TIMEOUT_SECONDS", "15"))
     
     # Slack (from environment variables)
     SLACK_WEBHOOK_URL: str = os.getenv("SLACK_WEBHOOK_URL", "")
@@ -46,7 +139,8 @@ class Settings(BaseSettings):
     
     # Vehicle state detection
     STOP_SPEED_THRESHOLD: float = 0.5  # km/h - vehicle is stopped if speed < this
-    STOP_DURATION_SECONDS: int = 30  # minimum seconds to consider a stop
+    STOP_DURATION_SECONDS: int = int(os.getenv("STOP_DURATION_SECONDS", "30"))  # minimum seconds to consider a stop (0 = immediate)
+    VEHICLE_STATE_CACHE_SIZE: int = int(os.getenv("VEHICLE_STATE_CACHE_SIZE", "100000"))  # 0 disables the cache
     
     class Config:
         env_file = ".env"
@@ -2,7 +2,9 @@
 Database connection and session management
 """
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from app.config import settings
@@ -14,35 +16,82 @@ DB_NAME = settings.DB_NAME
 DB_USER = settings.DB_USER
 DB_PASSWORD = settings.DB_PASSWORD
 
-# Database URL
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Database URLs
+# DATABASE_URL overrides the PostgreSQL settings with any async SQLAlchemy URL,
+# e.g. sqlite+aiosqlite:///./driverbuddy.db as a same-process stand-in for tests
+if settings.DATABASE_URL:
+    ASYNC_DATABASE_URL = settings.DATABASE_URL
+    DATABASE_URL = ASYNC_DATABASE_URL.replace("+asyncpg", "").replace("+aiosqlite", "")
+else:
+    DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+if DATABASE_URL.startswith("sqlite"):
+    engine_options = {"connect_args": {"check_same_thread": False}}
+else:
+    engine_options = {"pool_size": settings.DB_POOL_SIZE, "max_overflow": settings.DB_MAX_OVERFLOW}
 
 # SQLAlchemy setup
+# Synchronous engine, used by scripts and migrations
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10,
-    echo=settings.DEBUG
+    echo=settings.DEBUG,
+    **engine_options
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine, used by the API routes and background workers
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    echo=settings.DEBUG,
+    **engine_options
+)
+
+
+def _sqlite_case_sensitive_like(dbapi_connection, connection_record):
+    # LIKE is case sensitive on PostgreSQL too, and only then can SQLite serve
+    # geohash LIKE 'prefix%' from the index (as text_pattern_ops does there)
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA case_sensitive_like = ON")
+    cursor.close()
+
+
+if DATABASE_URL.startswith("sqlite"):
+    event.listen(engine, "connect", _sqlite_case_sensitive_like)
+    event.listen(async_engine.sync_engine, "connect", _sqlite_case_sensitive_like)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
 
-def init_db():
+async def init_db():
     """Initialize database tables"""
     from app.models import Driver, Event, Message
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     print("Database tables initialized")
 
 
-def get_db():
-    """Dependency for getting database session"""
-    db = SessionLocal()
-    try:
+async def get_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
+
+def upsert_insert(db, model):
+    """
+    INSERT construct supporting on_conflict_do_nothing/on_conflict_do_update
+    for the session's dialect (PostgreSQL, or SQLite for the local stand-in)
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return sqlite.insert(model)
+    return postgresql.insert(model)
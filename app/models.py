@@ -2,12 +2,16 @@
 SQLAlchemy database models
 """
 
-from sqlalchemy import Column, Integer, BigInteger, String, Text, Numeric, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Text, Numeric, Float, ForeignKey, DateTime, JSON, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
 
 
+# BIGINT primary keys only autoincrement as INTEGER on SQLite
+BigIntegerPK = BigInteger().with_variant(Integer, "sqlite")
+
+
 class Driver(Base):
     """Driver model"""
     __tablename__ = "drivers"
@@ -26,7 +30,7 @@ class Event(Base):
     """Event model (stop/move events)"""
     __tablename__ = "events"
     
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True)
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=True)
     vehicle_id = Column(Text, index=True)
     event_type = Column(Text)  # 'stop', 'move', etc
@@ -34,19 +38,40 @@ class Event(Base):
     end_time = Column(DateTime(timezone=True), nullable=True)
     latitude = Column(Numeric(10, 7))
     longitude = Column(Numeric(10, 7))
+    geohash = Column(Text, nullable=True)  # Of (latitude, longitude), for spatial search
     event_metadata = Column(JSON, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     driver = relationship("Driver", back_populates="events")
-    messages = relationship("Message", back_populates="event")
+    messages = relationship("Message", back_populates="event", order_by="Message.created_at")
+    
+    __table_args__ = (
+        # Backstop for retried deliveries: one event per vehicle, type and start
+        Index("uq_events_vehicle_type_start", "vehicle_id", "event_type", "start_time", unique=True),
+        # Listing order (start_time DESC, id DESC) per filter combination;
+        # vehicle_id + event_type is served by the unique index above
+        Index("idx_events_time_id", "start_time", "id"),
+        Index("idx_events_vehicle_time_id", "vehicle_id", "start_time", "id"),
+        Index("idx_events_driver_time_id", "driver_id", "start_time", "id"),
+        Index("idx_events_type_time_id", "event_type", "start_time", "id"),
+        Index("idx_events_driver_type_time_id", "driver_id", "event_type", "start_time", "id"),
+        # A driver's open event (inbound SMS replies)
+        Index(
+            "idx_events_driver_open", "driver_id", "start_time",
+            postgresql_where=text("end_time IS NULL"),
+            sqlite_where=text("end_time IS NULL")
+        ),
+        # Prefix (LIKE 'abc%') scans for radius/bounding-box search
+        Index("idx_events_geohash", "geohash", postgresql_ops={"geohash": "text_pattern_ops"}),
+    )
 
 
 class Message(Base):
     """SMS message model"""
     __tablename__ = "messages"
     
-    id = Column(BigInteger, primary_key=True, index=True)
+    id = Column(BigIntegerPK, primary_key=True, index=True)
     event_id = Column(BigInteger, ForeignKey("events.id"), nullable=True)
     driver_id = Column(Integer, ForeignKey("drivers.id"), nullable=True)
     direction = Column(Text)  # 'outbound' or 'inbound'
@@ -60,6 +85,121 @@ class Message(Base):
     # Relationships
     event = relationship("Event", back_populates="messages")
     driver = relationship("Driver", back_populates="messages")
+    
+    __table_args__ = (
+        # Event detail (messages of an event in order) and Twilio status callbacks
+        Index("idx_messages_event_created", "event_id", "created_at"),
+        Index("idx_messages_twilio_sid", "twilio_sid"),
+        # Rollup compaction reads messages by creation time
+        Index("idx_messages_created", "created_at"),
+    )
+
+
+class Telemetry(Base):
+    """Raw Samsara telemetry ping, range-partitioned by day on PostgreSQL"""
+    __tablename__ = "telemetry"
+    
+    vehicle_id = Column(Text, primary_key=True)
+    recorded_at = Column(DateTime(timezone=True), primary_key=True)  # Ping timestamp
+    driver_id = Column(Integer, nullable=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    speed = Column(Float)  # km/h
+    heading = Column(Float, nullable=True)
+    ping_metadata = Column("metadata", JSON, nullable=True)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = {"postgresql_partition_by": "RANGE (recorded_at)"}
+
+
+class OutboxMessage(Base):
+    """Queue message written in the same transaction as the data it describes"""
+    __tablename__ = "outbox"
+    
+    id = Column(BigIntegerPK, primary_key=True, index=True)
+    queue = Column(Text, nullable=False)  # SQS queue name
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    delivered_at = Column(DateTime(timezone=True), nullable=True)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True)  # Backoff after a failed send
+    
+    __table_args__ = (
+        Index(
+            "idx_outbox_undelivered", "id",
+            postgresql_where=text("delivered_at IS NULL"),
+            sqlite_where=text("delivered_at IS NULL")
+        ),
+    )
 
 
+class QueuedMessage(Base):
+    """Job message of the SQL queue backend (QUEUE_BACKEND=sql)"""
+    __tablename__ = "queue_messages"
+    
+    id = Column(BigIntegerPK, primary_key=True)
+    queue = Column(Text, nullable=False)
+    body = Column(Text, nullable=False)
+    attributes = Column(JSON, nullable=True)
+    receive_count = Column(Integer, default=0, nullable=False)
+    receipt = Column(Text, nullable=True)  # Token of the latest receive; acks must match it
+    visible_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("idx_queue_messages_visible", "queue", "visible_at", "id"),
+    )
+
+
+class DeadLetter(Base):
+    """Queue job that failed permanently or ran out of retries (see app.services.retries)"""
+    __tablename__ = "dead_letters"
+    
+    id = Column(BigIntegerPK, primary_key=True)
+    queue = Column(Text, nullable=False)
+    message_id = Column(Text, nullable=True)  # Id of the failed queue message
+    body = Column(Text, nullable=False)
+    attributes = Column(JSON, nullable=True)
+    attempts = Column(Integer, nullable=False)
+    error_kind = Column(String(20), nullable=False)  # 'permanent' or 'exhausted'
+    error = Column(Text, nullable=True)
+    failed_at = Column(DateTime(timezone=True), server_default=func.now())
+    replayed_at = Column(DateTime(timezone=True), nullable=True)  # Set when sent back to its queue
+    
+    __table_args__ = (
+        Index(
+            "idx_dead_letters_pending", "queue", "id",
+            postgresql_where=text("replayed_at IS NULL"),
+            sqlite_where=text("replayed_at IS NULL")
+        ),
+    )
 
+
+class EventCount(Base):
+    """Event counter per listing filter key, split over shards to spread row locks"""
+    __tablename__ = "event_counts"
+    
+    filter_key = Column(Text, primary_key=True)  # 'all', 'vehicle:<id>', 'driver:<id>', 'type:<type>'
+    shard = Column(SmallInteger, primary_key=True)
+    count = Column(BigInteger, default=0, nullable=False)
+
+
+class FleetRollup(Base):
+    """Hourly/daily stop and message totals per vehicle, driver or the whole fleet"""
+    __tablename__ = "fleet_rollups"
+    
+    granularity = Column(Text, primary_key=True)  # 'hour' or 'day'
+    dimension = Column(Text, primary_key=True)  # 'vehicle', 'driver' or 'fleet'
+    key = Column(Text, primary_key=True)  # vehicle_id, driver id, or '*' for the fleet
+    bucket_start = Column(DateTime(timezone=True), primary_key=True)
+    shard = Column(SmallInteger, primary_key=True)
+    stops = Column(Integer, default=0, nullable=False)  # Stops started in the bucket
+    closed_stops = Column(Integer, default=0, nullable=False)  # Of those, closed so far
+    dwell_seconds = Column(Float, default=0, nullable=False)  # Total dwell of the closed ones
+    outbound_messages = Column(Integer, default=0, nullable=False)
+    inbound_messages = Column(Integer, default=0, nullable=False)
+    
+    __table_args__ = (
+        # All vehicles' or drivers' buckets in a time range
+        Index("idx_fleet_rollups_bucket", "granularity", "dimension", "bucket_start"),
+    )
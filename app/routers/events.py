@@ -2,74 +2,494 @@
 Events API endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import Optional, List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from typing import Optional, List, Tuple
+from datetime import datetime, timedelta
+import asyncio
+import base64
+import binascii
+import json
+import numpy as np
 
 from app.database import get_db
-from app.models import Event, Message
-from app.schemas import EventResponse, EventListResponse, EventDetailResponse, MessageResponse
+from app.models import Event
+from app.config import settings
+from app.schemas import (
+    EventResponse, EventListResponse, EventDetailResponse, GeoEventResponse, GeoSearchResponse,
+    HotspotListResponse, StopHotspot
+)
 from app.auth import get_current_user
+from app.services.event_cache import event_detail_cache
+from app.services.event_export import export_query, gzip_stream, stream_export
+from app.services.geo import bbox_around, cover_bbox, haversine_km
+from app.services.hotspots import stop_hotspots
+from app.services.live_feed import FeedFull, live_feed
+from app.services.event_counts import estimate_event_count, filter_key, get_event_count
 
 router = APIRouter()
 
 
+def _encode_cursor(event: Event, direction: str) -> str:
+    """Opaque cursor pointing just past `event` in `direction` ('next' or 'prev')"""
+    raw = json.dumps({"t": event.start_time.isoformat(), "i": event.id, "d": direction})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int, str]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        direction = raw["d"]
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(raw["t"]), int(raw["i"]), direction
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @router.get("", response_model=EventListResponse)
 async def list_events(
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    exact_total: bool = False,
     vehicle_id: Optional[str] = None,
     driver_id: Optional[int] = None,
     event_type: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
 ):
     """
     List events with pagination and filters
+    
+    Events are ordered newest first by (start_time, id). Pass the
+    next_cursor/prev_cursor of a response as `cursor` to page by keyset,
+    which costs the same at any depth; `page` is ignored then. Plain
+    page/page_size paging is still supported.
+    
+    `total` is an exact count only with exact_total=true; otherwise it
+    comes from the per-filter counters or the planner's estimate, as
+    reported by total_exact/total_source.
     """
-    query = db.query(Event)
+    query = select(Event)
     
     # Apply filters
     if vehicle_id:
-        query = query.filter(Event.vehicle_id == vehicle_id)
+        query = query.where(Event.vehicle_id == vehicle_id)
     if driver_id:
-        query = query.filter(Event.driver_id == driver_id)
+        query = query.where(Event.driver_id == driver_id)
     if event_type:
-        query = query.filter(Event.event_type == event_type)
+        query = query.where(Event.event_type == event_type)
     
-    # Get total count
-    total = query.count()
+    # Get total: counter for zero or one filter, planner estimate otherwise
+    total, total_source = None, "count"
+    if not exact_total:
+        key = filter_key(vehicle_id, driver_id, event_type)
+        if key is not None:
+            total, total_source = await get_event_count(db, key), "counter"
+        if total is None:
+            total, total_source = await estimate_event_count(db, query), "estimate"
+    if total is None:
+        total, total_source = (await db.execute(
+            select(func.count()).select_from(query.subquery())
+        )).scalar_one(), "count"
     
-    # Apply pagination
-    events = query.order_by(Event.start_time.desc()).offset((page - 1) * page_size).limit(page_size).all()
+    # Apply pagination, fetching one extra row to tell whether more follow
+    key = tuple_(Event.start_time, Event.id)
+    if cursor:
+        start_time, event_id, direction = _decode_cursor(cursor)
+        if direction == "next":
+            query = query.where(key < tuple_(start_time, event_id)).order_by(
+                Event.start_time.desc(), Event.id.desc()
+            )
+        else:
+            query = query.where(key > tuple_(start_time, event_id)).order_by(
+                Event.start_time.asc(), Event.id.asc()
+            )
+        events = (await db.execute(query.limit(page_size + 1))).scalars().all()
+        has_more = len(events) > page_size
+        events = events[:page_size]
+        if direction == "prev":
+            events.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, True
+        page = None
+    else:
+        events = (await db.execute(
+            query.order_by(Event.start_time.desc(), Event.id.desc())
+            .offset((page - 1) * page_size).limit(page_size + 1)
+        )).scalars().all()
+        has_next, has_prev = len(events) > page_size, page > 1
+        events = events[:page_size]
     
     return EventListResponse(
         events=[EventResponse.model_validate(e) for e in events],
         total=total,
+        total_exact=total_source == "count",
+        total_source=total_source,
         page=page,
-        page_size=page_size
+        page_size=page_size,
+        next_cursor=_encode_cursor(events[-1], "next") if events and has_next else None,
+        prev_cursor=_encode_cursor(events[0], "prev") if events and has_prev else None
+    )
+
+
+async def _geo_candidates(
+    db: AsyncSession,
+    bbox: Tuple[float, float, float, float],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    vehicle_id: Optional[str],
+    event_type: Optional[str],
+    newest_first: bool = False
+):
+    """
+    (ids, latitudes, longitudes, start_times, truncated) of events in the
+    geohash cells covering bbox
+
+    At most GEO_MAX_CANDIDATES are read; with newest_first they are the
+    newest ones, otherwise an arbitrary subset.
+    """
+    query = select(Event.id, Event.latitude, Event.longitude, Event.start_time).where(
+        or_(*[Event.geohash.like(f"{prefix}%") for prefix in cover_bbox(*bbox)])
+    )
+    if start:
+        query = query.where(Event.start_time >= start)
+    if end:
+        query = query.where(Event.start_time < end)
+    if vehicle_id:
+        query = query.where(Event.vehicle_id == vehicle_id)
+    if event_type:
+        query = query.where(Event.event_type == event_type)
+    
+    if newest_first:
+        query = query.order_by(Event.start_time.desc(), Event.id.desc())
+    rows = (await db.execute(query.limit(settings.GEO_MAX_CANDIDATES + 1))).all()
+    truncated = len(rows) > settings.GEO_MAX_CANDIDATES
+    rows = rows[:settings.GEO_MAX_CANDIDATES]
+    return (
+        np.array([row.id for row in rows], dtype=np.int64),
+        np.array([float(row.latitude) for row in rows], dtype=np.float64),
+        np.array([float(row.longitude) for row in rows], dtype=np.float64),
+        [row.start_time for row in rows],
+        truncated
+    )
+
+
+async def _load_geo_events(db: AsyncSession, ids: List[int], distances: Optional[List[float]] = None) -> List[GeoEventResponse]:
+    events = {
+        event.id: event
+        for event in (await db.execute(select(Event).where(Event.id.in_(ids)))).scalars()
+    }
+    return [
+        GeoEventResponse(
+            **EventResponse.model_validate(events[event_id]).model_dump(),
+            distance_km=round(distances[position], 4) if distances is not None else None
+        )
+        for position, event_id in enumerate(ids)
+        if event_id in events
+    ]
+
+
+@router.get("/nearby", response_model=GeoSearchResponse)
+async def events_nearby(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(..., gt=0, le=500),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    vehicle_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Events within radius_km of a point, nearest first
+    
+    Candidates come from indexed geohash prefix scans; exact distances are
+    computed with a vectorized haversine. Returns 422 when the area holds
+    more than GEO_MAX_CANDIDATES events, as the nearest ones could be missed.
+    """
+    ids, latitudes, longitudes, _, truncated = await _geo_candidates(
+        db, bbox_around(latitude, longitude, radius_km), start, end, vehicle_id, event_type
+    )
+    if truncated:
+        raise HTTPException(
+            status_code=422,
+            detail=f"More than {settings.GEO_MAX_CANDIDATES} candidate events; use a smaller radius_km, "
+                   f"a time window or filters"
+        )
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    inside = np.flatnonzero(distances <= radius_km)
+    nearest = inside[np.argsort(distances[inside], kind="stable")[:limit]]
+    
+    return GeoSearchResponse(
+        events=await _load_geo_events(db, ids[nearest].tolist(), distances[nearest].tolist()),
+        candidates=len(ids),
+        truncated=truncated
+    )
+
+
+@router.get("/bbox", response_model=GeoSearchResponse)
+async def events_in_bbox(
+    min_latitude: float = Query(..., ge=-90, le=90),
+    min_longitude: float = Query(..., ge=-180, le=180),
+    max_latitude: float = Query(..., ge=-90, le=90),
+    max_longitude: float = Query(..., ge=-180, le=180),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    vehicle_id: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Events inside a bounding box, newest first
+    
+    Candidates are read newest first; returns 422 when they are cut at
+    GEO_MAX_CANDIDATES before `limit` events inside the box were found.
+    """
+    if min_latitude > max_latitude or min_longitude > max_longitude:
+        raise HTTPException(status_code=400, detail="min_* must not exceed max_*")
+    
+    ids, latitudes, longitudes, start_times, truncated = await _geo_candidates(
+        db, (min_latitude, min_longitude, max_latitude, max_longitude), start, end, vehicle_id, event_type,
+        newest_first=True
+    )
+    inside = np.flatnonzero(
+        (latitudes >= min_latitude) & (latitudes <= max_latitude)
+        & (longitudes >= min_longitude) & (longitudes <= max_longitude)
+    )
+    if truncated and len(inside) < limit:
+        # Older events inside the box may lie past the cut
+        raise HTTPException(
+            status_code=422,
+            detail=f"More than {settings.GEO_MAX_CANDIDATES} candidate events; use a smaller box, "
+                   f"a time window or filters"
+        )
+    newest = sorted(inside.tolist(), key=lambda i: (start_times[i], ids[i]), reverse=True)[:limit]
+    
+    return GeoSearchResponse(
+        events=await _load_geo_events(db, ids[newest].tolist()),
+        candidates=len(ids),
+        truncated=truncated
     )
 
 
+HOTSPOT_SORT_KEYS = {
+    "total_dwell": lambda h: h["total_dwell_seconds"],
+    "median_dwell": lambda h: h["median_dwell_seconds"] or 0.0,
+    "stops": lambda h: h["stop_count"],
+    "vehicles": lambda h: h["vehicle_count"],
+}
+
+
+@router.get("/hotspots", response_model=HotspotListResponse)
+async def list_hotspots(
+    start: datetime,
+    end: datetime,
+    precision: Optional[int] = Query(None, ge=3, le=8),
+    vehicle_id: Optional[str] = None,
+    driver_id: Optional[int] = None,
+    min_stops: int = Query(1, ge=1),
+    sort: str = Query("total_dwell", pattern="^(total_dwell|median_dwell|stops|vehicles)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Where the fleet stops: stops starting in [start, end) clustered by
+    geohash cell (precision 3-8, default HOTSPOT_PRECISION)
+    
+    Per-day aggregates are cached (see app.services.hotspots), so repeat
+    queries over long windows only read the days not cached yet.
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if end - start > timedelta(days=settings.HOTSPOT_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Window exceeds {settings.HOTSPOT_MAX_DAYS} days")
+    precision = precision or settings.HOTSPOT_PRECISION
+    
+    cells, cached_days, queried_segments = await stop_hotspots(
+        db, start, end, precision, vehicle_id, driver_id
+    )
+    hotspots = [
+        stats.summary(cell) for cell, stats in cells.items() if stats.stop_count >= min_stops
+    ]
+    hotspots.sort(key=lambda h: (HOTSPOT_SORT_KEYS[sort](h), h["stop_count"]), reverse=True)
+    
+    return HotspotListResponse(
+        hotspots=[StopHotspot(**h) for h in hotspots[:limit]],
+        clusters=len(hotspots),
+        stop_count=sum(h["stop_count"] for h in hotspots),
+        precision=precision,
+        cached_days=cached_days,
+        queried_segments=queried_segments
+    )
+
+
+def _subscribe(vehicle_id: Optional[List[str]], driver_id: Optional[List[int]], type: Optional[List[str]]):
+    return live_feed.subscribe(vehicle_ids=vehicle_id, driver_ids=driver_id, types=type)
+
+
+@router.get("/live")
+async def live_events(
+    vehicle_id: Optional[List[str]] = Query(None),
+    driver_id: Optional[List[int]] = Query(None),
+    type: Optional[List[str]] = Query(None),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Live feed of committed changes as Server-Sent Events
+    
+    Each event's data is a JSON object with `type` (stop_started,
+    move_started, inbound_message, message_status), vehicle_id, driver_id
+    and `data`. Filter with repeatable vehicle_id/driver_id/type. A client
+    that falls LIVE_FEED_BUFFER_SIZE messages behind gets a final `dropped`
+    event and should reconnect.
+    """
+    try:
+        subscription = _subscribe(vehicle_id, driver_id, type)
+    except FeedFull:
+        raise HTTPException(status_code=503, detail="Too many live subscribers", headers={"Retry-After": "5"})
+    
+    async def body():
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    message = await subscription.next(settings.LIVE_FEED_HEARTBEAT_SECONDS)
+                except EOFError as e:
+                    yield f"event: dropped\ndata: {json.dumps({'reason': str(e)})}\n\n"
+                    return
+                if message is None:
+                    yield ": heartbeat\n\n"
+                    continue
+                yield "".join(f"data: {m}\n\n" for m in [message, *subscription.drain()])
+        finally:
+            live_feed.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.websocket("/live/ws")
+async def live_events_ws(
+    websocket: WebSocket,
+    vehicle_id: Optional[List[str]] = Query(None),
+    driver_id: Optional[List[int]] = Query(None),
+    type: Optional[List[str]] = Query(None),
+):
+    """
+    Live feed of committed changes over a WebSocket
+    
+    Same messages and filters as GET /events/live, one JSON text frame each;
+    heartbeats are {"type": "heartbeat"}. A client that falls behind gets
+    {"type": "dropped"} and the socket is closed with code 1013.
+    """
+    await websocket.accept()
+    try:
+        subscription = _subscribe(vehicle_id, driver_id, type)
+    except FeedFull:
+        await websocket.close(code=1013, reason="Too many live subscribers")
+        return
+    
+    async def watch_client():
+        # Clients only listen; this notices when they go away
+        try:
+            while True:
+                await websocket.receive_text()
+        except (WebSocketDisconnect, RuntimeError):
+            subscription.close("client closed")
+    
+    watcher = asyncio.create_task(watch_client())
+    try:
+        while True:
+            try:
+                message = await subscription.next(settings.LIVE_FEED_HEARTBEAT_SECONDS)
+            except EOFError as e:
+                if str(e) != "client closed":
+                    await websocket.send_text(json.dumps({"type": "dropped", "reason": str(e)}))
+                    await websocket.close(code=1013)
+                return
+            if message is None:
+                await websocket.send_text('{"type": "heartbeat"}')
+                continue
+            for m in [message, *subscription.drain()]:
+                await websocket.send_text(m)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        live_feed.unsubscribe(subscription)
+        watcher.cancel()
+
+
+@router.get("/export")
+async def export_events(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    vehicle_id: Optional[str] = None,
+    driver_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_messages: bool = False,
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Stream all events with start_time in [start, end) matching the filters
+    
+    NDJSON (one event per line, with a `messages` list if include_messages)
+    or CSV (one row per message if include_messages). The body is gzipped
+    when the client sends Accept-Encoding: gzip.
+    """
+    body = stream_export(
+        export_query(start, end, vehicle_id, driver_id, event_type, include_messages),
+        format,
+        include_messages
+    )
+    headers = {"Content-Disposition": f'attachment; filename="events.{format}"'}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(body, media_type=media_type, headers=headers)
+
+
 @router.get("/{event_id}", response_model=EventDetailResponse)
 async def get_event(
     event_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
 ):
     """
     Get event details with associated messages
-    """
-    event = db.query(Event).filter(Event.id == event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
     
-    # Get messages for this event
-    messages = db.query(Message).filter(Message.event_id == event_id).order_by(Message.created_at).all()
-    
-    event_detail = EventDetailResponse.model_validate(event)
-    event_detail.messages = [MessageResponse.model_validate(m) for m in messages]
+    The event and its messages are loaded with one joined query; serialized
+    responses are cached (see app.services.event_cache).
+    """
+    body = event_detail_cache.get(event_id)
+    if body is None:
+        token = event_detail_cache.token()
+        event = (await db.execute(
+            select(Event).options(joinedload(Event.messages)).where(Event.id == event_id)
+        )).unique().scalars().first()
+        if not event:
+            raise HTTPException(status_code=404, detail="Event not found")
+        
+        body = EventDetailResponse.model_validate(event).model_dump_json().encode()
+        event_detail_cache.put(event_id, body, token)
     
-    return event_detail
+    return Response(content=body, media_type="application/json")
 
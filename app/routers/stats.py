@@ -0,0 +1,182 @@
+"""
+Fleet stats endpoints
+
+Read only from the hourly/daily rollups (see app.services.rollups), never
+from events or messages.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Tuple
+from datetime import datetime, timezone
+
+from app.database import get_db
+from app.config import settings
+from app.schemas import RollupBucket, RollupMetrics, StatsRankingItem, StatsRankingResponse, StatsSeriesResponse
+from app.services.rollups import FLEET_KEY, METRICS, bucket_delta, bucket_start, read_rollups
+
+router = APIRouter()
+
+GRANULARITY = Query("day", pattern="^(hour|day)$")
+RANKING_SORT_KEYS = ("stops", "total_dwell_seconds", "avg_dwell_seconds", "inbound_messages", "reply_rate")
+
+
+def _window(granularity: str, start: Optional[datetime], end: Optional[datetime]) -> Tuple[datetime, datetime]:
+    """[start, end) aligned to bucket boundaries; defaults to the last 7 days or 24 hours"""
+    step = bucket_delta(granularity)
+    end = end or datetime.now(timezone.utc)
+    start = bucket_start(start or end - step * (7 if granularity == "day" else 24), granularity)
+    end = end if end.tzinfo else end.replace(tzinfo=timezone.utc)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if (end - start) / step > settings.ROLLUP_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Window exceeds {settings.ROLLUP_MAX_BUCKETS} {granularity} buckets"
+        )
+    return start, end
+
+
+def _metrics(totals: dict) -> dict:
+    closed = totals["closed_stops"]
+    outbound = totals["outbound_messages"]
+    return {
+        "stops": totals["stops"],
+        "closed_stops": closed,
+        "total_dwell_seconds": totals["dwell_seconds"],
+        "avg_dwell_seconds": round(totals["dwell_seconds"] / closed, 3) if closed else None,
+        "outbound_messages": outbound,
+        "inbound_messages": totals["inbound_messages"],
+        "reply_rate": round(totals["inbound_messages"] / outbound, 4) if outbound else None
+    }
+
+
+def _sum(rows) -> dict:
+    totals = dict.fromkeys(METRICS, 0)
+    for row in rows:
+        for metric in METRICS:
+            totals[metric] += getattr(row, metric) or 0
+    totals["dwell_seconds"] = float(totals["dwell_seconds"])
+    return totals
+
+
+async def _series(
+    db: AsyncSession,
+    dimension: str,
+    key: str,
+    granularity: str,
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> StatsSeriesResponse:
+    start, end = _window(granularity, start, end)
+    rows = await read_rollups(db, granularity, dimension, start, end, key)
+    return StatsSeriesResponse(
+        dimension=dimension,
+        key=key,
+        granularity=granularity,
+        start=start,
+        end=end,
+        totals=RollupMetrics(**_metrics(_sum(rows))),
+        buckets=[RollupBucket(bucket_start=row.bucket_start, **_metrics(_sum([row]))) for row in rows]
+    )
+
+
+async def _ranking(
+    db: AsyncSession,
+    dimension: str,
+    granularity: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+    sort: str,
+    limit: int
+) -> StatsRankingResponse:
+    start, end = _window(granularity, start, end)
+    by_key = {}
+    for row in await read_rollups(db, granularity, dimension, start, end):
+        by_key.setdefault(row.key, []).append(row)
+    items = [{"key": key, **_metrics(_sum(rows))} for key, rows in by_key.items()]
+    items.sort(key=lambda item: (item[sort] or 0, item["stops"]), reverse=True)
+    return StatsRankingResponse(
+        dimension=dimension,
+        granularity=granularity,
+        start=start,
+        end=end,
+        items=[StatsRankingItem(**item) for item in items[:limit]],
+        total_keys=len(items)
+    )
+
+
+@router.get("/fleet", response_model=StatsSeriesResponse)
+async def fleet_stats(
+    granularity: str = GRANULARITY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Fleet-wide stops, dwell and SMS replies per hour or day
+    """
+    return await _series(db, "fleet", FLEET_KEY, granularity, start, end)
+
+
+@router.get("/vehicles", response_model=StatsRankingResponse)
+async def vehicle_ranking(
+    granularity: str = GRANULARITY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sort: str = Query("stops", pattern=f"^({'|'.join(RANKING_SORT_KEYS)})$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Vehicles ranked by their totals over a window
+    """
+    return await _ranking(db, "vehicle", granularity, start, end, sort, limit)
+
+
+@router.get("/vehicles/{vehicle_id}", response_model=StatsSeriesResponse)
+async def vehicle_stats(
+    vehicle_id: str,
+    granularity: str = GRANULARITY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    A vehicle's stops, dwell and SMS replies per hour or day
+    """
+    return await _series(db, "vehicle", vehicle_id, granularity, start, end)
+
+
+@router.get("/drivers", response_model=StatsRankingResponse)
+async def driver_ranking(
+    granularity: str = GRANULARITY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    sort: str = Query("stops", pattern=f"^({'|'.join(RANKING_SORT_KEYS)})$"),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    Drivers ranked by their totals over a window
+    """
+    return await _ranking(db, "driver", granularity, start, end, sort, limit)
+
+
+@router.get("/drivers/{driver_id}", response_model=StatsSeriesResponse)
+async def driver_stats(
+    driver_id: int,
+    granularity: str = GRANULARITY,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db),
+    # current_user = Depends(get_current_user)  # Uncomment when auth is implemented
+):
+    """
+    A driver's stops, dwell and SMS replies per hour or day
+    """
+    return await _series(db, "driver", str(driver_id), granularity, start, end)
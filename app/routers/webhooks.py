@@ -3,8 +3,10 @@ Webhook endpoints for Samsara and Twilio
 """
 
 from fastapi import APIRouter, Request, HTTPException, Header, Depends
-from sqlalchemy.orm import Session
-from typing import Optional
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import hmac
 import hashlib
 import base64
@@ -14,182 +16,208 @@ from app.database import get_db
 from app.models import Driver, Event, Message
 from app.schemas import SamsaraWebhookPayload, TwilioInboundPayload
 from app.config import settings
-from app.services.event_detector import detect_event_transition, create_or_update_event
+from app.services.dispatcher import dispatcher
+from app.services.event_cache import event_detail_cache
+from app.services.idempotency import delivery_filter, delivery_key
+from app.services.ingest_pipeline import ingest_pipeline, PipelineSaturated
+from app.services.live_feed import live_feed, publish_message_status
+from app.services.rollups import RollupDeltas, add_rollups
 from app.services.slack import send_slack_notification
-from app.services.twilio_service import send_sms
-import boto3
+import asyncio
 import json
 from datetime import datetime, timedelta
 
 router = APIRouter()
 
-# SQS client
-sqs = boto3.client('sqs', region_name=settings.AWS_REGION)
-
 
 @router.post("/samsara")
 async def samsara_webhook(
     payload: SamsaraWebhookPayload,
-    request: Request,
-    db: Session = Depends(get_db)
+    request: Request
 ):
     """
     Receive Samsara telemetry webhook
     
-    Detects stop/move transitions and creates events
+    Detects stop/move transitions and creates events. The payload is queued
+    on its vehicle's ingest pipeline partition, which batches the database
+    writes; returns 429 with Retry-After when that partition is saturated.
+    
+    Retried deliveries (same deliveryId, or same vehicleId and timestamp)
+    are answered from the duplicate filter without touching the database;
+    one arriving while the original is still processing gets the original's
+    response (200 once it committed, or its error).
     """
+    key = delivery_key(payload)
+    duplicate, in_flight = delivery_filter.claim(key)
+    if duplicate:
+        if in_flight is not None:
+            # Answer only once the original committed; mirror its error otherwise
+            await asyncio.shield(in_flight)
+        return {
+            "status": "ok",
+            "duplicate": True,
+            "event_created": False,
+            "event_id": None,
+            "transition": None
+        }
+    
     try:
-        # Get or create driver if driverId provided
-        driver = None
-        if payload.driverId:
-            driver = db.query(Driver).filter(Driver.id == int(payload.driverId)).first()
-            if not driver:
-                # Create driver if not exists (you may want to handle this differently)
-                driver = Driver(id=int(payload.driverId), name=f"Driver {payload.driverId}")
-                db.add(driver)
-                db.commit()
-                db.refresh(driver)
-        
-        # Get previous event for this vehicle to determine state
-        previous_event = db.query(Event).filter(
-            Event.vehicle_id == payload.vehicleId
-        ).order_by(Event.start_time.desc()).first()
-        
-        # Determine previous state from last event
-        previous_state = "move"  # Default to move if no previous events
-        current_open_event = None
+        try:
+            future = ingest_pipeline.submit(payload)
+        except PipelineSaturated:
+            raise HTTPException(
+                status_code=429,
+                detail="Ingest pipeline saturated, retry later",
+                headers={"Retry-After": str(settings.INGEST_RETRY_AFTER_SECONDS)}
+            )
         
-        if previous_event:
-            # If last event was a stop and hasn't ended, we're still stopped
-            if previous_event.event_type == "stop" and previous_event.end_time is None:
-                previous_state = "stop"
-                current_open_event = previous_event
-            else:
-                previous_state = "move"
+        try:
+            result = await future
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error processing webhook: {str(e)}")
         
-        # Detect event transition
-        transition = detect_event_transition(
-            current_speed=payload.speed,
-            previous_state=previous_state,
-            stop_threshold=settings.STOP_SPEED_THRESHOLD
-        )
+        if result["status"] == "error":
+            raise HTTPException(status_code=400, detail=result["detail"])
+    except HTTPException as e:
+        delivery_filter.fail(key, e)
+        raise
+    except BaseException:
+        # Cancelled (client gone) before the outcome was known: let the next retry through
+        delivery_filter.fail(key, HTTPException(status_code=500, detail="Webhook processing interrupted"))
+        raise
+    delivery_filter.complete(key)
+    
+    return {
+        "status": "ok",
+        "duplicate": result["status"] == "duplicate",
+        "event_created": result["event_created"],
+        "event_id": result["event_id"] if result["event_created"] else None,
+        "transition": result["transition"]
+    }
+
+
+@router.post("/samsara/batch")
+async def samsara_batch_webhook(request: Request):
+    """
+    Receive many Samsara telemetry payloads in one request
+    
+    Accepts a JSON array of payloads, or NDJSON (one payload per line) when
+    sent with an `application/x-ndjson` content type. Payloads go through
+    the vehicle-sharded ingest pipeline like single webhooks, so each
+    vehicle's pings are still detected in order by one partition consumer;
+    returns 429 with Retry-After (nothing queued) when a partition lacks
+    room for its share of the batch. Notifications go through the SQS events
+    queue only. Items retrying a delivery that is still processing are only
+    acknowledged once it committed; its 429/500 fails this batch too.
+    """
+    raw_body = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            items = [json.loads(line) for line in raw_body.splitlines() if line.strip()]
+        else:
+            items = json.loads(raw_body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {str(e)}")
+    
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array or NDJSON")
+    
+    # Validate items individually so one bad payload doesn't reject the batch
+    results: List[Optional[dict]] = [None] * len(items)
+    payloads = []
+    positions = []
+    keys = []
+    # (index, future) of duplicates whose original is still processing
+    waits = []
+    for index, item in enumerate(items):
+        try:
+            payload = SamsaraWebhookPayload.model_validate(item)
+        except ValidationError as e:
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "detail": e.errors(include_url=False)
+            }
+            continue
         
-        event = None
-        if transition == "stop_started":
-            # Create new stop event
-            event = create_or_update_event(
-                db=db,
-                vehicle_id=payload.vehicleId,
-                driver_id=driver.id if driver else None,
-                event_type="stop",
-                latitude=payload.latitude,
-                longitude=payload.longitude,
-                timestamp=payload.timestamp,
-                metadata=payload.metadata
+        # Retried deliveries are answered from the duplicate filter, or once
+        # their in-flight original has committed
+        key = delivery_key(payload)
+        duplicate, in_flight = delivery_filter.claim(key)
+        if duplicate:
+            results[index] = {
+                "index": index,
+                "status": "duplicate",
+                "vehicle_id": payload.vehicleId
+            }
+            if in_flight is not None:
+                waits.append((index, in_flight))
+            continue
+        payloads.append(payload)
+        positions.append(index)
+        keys.append(key)
+    
+    try:
+        try:
+            futures = ingest_pipeline.submit_many(payloads, notify=False)
+        except PipelineSaturated:
+            raise HTTPException(
+                status_code=429,
+                detail="Ingest pipeline saturated, retry later",
+                headers={"Retry-After": str(settings.INGEST_RETRY_AFTER_SECONDS)}
             )
-            
-            # Send Slack notification immediately (for testing/debugging)
-            driver_name = driver.name if driver else "Unknown"
-            driver_phone = driver.phone if driver else "N/A"
-            slack_message = (
-                f"🚛 Vehicle {payload.vehicleId} stopped\n"
-                f"Driver: {driver_name} ({driver_phone})\n"
-                f"Location: {payload.latitude:.4f}, {payload.longitude:.4f}\n"
-                f"Time: {payload.timestamp.isoformat()}"
+        outcomes = await asyncio.gather(*futures, return_exceptions=True)
+    except HTTPException as e:
+        for key in keys:
+            delivery_filter.fail(key, e)
+        raise
+    except BaseException:
+        # Cancelled before the outcomes were known: let the next retry through
+        for key in keys:
+            delivery_filter.fail(key, HTTPException(status_code=500, detail="Webhook processing interrupted"))
+        raise
+    
+    errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+    events_created = 0
+    for index, key, outcome in zip(positions, keys, outcomes):
+        if isinstance(outcome, Exception):
+            delivery_filter.fail(
+                key, HTTPException(status_code=500, detail=f"Error processing batch webhook: {str(outcome)}")
             )
-            send_slack_notification(slack_message)
-            
-            # Send SMS directly if driver has phone number (for testing/debugging)
-            # This bypasses SQS for immediate testing
-            if driver and driver.phone:
-                try:
-                    sms_body = (
-                        f"DriverBuddy: Vehicle {payload.vehicleId} stopped at "
-                        f"{payload.latitude:.4f},{payload.longitude:.4f} at {payload.timestamp.isoformat()}. "
-                        f"Reply to this SMS."
-                    )
-                    print(f"Attempting to send SMS directly to {driver.phone}...")
-                    print(f"  From: {settings.TWILIO_NUMBER}")
-                    print(f"  To: {driver.phone}")
-                    
-                    # Send SMS exactly like the test script (no status callback for now)
-                    # Status callbacks can be added later once basic SMS is working
-                    # This matches the test script behavior exactly
-                    sms_success, twilio_sid = send_sms(driver.phone, sms_body)
-                    
-                    if sms_success and twilio_sid:
-                        # Create message record
-                        # Note: For virtual-to-virtual, status may show as "failed" on sender side
-                        # but message is still delivered. Status callback will update actual status.
-                        message = Message(
-                            event_id=event.id,
-                            driver_id=driver.id,
-                            direction="outbound",
-                            body=sms_body,
-                            from_phone=settings.TWILIO_NUMBER,
-                            to_phone=driver.phone,
-                            status="sent",  # Initial status, will be updated by status callback
-                            twilio_sid=twilio_sid
-                        )
-                        db.add(message)
-                        db.commit()
-                        print(f"✓ SMS sent directly and message record created (SID: {twilio_sid})")
-                        print(f"  Note: For virtual-to-virtual numbers, delivery status may differ on each side")
-                    else:
-                        print(f"✗ Failed to send SMS directly. Will try via SQS queue.")
-                        print(f"  Check application logs above for detailed error messages")
-                
-                except Exception as sms_error:
-                    # Catch any exceptions during SMS sending to prevent webhook from failing
-                    print(f"✗ Exception while sending SMS: {sms_error}")
-                    import traceback
-                    print(f"  Traceback: {traceback.format_exc()}")
-                    print(f"  Webhook will continue, but SMS was not sent")
-            
-            # Enqueue event to SQS for processing (SMS sending via worker)
-            # This is the production path, but we also send directly above for testing
-            try:
-                queue_url = sqs.get_queue_url(QueueName=settings.SQS_EVENTS_QUEUE)['QueueUrl']
-                sqs.send_message(
-                    QueueUrl=queue_url,
-                    MessageBody=json.dumps({
-                        "event_id": event.id,
-                        "driver_id": driver.id if driver else None,
-                        "vehicle_id": payload.vehicleId,
-                        "latitude": float(payload.latitude),
-                        "longitude": float(payload.longitude),
-                        "timestamp": payload.timestamp.isoformat()
-                    })
-                )
-                print(f"✓ Event enqueued to SQS for processing")
-            except Exception as sqs_error:
-                # Log SQS error but don't fail the webhook
-                print(f"Warning: Could not send message to SQS: {sqs_error}")
-                print("  → SMS was sent directly above, but SQS processing will not happen")
-            
-        elif transition == "move_started" and current_open_event:
-            # Update existing stop event with end_time
-            if current_open_event.end_time is None:
-                current_open_event.end_time = payload.timestamp
-        
-        db.commit()
-        
-        return {
-            "status": "ok",
-            "event_created": event is not None,
-            "event_id": event.id if event else None,
-            "transition": transition
-        }
+            continue
+        if outcome["status"] == "error":
+            delivery_filter.fail(key, HTTPException(status_code=400, detail=outcome["detail"]))
+        else:
+            delivery_filter.complete(key)
+        result = {**outcome, "index": index}
+        results[index] = result
+        events_created += bool(result.get("event_created"))
+    if errors:
+        # Items already committed are answered as duplicates when the batch is retried
+        raise HTTPException(status_code=500, detail=f"Error processing batch webhook: {str(errors[0])}")
     
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing webhook: {str(e)}")
+    # Duplicates of deliveries still in flight (possibly earlier items of this
+    # batch) are only acknowledged once those committed
+    for index, in_flight in waits:
+        try:
+            await asyncio.shield(in_flight)
+        except HTTPException as e:
+            if e.status_code != 400:
+                raise
+            results[index] = {**results[index], "status": "error", "detail": e.detail}
+    
+    return {
+        "status": "ok",
+        "received": len(items),
+        "events_created": events_created,
+        "results": results
+    }
 
 
 @router.post("/twilio/inbound")
 async def twilio_inbound_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Receive Twilio inbound SMS webhook
@@ -211,7 +239,9 @@ async def twilio_inbound_webhook(
         message_sid = form_data.get("MessageSid")
         
         # Find driver by phone number
-        driver = db.query(Driver).filter(Driver.phone == from_phone).first()
+        driver = (await db.execute(
+            select(Driver).where(Driver.phone == from_phone)
+        )).scalars().first()
         if not driver:
             return {
                 "status": "error",
@@ -219,18 +249,22 @@ async def twilio_inbound_webhook(
             }
         
         # Find most recent open event for this driver
-        event = db.query(Event).filter(
-            Event.driver_id == driver.id,
-            Event.end_time.is_(None)
-        ).order_by(Event.start_time.desc()).first()
+        event = (await db.execute(
+            select(Event)
+            .where(Event.driver_id == driver.id, Event.end_time.is_(None))
+            .order_by(Event.start_time.desc())
+            .limit(1)
+        )).scalars().first()
         
         # If no open event, find recent event (within last hour)
         if not event:
             one_hour_ago = datetime.utcnow() - timedelta(hours=1)
-            event = db.query(Event).filter(
-                Event.driver_id == driver.id,
-                Event.start_time >= one_hour_ago
-            ).order_by(Event.start_time.desc()).first()
+            event = (await db.execute(
+                select(Event)
+                .where(Event.driver_id == driver.id, Event.start_time >= one_hour_ago)
+                .order_by(Event.start_time.desc())
+                .limit(1)
+            )).scalars().first()
         
         # Create inbound message
         message = Message(
@@ -244,14 +278,26 @@ async def twilio_inbound_webhook(
             status="received"
         )
         db.add(message)
-        db.commit()
-        db.refresh(message)
+        rollups = RollupDeltas()
+        rollups.message(event.vehicle_id if event else None, driver.id, "inbound")
+        await add_rollups(db, rollups)
+        await db.commit()
+        await db.refresh(message)
+        event_detail_cache.invalidate(message.event_id)
+        live_feed.publish("inbound_message", {
+            "message_id": message.id,
+            "event_id": message.event_id,
+            "driver_id": driver.id,
+            "body": body,
+            "from_phone": from_phone,
+            "created_at": message.created_at
+        }, vehicle_id=event.vehicle_id if event else None, driver_id=driver.id)
         
         # Send Slack notification
         slack_message = f"📱 Driver {driver.name} ({driver.phone}) replied:\n{body}"
         if event:
             slack_message += f"\n\nEvent: Vehicle {event.vehicle_id} stopped at {event.latitude}, {event.longitude}"
-        send_slack_notification(slack_message)
+        dispatcher.submit("slack", send_slack_notification, slack_message)
         
         # Return TwiML response (optional)
         return {
@@ -260,14 +306,14 @@ async def twilio_inbound_webhook(
         }
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error processing Twilio webhook: {str(e)}")
 
 
 @router.post("/twilio/status")
 async def twilio_status_webhook(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Receive Twilio status callback webhook
@@ -288,7 +334,9 @@ async def twilio_status_webhook(
             return {"status": "error", "message": "MessageSid missing"}
         
         # Find message by Twilio SID
-        message = db.query(Message).filter(Message.twilio_sid == message_sid).first()
+        message = (await db.execute(
+            select(Message).where(Message.twilio_sid == message_sid)
+        )).scalars().first()
         
         if not message:
             print(f"Status update for unknown message SID: {message_sid}")
@@ -331,14 +379,17 @@ async def twilio_status_webhook(
         if error_code:
             print(f"Twilio error for message {message_sid}: {error_code} - {error_message}")
         
-        db.commit()
+        await db.commit()
+        event_detail_cache.invalidate(message.event_id)
+        if live_feed.subscribers:
+            await publish_message_status(db, message)
         
         print(f"Updated message {message_sid} status to: {new_status}")
         
         return {"status": "ok"}
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"Error processing Twilio status webhook: {e}")
         return {"status": "error", "message": str(e)}
 
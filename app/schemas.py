@@ -18,6 +18,7 @@ class SamsaraWebhookPayload(BaseModel):
     speed: float = Field(ge=0)  # Speed in km/h
     heading: Optional[float] = None
     metadata: Optional[dict] = None
+    deliveryId: Optional[str] = None  # Unique per delivery, reused on retries
 
 
 class TwilioInboundPayload(BaseModel):
@@ -52,8 +53,46 @@ class EventListResponse(BaseModel):
     """List of events response"""
     events: List[EventResponse]
     total: int
-    page: int
+    total_exact: bool = True  # False if total is a counter value or planner estimate
+    total_source: str = "count"  # 'count', 'counter' or 'estimate'
+    page: Optional[int]  # None when paging by cursor
     page_size: int
+    next_cursor: Optional[str] = None  # Opaque; pass as ?cursor= for the next (older) page
+    prev_cursor: Optional[str] = None  # Opaque; pass as ?cursor= for the previous (newer) page
+
+
+class GeoEventResponse(EventResponse):
+    """Event found by a spatial search"""
+    distance_km: Optional[float] = None  # From the search center (radius search only)
+
+
+class GeoSearchResponse(BaseModel):
+    """Spatial search results"""
+    events: List[GeoEventResponse]
+    candidates: int  # Events in the covering geohash cells
+    truncated: bool  # True if candidates hit GEO_MAX_CANDIDATES
+
+
+class StopHotspot(BaseModel):
+    """Stops clustered in one geohash cell"""
+    geohash: str
+    latitude: float  # Mean position of the cell's stops
+    longitude: float
+    stop_count: int
+    open_stops: int  # Still in progress, not in the dwell figures
+    vehicle_count: int
+    total_dwell_seconds: float
+    median_dwell_seconds: Optional[float]
+
+
+class HotspotListResponse(BaseModel):
+    """Stop hotspots in a time window"""
+    hotspots: List[StopHotspot]
+    clusters: int  # Cells with at least min_stops stops
+    stop_count: int  # Stops in those cells
+    precision: int
+    cached_days: int  # Days served from the per-day cache
+    queried_segments: int  # Days (or partial days) read from the database
 
 
 class MessageResponse(BaseModel):
@@ -78,6 +117,49 @@ class EventDetailResponse(EventResponse):
     messages: List[MessageResponse] = []
 
 
+# Stats schemas (read from the fleet rollups)
+class RollupMetrics(BaseModel):
+    """Stop and SMS totals"""
+    stops: int  # Stops started
+    closed_stops: int  # Of those, closed so far
+    total_dwell_seconds: float
+    avg_dwell_seconds: Optional[float]  # Over closed stops
+    outbound_messages: int
+    inbound_messages: int
+    reply_rate: Optional[float]  # inbound / outbound messages
+
+
+class RollupBucket(RollupMetrics):
+    """Totals of one hour or day"""
+    bucket_start: datetime
+
+
+class StatsSeriesResponse(BaseModel):
+    """Hourly or daily totals of a vehicle, a driver or the fleet"""
+    dimension: str  # 'vehicle', 'driver' or 'fleet'
+    key: str
+    granularity: str  # 'hour' or 'day'
+    start: datetime
+    end: datetime
+    totals: RollupMetrics
+    buckets: List[RollupBucket]  # Buckets without activity are omitted
+
+
+class StatsRankingItem(RollupMetrics):
+    """Totals of one vehicle or driver"""
+    key: str
+
+
+class StatsRankingResponse(BaseModel):
+    """Vehicles or drivers ranked by their totals over a window"""
+    dimension: str
+    granularity: str
+    start: datetime
+    end: datetime
+    items: List[StatsRankingItem]
+    total_keys: int  # Vehicles or drivers with activity in the window
+
+
 # Auth schemas
 class LoginRequest(BaseModel):
     """Login request"""
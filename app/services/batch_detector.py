@@ -0,0 +1,125 @@
+"""
+Vectorized stop/move detection for historical backfill
+
+Offline counterpart of the online path in app.services.batch_ingest: given
+one vehicle's pings as arrays it finds the same stop events, with NumPy run
+length logic instead of replaying pings through detect_event_transition one
+at a time.
+
+Equivalence with the online path (vehicle starting in "move"):
+- a stop run starts at a ping with speed < STOP_SPEED_THRESHOLD following a
+  moving ping (or at the first ping);
+- it becomes a stop event iff it lasted STOP_DURATION_SECONDS, i.e. the next
+  moving ping (or +inf if there is none, as the wall-clock timer would have
+  fired) is at least that long after the run's first ping;
+- the event takes the first stop ping's time, position, driver and metadata,
+  and its end_time is the timestamp of the moving ping ending the run.
+"""
+
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config import settings
+from app.services.geo import geohash_encode
+
+
+def _epoch_us(timestamps: Sequence[datetime]) -> np.ndarray:
+    # Naive timestamps are UTC, as in the online path
+    return np.fromiter(
+        (
+            int((ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).timestamp() * 1_000_000)
+            for ts in timestamps
+        ),
+        dtype=np.int64,
+        count=len(timestamps)
+    )
+
+
+def detect_stop_runs(
+    timestamps_us: np.ndarray,
+    speeds: np.ndarray,
+    stop_threshold: Optional[float] = None,
+    stop_duration_seconds: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find confirmed stops in one vehicle's pings
+
+    Args:
+        timestamps_us: Ping times as int64 microseconds, sorted ascending
+        speeds: Ping speeds in km/h, same length
+
+    Returns:
+        Tuple of (start_indexes, end_indexes): for every confirmed stop the
+        index of its first stop ping and of the moving ping ending it
+        (-1 while the stop is still open)
+    """
+    if stop_threshold is None:
+        stop_threshold = settings.STOP_SPEED_THRESHOLD
+    if stop_duration_seconds is None:
+        stop_duration_seconds = settings.STOP_DURATION_SECONDS
+
+    n = len(speeds)
+    if n == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    stopped = np.asarray(speeds) < stop_threshold
+    previous = np.concatenate(([False], stopped[:-1]))
+    starts = np.flatnonzero(stopped & ~previous)
+    moves = np.flatnonzero(~stopped)
+
+    # First moving ping after each run start (n if none)
+    next_move = np.searchsorted(moves, starts, side="right")
+    ends = np.where(next_move < len(moves), moves[np.minimum(next_move, len(moves) - 1)], n)
+
+    duration_us = np.int64(round(stop_duration_seconds * 1_000_000))
+    open_run = ends == n
+    held_us = timestamps_us[np.minimum(ends, n - 1)] - timestamps_us[starts]
+    confirmed = open_run | (held_us >= duration_us)
+
+    starts = starts[confirmed]
+    ends = ends[confirmed]
+    return starts, np.where(ends == n, -1, ends)
+
+
+def detect_stop_events(
+    vehicle_id: str,
+    timestamps: Sequence[datetime],
+    speeds: Sequence[float],
+    latitudes: Sequence[float],
+    longitudes: Sequence[float],
+    driver_ids: Optional[Sequence[Optional[int]]] = None,
+    metadata: Optional[Sequence[Optional[dict]]] = None,
+    stop_threshold: Optional[float] = None,
+    stop_duration_seconds: Optional[float] = None
+) -> List[dict]:
+    """
+    Stop event rows (Event column values) for one vehicle's pings
+
+    Pings need not be sorted; ties keep their input order, like the online
+    path.
+    """
+    if not len(timestamps):
+        return []
+    epoch_us = _epoch_us(timestamps)
+    order = np.argsort(epoch_us, kind="stable")
+    speeds = np.asarray(speeds, dtype=np.float64)[order]
+
+    starts, ends = detect_stop_runs(epoch_us[order], speeds, stop_threshold, stop_duration_seconds)
+
+    rows = []
+    for start, end in zip(order[starts].tolist(), ends.tolist()):
+        rows.append({
+            "vehicle_id": vehicle_id,
+            "driver_id": driver_ids[start] if driver_ids is not None else None,
+            "event_type": "stop",
+            "start_time": timestamps[start],
+            "end_time": timestamps[order[end]] if end >= 0 else None,
+            "latitude": latitudes[start],
+            "longitude": longitudes[start],
+            "geohash": geohash_encode(latitudes[start], longitudes[start]),
+            "event_metadata": metadata[start] if metadata is not None else None
+        })
+    return rows
@@ -0,0 +1,426 @@
+"""
+Batch ingestion of Samsara telemetry for many vehicles
+"""
+
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from app.database import upsert_insert
+from app.models import Driver, Event
+from app.schemas import SamsaraWebhookPayload
+from app.config import settings
+from app.services.dispatcher import dispatcher
+from app.services.event_cache import event_detail_cache
+from app.services.event_counts import add_event_counts
+from app.services.event_detector import detect_event_transition
+from app.services.geo import geohash_encode
+from app.services.idempotency import delivery_filter
+from app.services.live_feed import live_feed
+from app.services.notifications import send_stop_sms, stop_slack_message, stop_sms_body
+from app.services.outbox import add_to_outbox
+from app.services.pending_stops import PendingStopTimeout, pending_stops
+from app.services.rollups import RollupDeltas, add_rollups
+from app.services.slack import send_slack_notification
+from app.services.telemetry import telemetry_record, telemetry_writer
+from app.services.vehicle_state import vehicle_state_store
+
+
+async def ingest_telemetry_batch(
+    db: AsyncSession,
+    payloads: List[SamsaraWebhookPayload],
+    notify: Union[bool, Sequence[bool]] = False
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Run stop/move detection for a batch of telemetry payloads
+
+    Payloads are grouped per vehicle and replayed in timestamp order. With
+    STOP_DURATION_SECONDS set, a stop ping first opens a pending stop (see
+    app.services.pending_stops) and the stop event is only created once it
+    is confirmed. All new stop events and end_time updates are written with
+    bulk statements and committed in a single transaction.
+
+    Args:
+        db: Database session
+        payloads: Telemetry payloads, for any number of vehicles
+        notify: Also dispatch the Slack message and direct driver SMS for
+            each stop event created (the single-payload webhook behaviour);
+            a sequence decides per payload
+
+    Returns:
+        Tuple of (results, created_events):
+        - results: one result dict per payload, in input order
+        - created_events: events queue jobs for every stop event created,
+          already staged in the outbox
+    """
+    try:
+        return await _ingest(db, payloads, notify)
+    except BaseException:
+        # Rolled back, or cancelled with the commit's outcome unknown: reload
+        # these vehicles from the database instead of trusting the cache
+        vehicle_state_store.invalidate({payload.vehicleId for payload in payloads})
+        raise
+
+
+async def _ingest(
+    db: AsyncSession,
+    payloads: List[SamsaraWebhookPayload],
+    notify: Union[bool, Sequence[bool]]
+) -> Tuple[List[dict], List[dict]]:
+    results: List[Optional[dict]] = [None] * len(payloads)
+
+    # Resolve driver ids up front so a bad driverId only fails its own item
+    driver_ids = {}
+    for index, payload in enumerate(payloads):
+        if not payload.driverId:
+            continue
+        try:
+            driver_ids[index] = int(payload.driverId)
+        except ValueError:
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "vehicle_id": payload.vehicleId,
+                "detail": f"Invalid driverId: {payload.driverId}"
+            }
+
+    # Get or create all referenced drivers with one query and one insert
+    wanted_driver_ids = set(driver_ids.values())
+    drivers = {}
+    if wanted_driver_ids:
+        for driver_id, name, phone in (await db.execute(
+            select(Driver.id, Driver.name, Driver.phone).where(Driver.id.in_(wanted_driver_ids))
+        )).all():
+            drivers[driver_id] = (name, phone)
+        missing_ids = sorted(wanted_driver_ids - drivers.keys())
+        if missing_ids:
+            # Create driver if not exists (you may want to handle this differently);
+            # concurrent batches may race to create the same driver
+            await db.execute(
+                upsert_insert(db, Driver).on_conflict_do_nothing(index_elements=["id"]),
+                [{"id": driver_id, "name": f"Driver {driver_id}"} for driver_id in missing_ids]
+            )
+            for driver_id in missing_ids:
+                drivers[driver_id] = (f"Driver {driver_id}", None)
+
+    # Group valid payloads per vehicle, ordered by timestamp
+    by_vehicle = defaultdict(list)
+    for index, payload in enumerate(payloads):
+        if results[index] is None:
+            by_vehicle[payload.vehicleId].append(index)
+    for indexes in by_vehicle.values():
+        indexes.sort(key=lambda i: payloads[i].timestamp)
+
+    states = await vehicle_state_store.get_many(db, by_vehicle.keys())
+
+    # Items that are retried deliveries of stops already stored: (event id, end time)
+    duplicate_stops: Dict[int, Tuple[int, Optional[datetime]]] = {}
+
+    # Detection is re-run without them if the insert candidates turn out to exist
+    while True:
+        new_events: List[dict] = []
+        new_event_items: List[int] = []
+        # Items whose move_started closed a stop created earlier in this batch
+        closing_items = {}
+        end_time_updates = {}
+        # Final (state, open event id, open new_events index) per vehicle
+        final_states = {}
+
+        # Pending-stop changes per vehicle, applied to the engine after commit
+        pending_changes = defaultdict(list)
+
+        for vehicle_id, indexes in by_vehicle.items():
+            previous_state = states[vehicle_id].state
+            open_event_id = states[vehicle_id].open_event_id
+            # Open stop in this batch, as an index into new_events
+            open_new_event: Optional[int] = None
+            pending = pending_stops.get(vehicle_id)
+
+            for index in indexes:
+                payload = payloads[index]
+                is_timeout = isinstance(payload, PendingStopTimeout)
+                if index in duplicate_stops:
+                    # Its stop event exists: resolve the pending stop it confirms
+                    # and carry on from the stored stop
+                    if pending is not None:
+                        pending_changes[vehicle_id].append(("duplicate", pending))
+                        pending = None
+                    stored_event_id, stored_end_time = duplicate_stops[index]
+                    previous_state = "stop" if stored_end_time is None else "move"
+                    open_event_id = stored_event_id if stored_end_time is None else None
+                    open_new_event = None
+                    continue
+                if is_timeout and (pending is None or pending.seq != payload.pendingSeq):
+                    # The pending stop was already confirmed or dropped
+                    results[index] = {
+                        "index": index,
+                        "status": "ok",
+                        "vehicle_id": vehicle_id,
+                        "transition": None,
+                        "event_created": False,
+                        "event_id": None
+                    }
+                    continue
+
+                transition = detect_event_transition(
+                    current_speed=payload.speed,
+                    previous_state=previous_state,
+                    stop_threshold=settings.STOP_SPEED_THRESHOLD
+                )
+                closed_event_id = None
+                # Ping whose position and time open the stop event
+                stop_source = payload
+
+                if transition == "stop_started" and pending_stops.enabled:
+                    if pending is None:
+                        pending = pending_stops.new(payload, driver_ids.get(index))
+                        pending_changes[vehicle_id].append(("opened", pending))
+                        transition = "stop_pending"
+                    elif is_timeout or pending_stops.is_due(pending, payload.timestamp):
+                        pending_changes[vehicle_id].append(("confirmed", pending, is_timeout))
+                        stop_source = pending
+                        pending = None
+                    else:
+                        transition = None
+                elif transition is None and pending is not None and previous_state == "move":
+                    # Moved before the stop lasted STOP_DURATION_SECONDS
+                    pending_changes[vehicle_id].append(("cancelled", pending))
+                    pending = None
+                    transition = "stop_cancelled"
+
+                if transition == "stop_started":
+                    open_new_event = len(new_events)
+                    new_events.append({
+                        "vehicle_id": vehicle_id,
+                        "driver_id": stop_source.driver_id if stop_source is not payload else driver_ids.get(index),
+                        "event_type": "stop",
+                        "start_time": stop_source.timestamp,
+                        "latitude": stop_source.latitude,
+                        "longitude": stop_source.longitude,
+                        "geohash": geohash_encode(stop_source.latitude, stop_source.longitude),
+                        "event_metadata": stop_source.metadata
+                    })
+                    new_event_items.append(index)
+                    previous_state = "stop"
+
+                elif transition == "move_started":
+                    if open_new_event is not None:
+                        new_events[open_new_event]["end_time"] = payload.timestamp
+                        closing_items[open_new_event] = index
+                        open_new_event = None
+                    elif open_event_id is not None:
+                        end_time_updates[open_event_id] = payload.timestamp
+                        closed_event_id = open_event_id
+                        open_event_id = None
+                    previous_state = "move"
+
+                results[index] = {
+                    "index": index,
+                    "status": "ok",
+                    "vehicle_id": vehicle_id,
+                    "transition": transition,
+                    "event_created": transition == "stop_started",
+                    "event_id": closed_event_id
+                }
+
+            if indexes:
+                final_states[vehicle_id] = (previous_state, open_event_id, open_new_event)
+
+        duplicates = await _existing_stop_items(db, new_events, new_event_items)
+        if not duplicates:
+            break
+        delivery_filter.db_duplicates += len(duplicates)
+        duplicate_stops.update(duplicates)
+
+    for index in duplicate_stops:
+        results[index] = {
+            "index": index,
+            "status": "duplicate",
+            "vehicle_id": payloads[index].vehicleId,
+            "transition": None,
+            "event_created": False,
+            "event_id": None
+        }
+
+    # Every row gets the same keys so the insert can be executed as one batch
+    for row in new_events:
+        row.setdefault("end_time", None)
+
+    created_events = []
+    event_ids = []
+    if new_events:
+        event_ids = (await db.execute(
+            insert(Event).returning(Event.id, sort_by_parameter_order=True),
+            new_events
+        )).scalars().all()
+
+        for position, (event_id, row, index) in enumerate(zip(event_ids, new_events, new_event_items)):
+            results[index]["event_id"] = event_id
+            if position in closing_items:
+                results[closing_items[position]]["event_id"] = event_id
+            created_events.append({
+                "event_id": event_id,
+                "driver_id": row["driver_id"],
+                "vehicle_id": row["vehicle_id"],
+                "latitude": float(row["latitude"]),
+                "longitude": float(row["longitude"]),
+                "timestamp": row["start_time"].isoformat()
+            })
+
+        await add_event_counts(db, new_events)
+
+    # Stage the events queue jobs in the same transaction
+    await add_to_outbox(db, settings.SQS_EVENTS_QUEUE, created_events)
+
+    rollups = RollupDeltas()
+    for row in new_events:
+        rollups.stop(row["vehicle_id"], row["driver_id"], row["start_time"], row["end_time"])
+
+    if end_time_updates:
+        for event_id, vehicle_id, driver_id, start_time in (await db.execute(
+            select(Event.id, Event.vehicle_id, Event.driver_id, Event.start_time)
+            .where(Event.id.in_(end_time_updates))
+        )).all():
+            rollups.stop_closed(vehicle_id, driver_id, start_time, end_time_updates[event_id])
+        await db.execute(
+            update(Event),
+            [{"id": event_id, "end_time": end_time} for event_id, end_time in end_time_updates.items()]
+        )
+
+    await add_rollups(db, rollups)
+
+    await db.commit()
+    event_detail_cache.invalidate_many(end_time_updates)
+
+    # Keep the raw pings (not synthetic timeouts, failures or redeliveries)
+    telemetry_writer.add(
+        telemetry_record(payload, driver_ids.get(index))
+        for index, payload in enumerate(payloads)
+        if not isinstance(payload, PendingStopTimeout)
+        and results[index] is not None
+        and results[index]["status"] not in ("error", "duplicate")
+    )
+
+    # Write-through the committed states
+    for vehicle_id, (state, open_event_id, open_new_event) in final_states.items():
+        if open_new_event is not None:
+            open_event_id = event_ids[open_new_event]
+        vehicle_state_store.set(vehicle_id, state, open_event_id)
+
+    if live_feed.subscribers:
+        _publish_transitions(payloads, results, by_vehicle, driver_ids, created_events)
+
+    # Apply pending-stop changes now that they are durable
+    for vehicle_id, changes in pending_changes.items():
+        for change in changes:
+            if change[0] == "opened":
+                change[1].has_phone = bool(drivers.get(change[1].driver_id, (None, None))[1])
+                pending_stops.opened(change[1])
+            elif change[0] == "confirmed":
+                pending_stops.confirmed_stop(change[1], by_timer=change[2])
+            elif change[0] == "duplicate":
+                pending_stops.confirmed_duplicate(change[1])
+            else:
+                pending_stops.cancelled(change[1])
+
+    if notify:
+        for job, index in zip(created_events, new_event_items):
+            if notify is True or notify[index]:
+                dispatch_stop_notifications(job, *drivers.get(job["driver_id"], (None, None)))
+
+    return results, created_events
+
+
+def dispatch_stop_notifications(job: dict, driver_name: Optional[str], driver_phone: Optional[str]):
+    """
+    Record the Slack and direct SMS intents for a committed stop event
+
+    The dispatcher delivers them off the request path.
+    """
+    dispatcher.submit("slack", send_slack_notification, stop_slack_message(
+        job["vehicle_id"],
+        driver_name or "Unknown",
+        driver_phone or "N/A",
+        job["latitude"],
+        job["longitude"],
+        job["timestamp"]
+    ))
+
+    # Send SMS directly if driver has phone number (for testing/debugging)
+    # This bypasses SQS for immediate testing
+    if driver_phone:
+        dispatcher.submit(
+            "twilio", send_stop_sms, job["event_id"], job["driver_id"], driver_phone,
+            stop_sms_body(job["vehicle_id"], job["latitude"], job["longitude"], job["timestamp"]),
+            job["vehicle_id"]
+        )
+
+
+def _publish_transitions(payloads, results, by_vehicle, driver_ids, created_events):
+    """Publish committed stop_started/move_started transitions, in order per vehicle"""
+    jobs = {job["event_id"]: job for job in created_events}
+    for vehicle_id, indexes in by_vehicle.items():
+        for index in indexes:
+            transition = results[index]["transition"]
+            if transition == "stop_started":
+                job = jobs[results[index]["event_id"]]
+                live_feed.publish("stop_started", job, vehicle_id=vehicle_id, driver_id=job["driver_id"])
+            elif transition == "move_started":
+                payload = payloads[index]
+                live_feed.publish("move_started", {
+                    "event_id": results[index]["event_id"],  # The stop it closed, if any
+                    "vehicle_id": vehicle_id,
+                    "driver_id": driver_ids.get(index),
+                    "latitude": payload.latitude,
+                    "longitude": payload.longitude,
+                    "timestamp": payload.timestamp.isoformat()
+                }, vehicle_id=vehicle_id, driver_id=driver_ids.get(index))
+
+
+def _utc_naive(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+async def _existing_stop_items(
+    db: AsyncSession,
+    new_events: List[dict],
+    new_event_items: List[int]
+) -> Dict[int, Tuple[int, Optional[datetime]]]:
+    """
+    Find insert candidates whose stop event already exists
+
+    This only happens for retried deliveries the duplicate filter no longer
+    remembers; the unique (vehicle_id, event_type, start_time) index rejects
+    any that race past this check.
+
+    Returns:
+        (event id, end time) of the stored stop per candidate item
+    """
+    if not new_events:
+        return {}
+
+    rows = (await db.execute(
+        select(Event.vehicle_id, Event.start_time, Event.id, Event.end_time).where(
+            Event.event_type == "stop",
+            or_(*(
+                and_(Event.vehicle_id == row["vehicle_id"], Event.start_time == row["start_time"])
+                for row in new_events
+            ))
+        )
+    )).all()
+    if not rows:
+        return {}
+
+    existing = {
+        (vehicle_id, _utc_naive(start_time)): (event_id, end_time)
+        for vehicle_id, start_time, event_id, end_time in rows
+    }
+    return {
+        index: existing[(row["vehicle_id"], _utc_naive(row["start_time"]))]
+        for row, index in zip(new_events, new_event_items)
+        if (row["vehicle_id"], _utc_naive(row["start_time"])) in existing
+    }
@@ -0,0 +1,127 @@
+"""
+Side-effect dispatcher for notifications and queue writes
+
+Request handlers record an intent (destination + callable) and return; a
+bounded pool of worker tasks delivers them in the background so third-party
+latency never reaches the request path.
+"""
+
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from app.config import settings
+
+
+class Dispatcher:
+    """
+    Bounded intent queue drained by a fixed number of workers
+
+    Blocking callables run in a dedicated thread pool; coroutine functions are
+    awaited directly. Each destination (e.g. "slack", "twilio", "sqs") has its
+    own concurrency limit so one slow API cannot occupy every worker slot.
+    """
+
+    def __init__(self, queue_size: int, workers: int, limits: Dict[str, int], default_limit: int = 1):
+        self.queue_size = queue_size
+        self.workers = workers
+        self.limits = limits
+        self.default_limit = default_limit
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks = []
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_wait_seconds = 0.0
+
+    def submit(self, destination: str, func: Callable, *args, **kwargs) -> bool:
+        """
+        Record an intent to call func(*args, **kwargs) for a destination
+
+        Never blocks. Returns False (and drops the intent) if the queue is full.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        try:
+            self._queue.put_nowait((destination, func, args, kwargs, time.monotonic()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Warning: dispatch queue full, dropping {destination} intent")
+            return False
+        self.submitted += 1
+        return True
+
+    async def start(self):
+        """Start the worker tasks"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="dispatch")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"Dispatcher started with {self.workers} workers")
+
+    async def stop(self, timeout: float = 10.0):
+        """Drain pending intents (up to timeout seconds) and stop the workers"""
+        if self._queue is not None and self._tasks:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                print(f"Warning: dispatcher stopped with {self._queue.qsize()} undelivered intents")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        """Queue depth and delivery counters"""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_size": self.queue_size,
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "max_wait_seconds": round(self.max_wait_seconds, 3)
+        }
+
+    def _semaphore(self, destination: str) -> asyncio.Semaphore:
+        if destination not in self._semaphores:
+            self._semaphores[destination] = asyncio.Semaphore(self.limits.get(destination, self.default_limit))
+        return self._semaphores[destination]
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            destination, func, args, kwargs, queued_at = await self._queue.get()
+            try:
+                async with self._semaphore(destination):
+                    self.max_wait_seconds = max(self.max_wait_seconds, time.monotonic() - queued_at)
+                    if inspect.iscoroutinefunction(func):
+                        await func(*args, **kwargs)
+                    else:
+                        await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+                self.delivered += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error delivering {destination} intent: {e}")
+            finally:
+                self._queue.task_done()
+
+
+dispatcher = Dispatcher(
+    queue_size=settings.DISPATCH_QUEUE_SIZE,
+    workers=settings.DISPATCH_WORKERS,
+    limits={
+        "slack": settings.DISPATCH_SLACK_CONCURRENCY,
+        "twilio": settings.DISPATCH_TWILIO_CONCURRENCY,
+        "sqs": settings.DISPATCH_SQS_CONCURRENCY
+    }
+)
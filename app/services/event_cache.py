@@ -0,0 +1,109 @@
+"""
+Response cache for GET /events/{id}
+
+The dashboard polls event detail pages heavily, so serialized responses are
+kept in a bounded LRU with a TTL. Entries are invalidated after commit
+wherever an event's messages or end_time change (inbound replies, Twilio
+status callbacks, outbound SMS records, closing a stop).
+
+Each process has its own cache; the TTL bounds how stale another process's
+copy can get.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from app.config import settings
+
+
+class EventDetailCache:
+    """Bounded LRU of serialized event detail responses with a TTL"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # Invalidation sequence per recently invalidated event, so a response
+        # read before an invalidation is not cached after it
+        self._invalidated: "OrderedDict[int, int]" = OrderedDict()
+        self._invalidated_floor = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    def get(self, event_id: int) -> Optional[bytes]:
+        """Cached response body, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(event_id)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[event_id]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def token(self) -> int:
+        """Take before reading from the database; pass to put"""
+        with self._lock:
+            return self._seq
+
+    def put(self, event_id: int, body: bytes, token: int):
+        """Cache a response read after `token` was taken, unless invalidated since"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if self._invalidated.get(event_id, self._invalidated_floor) > token:
+                self.rejected += 1
+                return
+            self._entries[event_id] = (body, time.monotonic())
+            self._entries.move_to_end(event_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, event_id: Optional[int]):
+        """Drop an event's response (call after the change committed)"""
+        if event_id is not None:
+            self.invalidate_many([event_id])
+
+    def invalidate_many(self, event_ids: Iterable[int]):
+        """Drop several events' responses"""
+        with self._lock:
+            for event_id in event_ids:
+                self._seq += 1
+                self.invalidations += 1
+                self._entries.pop(event_id, None)
+                self._invalidated[event_id] = self._seq
+                self._invalidated.move_to_end(event_id)
+            while len(self._invalidated) > max(self.max_size, 1):
+                _, seq = self._invalidated.popitem(last=False)
+                self._invalidated_floor = max(self._invalidated_floor, seq)
+
+    def stats(self) -> dict:
+        """Cache size and hit ratio"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_puts_rejected": self.rejected
+        }
+
+
+event_detail_cache = EventDetailCache(settings.EVENT_CACHE_SIZE, settings.EVENT_CACHE_TTL_SECONDS)
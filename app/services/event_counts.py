@@ -0,0 +1,125 @@
+"""
+Cheap totals for the events listing
+
+An exact COUNT(*) over the filtered events costs more than fetching a page,
+so GET /events only counts when asked to. Otherwise the total comes from
+- counters kept per filter key ('all', 'vehicle:<id>', 'driver:<id>',
+  'type:<type>'), incremented in the transaction that inserts the events,
+  when at most one filter is applied, or
+- the PostgreSQL planner's row estimate for other filter combinations.
+
+Counter rows are split over EVENT_COUNT_SHARDS shards so concurrent ingest
+batches rarely wait on the same row lock. Counters are only trusted once
+rebuild_event_counts has seeded them from the events table (scripts/migrate.py
+does this); until then totals fall back to an exact count.
+"""
+
+import json
+import random
+from collections import Counter
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import upsert_insert
+from app.models import Event, EventCount
+
+SEEDED_KEY = "_seeded"
+
+
+def filter_key(vehicle_id: Optional[str] = None, driver_id: Optional[int] = None,
+               event_type: Optional[str] = None) -> Optional[str]:
+    """Counter key for a listing filter, or None if more than one filter is set"""
+    keys = []
+    if vehicle_id:
+        keys.append(f"vehicle:{vehicle_id}")
+    if driver_id:
+        keys.append(f"driver:{driver_id}")
+    if event_type:
+        keys.append(f"type:{event_type}")
+    if len(keys) > 1:
+        return None
+    return keys[0] if keys else "all"
+
+
+def _event_keys(vehicle_id, driver_id, event_type) -> list:
+    keys = ["all"]
+    if vehicle_id:
+        keys.append(f"vehicle:{vehicle_id}")
+    if driver_id:
+        keys.append(f"driver:{driver_id}")
+    if event_type:
+        keys.append(f"type:{event_type}")
+    return keys
+
+
+async def add_event_counts(db: AsyncSession, events: Iterable[dict]):
+    """
+    Count newly inserted events in the current transaction (does not commit)
+
+    Args:
+        events: Event column values (vehicle_id, driver_id, event_type)
+    """
+    deltas = Counter()
+    for event in events:
+        deltas.update(_event_keys(event.get("vehicle_id"), event.get("driver_id"), event.get("event_type")))
+    if not deltas:
+        return
+
+    shard = random.randrange(settings.EVENT_COUNT_SHARDS)
+    statement = upsert_insert(db, EventCount)
+    # Sorted keys keep the row lock order consistent across transactions
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["filter_key", "shard"],
+            set_={"count": EventCount.count + statement.excluded["count"]}
+        ),
+        [{"filter_key": key, "shard": shard, "count": deltas[key]} for key in sorted(deltas)]
+    )
+
+
+async def get_event_count(db: AsyncSession, key: str) -> Optional[int]:
+    """Counter total for a filter key, or None if the counters were never seeded"""
+    rows = (await db.execute(
+        select(EventCount.filter_key, func.sum(EventCount.count))
+        .where(EventCount.filter_key.in_([key, SEEDED_KEY]))
+        .group_by(EventCount.filter_key)
+    )).all()
+    totals = dict(rows)
+    if SEEDED_KEY not in totals:
+        return None
+    return int(totals.get(key) or 0)
+
+
+async def estimate_event_count(db: AsyncSession, query) -> Optional[int]:
+    """Planner row estimate for a SELECT, or None where unavailable (SQLite)"""
+    dialect = db.get_bind().dialect
+    if dialect.name != "postgresql":
+        return None
+    compiled = query.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+    plan = (await db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"))).scalar_one()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def rebuild_event_counts(connection):
+    """
+    Recompute all counters from the events table and mark them seeded
+
+    Takes a synchronous connection (use AsyncConnection.run_sync from async
+    code). Run after events are deleted or rewritten outside the ingest path.
+    """
+    connection.execute(delete(EventCount))
+    rows = [
+        {"filter_key": "all", "shard": 0, "count": connection.execute(select(func.count(Event.id))).scalar_one()},
+        {"filter_key": SEEDED_KEY, "shard": 0, "count": 0}
+    ]
+    for prefix, column in (("vehicle", Event.vehicle_id), ("driver", Event.driver_id), ("type", Event.event_type)):
+        for value, count in connection.execute(
+            select(column, func.count(Event.id)).where(column.is_not(None)).group_by(column)
+        ):
+            rows.append({"filter_key": f"{prefix}:{value}", "shard": 0, "count": count})
+    connection.execute(insert(EventCount), rows)
@@ -2,9 +2,9 @@
 Event detection logic for stop/move transitions
 """
 
-from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterable, Optional, Tuple
 
 from app.models import Event
 from app.config import settings
@@ -36,30 +36,40 @@ def detect_event_transition(
     return None
 
 
-def create_or_update_event(
-    db: Session,
-    vehicle_id: str,
-    driver_id: Optional[int],
-    event_type: str,
-    latitude: float,
-    longitude: float,
-    timestamp: datetime,
-    metadata: Optional[dict] = None
-) -> Event:
+async def get_vehicle_states(
+    db: AsyncSession,
+    vehicle_ids: Iterable[str]
+) -> Dict[str, Tuple[str, Optional[Event]]]:
     """
-    Create a new event in the database
+    Load the current state of many vehicles with a single query
+    
+    Uses a window over each vehicle's events to pick its most recent one,
+    instead of one ORDER BY ... LIMIT 1 query per vehicle.
+    
+    Returns:
+        Mapping of vehicle_id to (previous_state, open_stop_event).
+        Vehicles without events default to ("move", None).
     """
-    event = Event(
-        vehicle_id=vehicle_id,
-        driver_id=driver_id,
-        event_type=event_type,
-        start_time=timestamp,
-        latitude=latitude,
-        longitude=longitude,
-        event_metadata=metadata
-    )
-    db.add(event)
-    db.commit()
-    db.refresh(event)
-    return event
-
+    vehicle_ids = list(set(vehicle_ids))
+    states = {vehicle_id: ("move", None) for vehicle_id in vehicle_ids}
+    if not vehicle_ids:
+        return states
+    
+    ranked = select(
+        Event.id.label("id"),
+        func.row_number().over(
+            partition_by=Event.vehicle_id,
+            order_by=Event.start_time.desc()
+        ).label("rn")
+    ).where(Event.vehicle_id.in_(vehicle_ids)).subquery()
+    
+    latest_events = (await db.execute(
+        select(Event).join(ranked, Event.id == ranked.c.id).where(ranked.c.rn == 1)
+    )).scalars().all()
+    
+    for event in latest_events:
+        # If last event was a stop and hasn't ended, we're still stopped
+        if event.event_type == "stop" and event.end_time is None:
+            states[event.vehicle_id] = ("stop", event)
+    
+    return states
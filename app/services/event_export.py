@@ -0,0 +1,112 @@
+"""
+Streaming export of events (and optionally their messages)
+
+Rows are read with a server-side cursor (yield_per) and written out chunk by
+chunk, so memory stays flat however large the exported range is.
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.database import AsyncSessionLocal
+from app.models import Event
+from app.schemas import EventResponse, MessageResponse
+
+EXPORT_CHUNK_ROWS = 1000
+
+EVENT_FIELDS = list(EventResponse.model_fields)
+MESSAGE_FIELDS = [f"message_{name}" for name in MessageResponse.model_fields]
+
+
+def export_query(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    vehicle_id: Optional[str] = None,
+    driver_id: Optional[int] = None,
+    event_type: Optional[str] = None,
+    include_messages: bool = False
+):
+    """Events with start_time in [start, end) matching the filters, oldest first"""
+    query = select(Event)
+    if start:
+        query = query.where(Event.start_time >= start)
+    if end:
+        query = query.where(Event.start_time < end)
+    if vehicle_id:
+        query = query.where(Event.vehicle_id == vehicle_id)
+    if driver_id:
+        query = query.where(Event.driver_id == driver_id)
+    if event_type:
+        query = query.where(Event.event_type == event_type)
+    if include_messages:
+        # Loaded with one IN query per chunk of events
+        query = query.options(selectinload(Event.messages))
+    return query.order_by(Event.start_time, Event.id).execution_options(yield_per=EXPORT_CHUNK_ROWS)
+
+
+async def stream_export(query, fmt: str, include_messages: bool) -> AsyncIterator[bytes]:
+    """
+    Encoded export, one chunk of rows at a time
+
+    Opens its own session: the response body is produced after the request
+    handler (and its session dependency) has returned.
+
+    Args:
+        fmt: 'ndjson' or 'csv' (one row per message when include_messages)
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(EVENT_FIELDS + (MESSAGE_FIELDS if include_messages else []))
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        async for events in result.scalars().partitions():
+            for event in events:
+                row = EventResponse.model_validate(event).model_dump(mode="json")
+                messages = (
+                    [MessageResponse.model_validate(m).model_dump(mode="json") for m in event.messages]
+                    if include_messages else None
+                )
+                if fmt == "ndjson":
+                    if messages is not None:
+                        row["messages"] = messages
+                    buffer.write(json.dumps(row))
+                    buffer.write("\n")
+                    continue
+
+                values = [
+                    json.dumps(row[name]) if isinstance(row[name], dict) else row[name]
+                    for name in EVENT_FIELDS
+                ]
+                if messages is None:
+                    writer.writerow(values)
+                else:
+                    for message in messages or [None]:
+                        writer.writerow(values + [
+                            message[name] if message else None for name in MessageResponse.model_fields
+                        ])
+
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Gzip a byte stream incrementally"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
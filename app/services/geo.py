@@ -0,0 +1,95 @@
+"""
+Geohash helpers for spatial event search without PostGIS
+
+Events store the geohash of their position (computed at insert time), so a
+radius or bounding-box search becomes a few indexed prefix scans over the
+geohash cells covering the area. Candidates are then refined with an exact,
+vectorized haversine distance / bounds check.
+"""
+
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = None) -> str:
+    """Geohash of a position"""
+    precision = precision or settings.GEOHASH_PRECISION
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coordinate >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size_degrees(precision: int) -> Tuple[float, float]:
+    """(latitude, longitude) extent in degrees of a geohash cell"""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def bbox_around(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a circle"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    dlon = min(radius_km / (KM_PER_DEGREE_LAT * cos_lat), 180.0)
+    return (
+        max(latitude - dlat, -90.0), max(longitude - dlon, -180.0),
+        min(latitude + dlat, 90.0), min(longitude + dlon, 180.0)
+    )
+
+
+def cover_bbox(min_lat: float, min_lon: float, max_lat: float, max_lon: float,
+               max_cells: int = None) -> List[str]:
+    """
+    Geohash prefixes whose cells cover a bounding box
+
+    Uses the finest precision needing at most max_cells cells.
+    """
+    max_cells = max_cells or settings.GEO_MAX_COVER_CELLS
+    for precision in range(settings.GEOHASH_PRECISION, 0, -1):
+        dlat, dlon = cell_size_degrees(precision)
+        lat_cells = range(int((min_lat + 90) // dlat), int(min(max_lat + 90, 180 - 1e-9) // dlat) + 1)
+        lon_cells = range(int((min_lon + 180) // dlon), int(min(max_lon + 180, 360 - 1e-9) // dlon) + 1)
+        if len(lat_cells) * len(lon_cells) <= max_cells or precision == 1:
+            return sorted({
+                geohash_encode((i + 0.5) * dlat - 90, (j + 0.5) * dlon - 180, precision)
+                for i in lat_cells for j in lon_cells
+            })
+    return []
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km from one point to arrays of points"""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
@@ -0,0 +1,263 @@
+"""
+Stop hotspots: stop events clustered by geohash cell
+
+Per-cell aggregates (stop count, dwell times, vehicles) are built per UTC
+day and cached in process, so a query over a long window only reads the
+days that are not cached yet (and the partial days at its edges). Cached
+days keep exact dwell times, so medians across days stay exact.
+
+Stops can still close (or arrive late) for recent days, so days ending
+within HOTSPOT_SETTLE_SECONDS get the short HOTSPOT_RECENT_TTL_SECONDS.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.models import Event
+
+DAY = timedelta(days=1)
+
+
+class CellStats:
+    """Aggregates of the stops in one geohash cell"""
+
+    __slots__ = ("stop_count", "open_stops", "latitude_sum", "longitude_sum", "dwell_seconds", "vehicles")
+
+    def __init__(self, stop_count: int, open_stops: int, latitude_sum: float, longitude_sum: float,
+                 dwell_seconds: np.ndarray, vehicles: frozenset):
+        self.stop_count = stop_count
+        self.open_stops = open_stops
+        self.latitude_sum = latitude_sum
+        self.longitude_sum = longitude_sum
+        self.dwell_seconds = dwell_seconds  # Of closed stops
+        self.vehicles = vehicles
+
+    @classmethod
+    def merge(cls, parts: List["CellStats"]) -> "CellStats":
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            sum(p.stop_count for p in parts),
+            sum(p.open_stops for p in parts),
+            sum(p.latitude_sum for p in parts),
+            sum(p.longitude_sum for p in parts),
+            np.concatenate([p.dwell_seconds for p in parts]),
+            frozenset().union(*(p.vehicles for p in parts))
+        )
+
+    def summary(self, cell: str) -> dict:
+        return {
+            "geohash": cell,
+            "latitude": round(self.latitude_sum / self.stop_count, 6),
+            "longitude": round(self.longitude_sum / self.stop_count, 6),
+            "stop_count": self.stop_count,
+            "open_stops": self.open_stops,
+            "vehicle_count": len(self.vehicles),
+            "total_dwell_seconds": float(self.dwell_seconds.sum()),
+            "median_dwell_seconds": float(np.median(self.dwell_seconds)) if len(self.dwell_seconds) else None
+        }
+
+
+def _utc(ts: datetime) -> datetime:
+    # Naive timestamps are UTC, as stored
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def aggregate_stops(rows: List[tuple]) -> Dict[str, CellStats]:
+    """
+    Per-cell aggregates of stop rows
+
+    Args:
+        rows: (cell, vehicle_id, start_time, end_time, latitude, longitude)
+    """
+    if not rows:
+        return {}
+    cells, cell_index = np.unique(np.array([row[0] for row in rows]), return_inverse=True)
+    dwell = np.array([
+        (_utc(row[3]) - _utc(row[2])).total_seconds() if row[3] is not None else np.nan
+        for row in rows
+    ])
+    latitude_sums = np.bincount(cell_index, weights=[float(row[4]) for row in rows], minlength=len(cells))
+    longitude_sums = np.bincount(cell_index, weights=[float(row[5]) for row in rows], minlength=len(cells))
+
+    # Rows grouped by cell, closed stops by ascending dwell, open ones last
+    order = np.lexsort((dwell, cell_index))
+    bounds = np.searchsorted(cell_index[order], np.arange(len(cells) + 1))
+    stats = {}
+    for i, cell in enumerate(cells.tolist()):
+        members = order[bounds[i]:bounds[i + 1]]
+        cell_dwell = dwell[members]
+        closed = cell_dwell[~np.isnan(cell_dwell)]
+        stats[cell] = CellStats(
+            len(members),
+            len(members) - len(closed),
+            float(latitude_sums[i]),
+            float(longitude_sums[i]),
+            closed,
+            frozenset(rows[j][1] for j in members.tolist())
+        )
+    return stats
+
+
+def merge_cells(buckets: Iterable[Dict[str, CellStats]]) -> Dict[str, CellStats]:
+    """Combine per-cell aggregates of several time buckets"""
+    parts: Dict[str, List[CellStats]] = {}
+    for bucket in buckets:
+        for cell, stats in bucket.items():
+            parts.setdefault(cell, []).append(stats)
+    return {cell: CellStats.merge(cell_parts) for cell, cell_parts in parts.items()}
+
+
+class HotspotCache:
+    """Bounded LRU of per-day cell aggregates with per-entry TTLs"""
+
+    def __init__(self, max_days: int):
+        self.max_days = max_days
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[Dict[str, CellStats]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, cells: Dict[str, CellStats], ttl_seconds: float):
+        if self.max_days <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (cells, time.monotonic() + ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_days:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "days": len(self._entries),
+            "max_days": self.max_days,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions
+        }
+
+
+hotspot_cache = HotspotCache(settings.HOTSPOT_CACHE_DAYS)
+
+
+def _segments(start: datetime, end: datetime) -> List[Tuple[datetime, datetime, bool]]:
+    """[start, end) split at UTC midnights: (lo, hi, is_whole_day)"""
+    segments = []
+    day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    while day < end:
+        lo, hi = max(start, day), min(end, day + DAY)
+        segments.append((lo, hi, lo == day and hi == day + DAY))
+        day += DAY
+    return segments
+
+
+async def _query_stops(
+    db: AsyncSession,
+    lo: datetime,
+    hi: datetime,
+    precision: int,
+    vehicle_id: Optional[str],
+    driver_id: Optional[int]
+) -> List[tuple]:
+    query = select(
+        func.substr(Event.geohash, 1, precision),
+        Event.vehicle_id,
+        Event.start_time,
+        Event.end_time,
+        Event.latitude,
+        Event.longitude
+    ).where(
+        Event.event_type == "stop",
+        Event.start_time >= lo,
+        Event.start_time < hi,
+        Event.geohash.isnot(None)
+    )
+    if vehicle_id:
+        query = query.where(Event.vehicle_id == vehicle_id)
+    if driver_id:
+        query = query.where(Event.driver_id == driver_id)
+    return [tuple(row) for row in (await db.execute(query)).all()]
+
+
+async def stop_hotspots(
+    db: AsyncSession,
+    start: datetime,
+    end: datetime,
+    precision: int,
+    vehicle_id: Optional[str] = None,
+    driver_id: Optional[int] = None
+) -> Tuple[Dict[str, CellStats], int, int]:
+    """
+    Per-cell aggregates of stops starting in [start, end)
+
+    Uncached segments are read with one query per contiguous run.
+
+    Returns:
+        Tuple of (cells, cached_days, queried_segments)
+    """
+    start, end = _utc(start), _utc(end)
+    now = datetime.now(timezone.utc)
+    buckets = []
+    cached = 0
+    missing = []
+    for lo, hi, whole_day in _segments(start, end):
+        key = (lo.date(), precision, vehicle_id, driver_id)
+        cells = hotspot_cache.get(key) if whole_day else None
+        if cells is None:
+            missing.append((lo, hi, whole_day, key))
+        else:
+            buckets.append(cells)
+            cached += 1
+
+    # Group missing segments into contiguous runs
+    runs = []
+    for segment in missing:
+        if runs and runs[-1][-1][1] == segment[0]:
+            runs[-1].append(segment)
+        else:
+            runs.append([segment])
+
+    for run in runs:
+        rows = await _query_stops(db, run[0][0], run[-1][1], precision, vehicle_id, driver_id)
+        by_day: Dict[object, List[tuple]] = {}
+        for row in rows:
+            by_day.setdefault(_utc(row[2]).date(), []).append(row)
+        for lo, hi, whole_day, key in run:
+            cells = aggregate_stops(by_day.get(lo.date(), []))
+            if whole_day:
+                settled = hi <= now - timedelta(seconds=settings.HOTSPOT_SETTLE_SECONDS)
+                hotspot_cache.put(
+                    key, cells,
+                    settings.HOTSPOT_CACHE_TTL_SECONDS if settled else settings.HOTSPOT_RECENT_TTL_SECONDS
+                )
+            buckets.append(cells)
+
+    return merge_cells(buckets), cached, len(missing)
@@ -0,0 +1,115 @@
+"""
+Duplicate-delivery filter for webhook ingestion
+
+Samsara retries webhooks on timeouts. Recently processed delivery keys are
+kept in a bounded, time-windowed LRU so retries are answered without touching
+the database, and retries of a delivery still being processed wait for its
+outcome; the unique (vehicle_id, event_type, start_time) index on events is
+the backstop once a key has aged out or the process restarted.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+from app.config import settings
+from app.schemas import SamsaraWebhookPayload
+
+
+def delivery_key(payload: SamsaraWebhookPayload) -> str:
+    """Idempotency key: the delivery id if sent, else (vehicleId, timestamp)"""
+    if payload.deliveryId:
+        return f"delivery:{payload.deliveryId}"
+    return f"ping:{payload.vehicleId}|{payload.timestamp.isoformat()}"
+
+
+class RecentKeyFilter:
+    """
+    Bounded LRU of keys processed within the last ttl_seconds
+
+    A key is claimed before processing and only remembered once processing
+    succeeded. A retry arriving while the original is still in flight waits
+    for the original's outcome instead of being acknowledged up front, so a
+    ping is never answered as a duplicate of a delivery that then failed.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._keys: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.in_flight_waits = 0
+        self.db_duplicates = 0
+
+    def claim(self, key: Hashable) -> Tuple[bool, Optional[asyncio.Future]]:
+        """
+        Claim a key for processing
+
+        Returns:
+            Tuple of (duplicate, in_flight):
+            - (True, None): the key was processed within the TTL
+            - (True, future): the original is still being processed; the
+              future resolves when it succeeds, or raises its error
+            - (False, None): the caller owns the key and must call
+              `complete` or `fail`
+        """
+        now = time.monotonic()
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.hits += 1
+                self.in_flight_waits += 1
+                return True, in_flight
+            seen_at = self._keys.get(key)
+            if seen_at is not None and now - seen_at < self.ttl_seconds:
+                self._keys.move_to_end(key)
+                self.hits += 1
+                return True, None
+            self.misses += 1
+            self._in_flight[key] = asyncio.get_running_loop().create_future()
+            return False, None
+
+    def complete(self, key: Hashable):
+        """Remember a claimed key whose processing committed and release its waiters"""
+        now = time.monotonic()
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+            if self.max_size > 0:
+                self._keys[key] = now
+                self._keys.move_to_end(key)
+                while len(self._keys) > self.max_size:
+                    self._keys.popitem(last=False)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def fail(self, key: Hashable, error: BaseException):
+        """Forget a claimed key whose processing failed; its waiters get `error`"""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+            # Nobody may be waiting: mark the exception as retrieved
+            future.exception()
+
+    def stats(self) -> dict:
+        """Filter size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._keys),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "in_flight": len(self._in_flight),
+            "in_flight_waits": self.in_flight_waits,
+            "db_duplicates": self.db_duplicates
+        }
+
+
+delivery_filter = RecentKeyFilter(settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_TTL_SECONDS)
@@ -0,0 +1,224 @@
+"""
+Vehicle-sharded ingest pipeline for Samsara telemetry
+
+Stop/move detection must run in order per vehicle but is independent across
+vehicles. Each vehicleId is hashed onto one of N partitions; a partition has
+a bounded queue and a single consumer, so a vehicle's pings are processed in
+arrival order while different partitions proceed concurrently. Consumers
+drain whatever is queued (up to a batch size) and write it in one
+transaction. If that transaction fails, the batch is written again one
+vehicle at a time so only the failing vehicle's pings fail.
+"""
+
+import asyncio
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.schemas import SamsaraWebhookPayload
+from app.services.batch_ingest import ingest_telemetry_batch
+
+
+class PipelineSaturated(Exception):
+    """Raised when a payload's partition queue is full"""
+
+
+class _Partition:
+    """Bounded queue and counters for one partition"""
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failed_batches = 0
+        self.split_batches = 0
+        self.failed_vehicles = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+
+class IngestPipeline:
+    """Partitioned, batching consumer pool for telemetry payloads"""
+
+    def __init__(self, partitions: int, queue_size: int, batch_size: int):
+        self.batch_size = batch_size
+        self._partitions = [_Partition(queue_size) for _ in range(partitions)]
+        self._tasks: List[asyncio.Task] = []
+
+    def partition_for(self, vehicle_id: str) -> int:
+        """Stable partition index for a vehicle"""
+        return zlib.crc32(vehicle_id.encode("utf-8")) % len(self._partitions)
+
+    def submit(self, payload: SamsaraWebhookPayload, notify: bool = True) -> asyncio.Future:
+        """
+        Queue a payload on its vehicle's partition
+
+        Args:
+            payload: Telemetry payload (or pending-stop timeout)
+            notify: Dispatch Slack and direct SMS for a stop event it creates
+
+        Returns:
+            Future resolved with the payload's ingest result dict
+
+        Raises:
+            PipelineSaturated: if the partition queue is full
+        """
+        partition = self._partitions[self.partition_for(payload.vehicleId)]
+        future = asyncio.get_running_loop().create_future()
+        try:
+            partition.queue.put_nowait((payload, future, time.monotonic(), notify))
+        except asyncio.QueueFull:
+            partition.rejected += 1
+            raise PipelineSaturated(f"Partition {self.partition_for(payload.vehicleId)} is full")
+        return future
+
+    def submit_many(self, payloads: List[SamsaraWebhookPayload], notify: bool = True) -> List[asyncio.Future]:
+        """
+        Queue several payloads, all or none
+
+        Payloads are queued in timestamp order, so each vehicle's pings reach
+        its partition consumer in order.
+
+        Returns:
+            One future per payload, in input order
+
+        Raises:
+            PipelineSaturated: if any partition lacks room for its payloads
+                (nothing is queued)
+        """
+        needed: Dict[int, int] = {}
+        for payload in payloads:
+            index = self.partition_for(payload.vehicleId)
+            needed[index] = needed.get(index, 0) + 1
+        for index, count in needed.items():
+            queue = self._partitions[index].queue
+            if queue.maxsize and queue.maxsize - queue.qsize() < count:
+                self._partitions[index].rejected += count
+                raise PipelineSaturated(f"Partition {index} has no room for {count} payloads")
+
+        futures: List[Optional[asyncio.Future]] = [None] * len(payloads)
+        for position in sorted(range(len(payloads)), key=lambda i: payloads[i].timestamp):
+            futures[position] = self.submit(payloads[position], notify)
+        return futures
+
+    async def start(self):
+        """Start one consumer task per partition"""
+        self._tasks = [
+            asyncio.create_task(self._consume(partition))
+            for partition in self._partitions
+        ]
+        print(f"Ingest pipeline started with {len(self._partitions)} partitions")
+
+    async def stop(self, timeout: float = 10.0):
+        """Finish queued payloads (up to timeout seconds) and stop the consumers"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(partition.queue.join() for partition in self._partitions)),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            print("Warning: ingest pipeline stopped with payloads still queued")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def saturated(self) -> bool:
+        """True if any partition queue is full"""
+        return any(partition.queue.full() for partition in self._partitions)
+
+    def stats(self) -> dict:
+        """Queue depth, throughput and lag per partition"""
+        partitions = []
+        for index, partition in enumerate(self._partitions):
+            partitions.append({
+                "partition": index,
+                "queue_depth": partition.queue.qsize(),
+                "processed": partition.processed,
+                "batches": partition.batches,
+                "avg_batch_size": round(partition.processed / partition.batches, 2) if partition.batches else None,
+                "rejected": partition.rejected,
+                "failed_batches": partition.failed_batches,
+                "split_batches": partition.split_batches,
+                "failed_vehicles": partition.failed_vehicles,
+                "last_lag_seconds": round(partition.last_lag_seconds, 4),
+                "max_lag_seconds": round(partition.max_lag_seconds, 4)
+            })
+        return {
+            "partitions": len(self._partitions),
+            "queue_size": self._partitions[0].queue.maxsize if self._partitions else 0,
+            "batch_size": self.batch_size,
+            "queue_depth": sum(p["queue_depth"] for p in partitions),
+            "max_lag_seconds": max((p["max_lag_seconds"] for p in partitions), default=0.0),
+            "rejected": sum(p["rejected"] for p in partitions),
+            "per_partition": partitions
+        }
+
+    async def _consume(self, partition: _Partition):
+        while True:
+            batch = [await partition.queue.get()]
+            while len(batch) < self.batch_size and not partition.queue.empty():
+                batch.append(partition.queue.get_nowait())
+
+            started = time.monotonic()
+            lag = started - batch[0][2]
+            partition.last_lag_seconds = lag
+            partition.max_lag_seconds = max(partition.max_lag_seconds, lag)
+
+            try:
+                await self._process(batch)
+            finally:
+                partition.processed += len(batch)
+                partition.batches += 1
+                for _ in batch:
+                    partition.queue.task_done()
+
+    async def _process(self, batch: list):
+        partition = self._partitions[self.partition_for(batch[0][0].vehicleId)]
+        try:
+            await self._ingest(batch)
+            return
+        except Exception as e:
+            partition.failed_batches += 1
+            print(f"Error processing ingest batch of {len(batch)}: {e}")
+            error = e
+
+        # One vehicle's failure (e.g. a stop inserted by another API process)
+        # must not fail the unrelated vehicles batched with it: run the batch
+        # again one vehicle at a time so only the failing vehicles' pings fail
+        by_vehicle: Dict[str, list] = {}
+        for item in batch:
+            by_vehicle.setdefault(item[0].vehicleId, []).append(item)
+        if len(by_vehicle) > 1:
+            partition.split_batches += 1
+        for vehicle_id, items in by_vehicle.items():
+            if len(by_vehicle) > 1:
+                try:
+                    await self._ingest(items)
+                    continue
+                except Exception as e:
+                    print(f"Error processing ingest batch for vehicle {vehicle_id}: {e}")
+                    error = e
+            partition.failed_vehicles += 1
+            for _, future, _, _ in items:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _ingest(self, batch: list):
+        """Ingest a batch in one transaction and resolve its futures"""
+        async with AsyncSessionLocal() as db:
+            results, _ = await ingest_telemetry_batch(
+                db, [payload for payload, _, _, _ in batch], notify=[notify for _, _, _, notify in batch]
+            )
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+ingest_pipeline = IngestPipeline(
+    partitions=settings.INGEST_PARTITIONS,
+    queue_size=settings.INGEST_QUEUE_SIZE,
+    batch_size=settings.INGEST_BATCH_SIZE
+)
@@ -0,0 +1,149 @@
+"""
+Visibility leases for received queue messages
+
+A received message is hidden for the visibility timeout; if its handling
+takes longer, the queue hands it to another consumer while it is still being
+worked on (a duplicate SMS, for one). The lease manager tracks every message
+a consumer holds and, while it is held, extends the visibility of the ones
+close to expiring with one batched extend_visibility call per heartbeat.
+Leases end when the consumer settles the message, or on shutdown, when the
+remaining ones are made visible again at once.
+"""
+
+import asyncio
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app.services.queues import QueueBackend, QueueMessage
+
+
+class _Lease:
+    __slots__ = ("message", "started", "deadline")
+
+    def __init__(self, message: QueueMessage, started: float, deadline: float):
+        self.message = message
+        self.started = started
+        self.deadline = deadline
+
+
+class LeaseManager:
+    """
+    Keeps one consumer's in-flight messages hidden while they are handled
+
+    Every heartbeat, leases that would expire before the next-but-one
+    heartbeat are extended by the visibility timeout. A lease is extended for
+    at most max_lease_seconds in all, so a stuck handler cannot hold a
+    message forever.
+    """
+
+    def __init__(self, queue: str, visibility_timeout: float, heartbeat_seconds: float,
+                 max_lease_seconds: float):
+        self.backend: Optional[QueueBackend] = None
+        self.queue = queue
+        self.visibility_timeout = visibility_timeout
+        # Leave two heartbeats of margin before a lease runs out
+        self.heartbeat_seconds = max(1.0, min(heartbeat_seconds, visibility_timeout / 3))
+        self.max_lease_seconds = max_lease_seconds
+        self._leases: Dict[str, _Lease] = {}
+        self._lock = asyncio.Lock()  # an extension never races a release
+        self._task: Optional[asyncio.Task] = None
+        self.tracked = 0
+        self.heartbeats = 0
+        self.extended = 0  # lease extensions (messages)
+        self.lost = 0  # extensions the queue rejected: the message was no longer ours
+        self.expired = 0  # leases that ran out before they were extended or released
+        self.abandoned = 0  # leases not extended past max_lease_seconds
+        self.released = 0  # made visible again on shutdown
+        self.extend_errors = 0
+
+    def start(self, backend: QueueBackend):
+        """Start heartbeats, extending leases through backend"""
+        self.backend = backend
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def track(self, messages: Iterable[QueueMessage]):
+        """Start leases for just-received messages"""
+        now = time.monotonic()
+        for message in messages:
+            self._leases[message.id] = _Lease(message, now, now + self.visibility_timeout)
+            self.tracked += 1
+
+    async def release(self, messages: Iterable[QueueMessage]):
+        """End the leases of messages about to be acked or rescheduled"""
+        now = time.monotonic()
+        async with self._lock:
+            for message in messages:
+                lease = self._leases.pop(message.id, None)
+                if lease is not None and lease.deadline <= now:
+                    # Handled after its visibility ran out: it may have been redelivered meanwhile
+                    self.expired += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                await self.heartbeat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.extend_errors += 1
+                print(f"Error extending leases on {self.queue}: {e}")
+
+    async def heartbeat(self):
+        """Extend the leases due before the next-but-one heartbeat, in one call"""
+        async with self._lock:
+            now = time.monotonic()
+            due: List[_Lease] = []
+            for message_id, lease in list(self._leases.items()):
+                if lease.deadline <= now:
+                    self.expired += 1
+                    del self._leases[message_id]
+                elif lease.deadline < now + 2 * self.heartbeat_seconds:
+                    if now - lease.started >= self.max_lease_seconds:
+                        self.abandoned += 1
+                        del self._leases[message_id]
+                    else:
+                        due.append(lease)
+            if not due:
+                return
+            self.heartbeats += 1
+            extended = await self.backend.extend_visibility(
+                self.queue, [lease.message for lease in due], self.visibility_timeout
+            )
+            deadline = now + self.visibility_timeout
+            for lease in due:
+                lease.deadline = deadline
+            self.extended += extended
+            self.lost += len(due) - extended
+
+    async def close(self):
+        """Stop heartbeats and make the messages still held visible again"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        async with self._lock:
+            leases = list(self._leases.values())
+            self._leases.clear()
+        if leases:
+            try:
+                self.released += await self.backend.extend_visibility(
+                    self.queue, [lease.message for lease in leases], 0
+                )
+            except Exception as e:
+                print(f"Error releasing {len(leases)} messages on {self.queue}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._leases),
+            "tracked": self.tracked,
+            "heartbeat_seconds": self.heartbeat_seconds,
+            "heartbeats": self.heartbeats,
+            "extended": self.extended,
+            "lost": self.lost,
+            "expired": self.expired,
+            "abandoned": self.abandoned,
+            "released_on_shutdown": self.released,
+            "extend_errors": self.extend_errors
+        }
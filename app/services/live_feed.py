@@ -0,0 +1,183 @@
+"""
+Live event feed: in-process broadcast hub
+
+Committed changes (stop_started, move_started, inbound_message,
+message_status) are published once to the hub, which encodes each message
+once and appends it to every matching subscriber's bounded buffer. Serving a
+subscriber (SSE or WebSocket, see app.routers.events) costs no database
+queries.
+
+A subscriber whose buffer is full is dropped rather than slowing the
+publisher or growing without bound; its stream ends with a 'dropped' message
+so the client can reconnect and re-sync from GET /events.
+
+Publish from the event loop thread only. Each API process has its own hub,
+fed by the changes committed in that process.
+"""
+
+import asyncio
+import json
+from collections import deque
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+from sqlalchemy import select
+
+from app.config import settings
+from app.models import Event
+
+
+class FeedFull(Exception):
+    """Raised when LIVE_FEED_MAX_SUBSCRIBERS are already connected"""
+
+
+class Subscription:
+    """One client's filtered, bounded view of the feed"""
+
+    def __init__(self, hub: "LiveFeedHub", vehicle_ids: Optional[Iterable[str]] = None,
+                 driver_ids: Optional[Iterable[int]] = None, types: Optional[Iterable[str]] = None):
+        self.hub = hub
+        self.vehicle_ids = set(vehicle_ids) if vehicle_ids else None
+        self.driver_ids = set(driver_ids) if driver_ids else None
+        self.types = set(types) if types else None
+        self.buffer = deque()
+        self.closed_reason: Optional[str] = None
+        self._ready = asyncio.Event()
+
+    def matches(self, message_type: str, vehicle_id: Optional[str], driver_id: Optional[int]) -> bool:
+        return (
+            (self.types is None or message_type in self.types)
+            and (self.vehicle_ids is None or vehicle_id in self.vehicle_ids)
+            and (self.driver_ids is None or driver_id in self.driver_ids)
+        )
+
+    def offer(self, encoded: str) -> bool:
+        """Buffer an encoded message; False if the buffer is full"""
+        if len(self.buffer) >= self.hub.buffer_size:
+            return False
+        self.buffer.append(encoded)
+        self._ready.set()
+        return True
+
+    def close(self, reason: str):
+        if self.closed_reason is None:
+            self.closed_reason = reason
+            self._ready.set()
+
+    async def next(self, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Next encoded message
+
+        Returns None on timeout (send a heartbeat) and raises EOFError once
+        the subscription is closed and drained.
+        """
+        while not self.buffer:
+            if self.closed_reason is not None:
+                raise EOFError(self.closed_reason)
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.buffer.popleft()
+
+    def drain(self) -> list:
+        """All messages buffered right now"""
+        messages = list(self.buffer)
+        self.buffer.clear()
+        return messages
+
+
+class LiveFeedHub:
+    """Fan-out of committed changes to live subscribers"""
+
+    def __init__(self, buffer_size: int, max_subscribers: int):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self.subscribers = set()
+        self._seq = 0
+        self.published = 0
+        self.delivered = 0
+        self.dropped_subscribers = 0
+        self.rejected_subscribers = 0
+
+    def subscribe(self, vehicle_ids=None, driver_ids=None, types=None) -> Subscription:
+        if len(self.subscribers) >= self.max_subscribers:
+            self.rejected_subscribers += 1
+            raise FeedFull()
+        subscription = Subscription(self, vehicle_ids, driver_ids, types)
+        self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscribers.discard(subscription)
+        subscription.close("unsubscribed")
+
+    def publish(self, message_type: str, data: dict, vehicle_id: Optional[str] = None,
+                driver_id: Optional[int] = None):
+        """Send a committed change to every matching subscriber"""
+        if not self.subscribers:
+            return
+        self._seq += 1
+        self.published += 1
+        encoded = None
+        for subscription in list(self.subscribers):
+            if not subscription.matches(message_type, vehicle_id, driver_id):
+                continue
+            if encoded is None:
+                encoded = json.dumps({
+                    "id": self._seq,
+                    "type": message_type,
+                    "vehicle_id": vehicle_id,
+                    "driver_id": driver_id,
+                    "published_at": datetime.now(timezone.utc).isoformat(),
+                    "data": data
+                }, default=str)
+            if subscription.offer(encoded):
+                self.delivered += 1
+            else:
+                # Slow consumer: drop it instead of buffering without bound
+                self.subscribers.discard(subscription)
+                subscription.close("slow consumer")
+                self.dropped_subscribers += 1
+
+    def close_all(self, reason: str = "shutdown"):
+        for subscription in self.subscribers:
+            subscription.close(reason)
+        self.subscribers.clear()
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "max_subscribers": self.max_subscribers,
+            "buffer_size": self.buffer_size,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped_subscribers": self.dropped_subscribers,
+            "rejected_subscribers": self.rejected_subscribers,
+            "buffered": sum(len(s.buffer) for s in self.subscribers)
+        }
+
+
+live_feed = LiveFeedHub(settings.LIVE_FEED_BUFFER_SIZE, settings.LIVE_FEED_MAX_SUBSCRIBERS)
+
+
+async def publish_message_status(db, message, vehicle_id: Optional[str] = None):
+    """
+    Publish a committed message's status
+
+    Looks up the vehicle of the message's event unless given; only call
+    when live_feed has subscribers.
+    """
+    if vehicle_id is None and message.event_id is not None:
+        vehicle_id = (await db.execute(
+            select(Event.vehicle_id).where(Event.id == message.event_id)
+        )).scalar()
+    live_feed.publish("message_status", {
+        "message_id": message.id,
+        "event_id": message.event_id,
+        "driver_id": message.driver_id,
+        "direction": message.direction,
+        "status": message.status,
+        "twilio_sid": message.twilio_sid
+    }, vehicle_id=vehicle_id, driver_id=message.driver_id)
@@ -0,0 +1,74 @@
+"""
+Notification side effects delivered by the dispatcher
+"""
+
+from typing import Optional
+
+from app.database import AsyncSessionLocal
+from app.models import Message
+from app.config import settings
+from app.services.event_cache import event_detail_cache
+from app.services.live_feed import live_feed, publish_message_status
+from app.services.rollups import RollupDeltas, add_rollups
+from app.services.twilio_service import twilio_sender
+
+
+def stop_slack_message(vehicle_id: str, driver_name: str, driver_phone: str,
+                       latitude: float, longitude: float, timestamp: str) -> str:
+    """Compose the Slack message for a stop_started transition"""
+    return (
+        f"🚛 Vehicle {vehicle_id} stopped\n"
+        f"Driver: {driver_name} ({driver_phone})\n"
+        f"Location: {latitude:.4f}, {longitude:.4f}\n"
+        f"Time: {timestamp}"
+    )
+
+
+def stop_sms_body(vehicle_id: str, latitude: float, longitude: float, timestamp: str) -> str:
+    """Compose the driver SMS for a stop_started transition"""
+    return (
+        f"DriverBuddy: Vehicle {vehicle_id} stopped at "
+        f"{latitude:.4f},{longitude:.4f} at {timestamp}. "
+        f"Reply to this SMS."
+    )
+
+
+async def send_stop_sms(event_id: int, driver_id: int, to_phone: str, sms_body: str,
+                        vehicle_id: Optional[str] = None) -> bool:
+    """
+    Send the stop SMS directly and record the outbound message
+
+    Runs on a dispatcher worker, never on the request path, through the
+    shared rate-limited Twilio sender.
+    """
+    print(f"Attempting to send SMS directly to {to_phone}...")
+    sms_success, twilio_sid = await twilio_sender.send(to_phone, sms_body)
+
+    if not (sms_success and twilio_sid):
+        print(f"✗ Failed to send SMS directly. Will try via SQS queue.")
+        return False
+
+    # Note: For virtual-to-virtual, status may show as "failed" on sender side
+    # but message is still delivered. Status callback will update actual status.
+    async with AsyncSessionLocal() as db:
+        message = Message(
+            event_id=event_id,
+            driver_id=driver_id,
+            direction="outbound",
+            body=sms_body,
+            from_phone=settings.TWILIO_NUMBER,
+            to_phone=to_phone,
+            status="sent",  # Initial status, will be updated by status callback
+            twilio_sid=twilio_sid
+        )
+        db.add(message)
+        rollups = RollupDeltas()
+        rollups.message(vehicle_id, driver_id, "outbound")
+        await add_rollups(db, rollups)
+        await db.commit()
+        if live_feed.subscribers:
+            await publish_message_status(db, message, vehicle_id)
+    event_detail_cache.invalidate(event_id)
+
+    print(f"✓ SMS sent directly and message record created (SID: {twilio_sid})")
+    return True
@@ -0,0 +1,31 @@
+"""
+Transactional outbox for queue messages
+
+Messages are inserted into the `outbox` table inside the caller's
+transaction, so they are committed (or rolled back) together with the rows
+they describe. The outbox relay worker delivers them to the job queue
+afterwards.
+"""
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+
+from app.models import OutboxMessage
+
+
+async def add_to_outbox(db: AsyncSession, queue: str, payloads: List[dict]):
+    """
+    Stage queue messages in the current transaction (does not commit)
+
+    Args:
+        db: Session whose transaction the messages join
+        queue: Target queue name
+        payloads: JSON message bodies
+    """
+    if not payloads:
+        return
+    await db.execute(
+        insert(OutboxMessage),
+        [{"queue": queue, "payload": payload, "attempts": 0} for payload in payloads]
+    )
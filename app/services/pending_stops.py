@@ -0,0 +1,183 @@
+"""
+Pending-stop engine honouring STOP_DURATION_SECONDS
+
+A ping below STOP_SPEED_THRESHOLD no longer opens a stop event immediately.
+It opens a pending stop, which is confirmed (and the stop event created
+with the first stop ping's time and position) once either
+- a later stop ping arrives at least STOP_DURATION_SECONDS after it, or
+- STOP_DURATION_SECONDS of wall-clock time pass with no moving ping,
+and dropped if the vehicle moves first (e.g. a traffic light). Wall-clock
+deadlines are kept in one hierarchical timer wheel instead of a task per
+vehicle.
+
+Pending stops live in memory only; after a restart the next stop ping
+starts a new one.
+"""
+
+import asyncio
+import itertools
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from app.config import settings
+from app.schemas import SamsaraWebhookPayload
+from app.services.timer_wheel import HierarchicalTimerWheel, Timer
+
+# Each stop sends a Slack message, a direct SMS and an SMS via the SMS worker
+SMS_PER_STOP = 2
+
+
+class PendingStopTimeout(SamsaraWebhookPayload):
+    """Synthetic stop ping submitted when a pending stop's timer expires"""
+    pendingSeq: int
+
+
+class PendingStop:
+    """First stop ping of a not yet confirmed stop"""
+
+    __slots__ = ("seq", "vehicle_id", "driver_id", "timestamp", "latitude", "longitude",
+                 "metadata", "has_phone", "timer")
+
+    def __init__(self, seq: int, payload: SamsaraWebhookPayload, driver_id: Optional[int]):
+        self.seq = seq
+        self.vehicle_id = payload.vehicleId
+        self.driver_id = driver_id
+        self.timestamp = payload.timestamp
+        self.latitude = payload.latitude
+        self.longitude = payload.longitude
+        self.metadata = payload.metadata
+        self.has_phone = False
+        self.timer: Optional[Timer] = None
+
+
+class PendingStopEngine:
+    """Tracks pending stops per vehicle and fires their wall-clock deadlines"""
+
+    def __init__(self, duration_seconds: int, tick_seconds: float = 1.0):
+        self.duration_seconds = duration_seconds
+        self.tick_seconds = tick_seconds
+        self._pending: Dict[str, PendingStop] = {}
+        self._wheel = HierarchicalTimerWheel(tick_seconds=tick_seconds, start_time=time.monotonic())
+        self._seq = itertools.count(1)
+        self._submit: Optional[Callable] = None
+        self._task: Optional[asyncio.Task] = None
+        self.started = 0
+        self.confirmed = 0
+        self.confirmed_by_timer = 0
+        self.suppressed = 0
+        self.suppressed_sms = 0
+        self.duplicate_confirmations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.duration_seconds > 0
+
+    def get(self, vehicle_id: str) -> Optional[PendingStop]:
+        """Current pending stop of a vehicle"""
+        return self._pending.get(vehicle_id)
+
+    def new(self, payload: SamsaraWebhookPayload, driver_id: Optional[int]) -> PendingStop:
+        """Create (but do not register) a pending stop from a stop ping"""
+        return PendingStop(next(self._seq), payload, driver_id)
+
+    def is_due(self, pending: PendingStop, timestamp: datetime) -> bool:
+        """True if a stop ping at `timestamp` confirms the pending stop"""
+        return timestamp - pending.timestamp >= timedelta(seconds=self.duration_seconds)
+
+    # The methods below are called only after the ingest transaction committed
+
+    def opened(self, pending: PendingStop):
+        """Register a pending stop and arm its wall-clock deadline"""
+        previous = self._pending.get(pending.vehicle_id)
+        if previous is not None and previous.timer is not None:
+            previous.timer.cancel()
+        pending.timer = self._wheel.schedule(time.monotonic() + self.duration_seconds, pending)
+        self._pending[pending.vehicle_id] = pending
+        self.started += 1
+
+    def confirmed_stop(self, pending: PendingStop, by_timer: bool = False):
+        """Forget a pending stop whose stop event was created"""
+        self._forget(pending)
+        self.confirmed += 1
+        if by_timer:
+            self.confirmed_by_timer += 1
+
+    def confirmed_duplicate(self, pending: PendingStop):
+        """Forget a pending stop whose stop event already existed (a retried delivery)"""
+        self._forget(pending)
+        self.duplicate_confirmations += 1
+
+    def cancelled(self, pending: PendingStop):
+        """Forget a pending stop dropped because the vehicle moved first"""
+        self._forget(pending)
+        self.suppressed += 1
+        if pending.has_phone:
+            self.suppressed_sms += SMS_PER_STOP
+
+    async def start(self, submit: Callable):
+        """
+        Start the timer task
+
+        Args:
+            submit: Callable queuing a payload for ordered ingestion
+                (the ingest pipeline's submit)
+        """
+        self._submit = submit
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+            print(f"Pending-stop engine started (confirm after {self.duration_seconds}s)")
+
+    def stop(self):
+        """Stop the timer task"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        """Pending count and how many spurious stops/SMS were suppressed"""
+        return {
+            "stop_duration_seconds": self.duration_seconds,
+            "pending": len(self._pending),
+            "timers_scheduled": len(self._wheel),
+            "started": self.started,
+            "confirmed": self.confirmed,
+            "confirmed_by_timer": self.confirmed_by_timer,
+            "duplicate_confirmations": self.duplicate_confirmations,
+            "suppressed_stop_events": self.suppressed,
+            "suppressed_slack_messages": self.suppressed,
+            "suppressed_sms": self.suppressed_sms
+        }
+
+    def _forget(self, pending: PendingStop):
+        if pending.timer is not None:
+            pending.timer.cancel()
+        if self._pending.get(pending.vehicle_id) is pending:
+            del self._pending[pending.vehicle_id]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_seconds)
+            for pending in self._wheel.advance(time.monotonic()):
+                if self._pending.get(pending.vehicle_id) is not pending:
+                    continue
+                # Confirm through the vehicle's ingest partition to keep per-vehicle order
+                timeout = PendingStopTimeout(
+                    vehicleId=pending.vehicle_id,
+                    driverId=str(pending.driver_id) if pending.driver_id is not None else None,
+                    timestamp=pending.timestamp + timedelta(seconds=self.duration_seconds),
+                    latitude=pending.latitude,
+                    longitude=pending.longitude,
+                    speed=0.0,
+                    pendingSeq=pending.seq
+                )
+                try:
+                    future = self._submit(timeout)
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                except Exception as e:
+                    # Partition saturated: try again on a later tick
+                    print(f"Warning: could not confirm pending stop for {pending.vehicle_id}: {e}")
+                    pending.timer = self._wheel.schedule(time.monotonic() + self.tick_seconds, pending)
+
+
+pending_stops = PendingStopEngine(settings.STOP_DURATION_SECONDS)
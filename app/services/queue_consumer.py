@@ -0,0 +1,168 @@
+"""
+Queue consumer loop shared by the workers
+"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from app.config import settings
+from app.services.leases import LeaseManager
+from app.services.queues import QueueBackend, QueueMessage, get_queue_backend
+from app.services.retries import RetryPolicy, default_policy
+
+
+class QueueConsumer:
+    """
+    Long-polls one queue and hands each batch to an async handler
+
+    The next receive is started as soon as a batch arrives, so it overlaps
+    the handler instead of following it (one batch of prefetch). The handler
+    returns one outcome per message: None when it is done, or the exception
+    it failed with. Done messages are acked together; failed ones go to the
+    retry policy, which hides each for its own backoff delay or dead-letters
+    it, so a failure never holds up the rest of the batch. If the handler
+    itself raises, every message of the batch has failed with that error.
+
+    Received messages, including a prefetched batch, are kept hidden by a
+    lease manager until they are settled; on shutdown the ones still held
+    are made visible again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        queue: str,
+        handler: Callable[[List[QueueMessage]], Awaitable[List[Optional[BaseException]]]],
+        backend: Optional[QueueBackend] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        max_messages: int = 10,
+        wait_seconds: float = 20,
+        visibility_timeout: float = 60,
+        prefetch: bool = True
+    ):
+        self.name = name
+        self.queue = queue
+        self.handler = handler
+        self._backend = backend
+        self.retry_policy = retry_policy or default_policy()
+        self.leases = LeaseManager(
+            queue, visibility_timeout, settings.QUEUE_HEARTBEAT_SECONDS, settings.QUEUE_MAX_LEASE_SECONDS
+        )
+        self.max_messages = max_messages
+        self.wait_seconds = wait_seconds
+        self.visibility_timeout = visibility_timeout
+        self.prefetch = prefetch
+        self.running = False
+        self.batches = 0
+        self.received = 0
+        self.acked = 0
+        self.ack_failures = 0
+        self.errors = 0
+        self.failed = 0  # messages whose handling failed
+        self.prefetched = 0  # batches already received when the previous one finished
+        self.handler_seconds = 0.0
+        self.receive_wait_seconds = 0.0  # time the loop waited on receives
+
+    @property
+    def backend(self) -> QueueBackend:
+        """The given backend, else the process's QUEUE_BACKEND one (created on first use)"""
+        if self._backend is None:
+            self._backend = get_queue_backend()
+        return self._backend
+
+    async def _receive_and_track(self) -> List[QueueMessage]:
+        messages = await self.backend.receive(
+            self.queue, self.max_messages, self.wait_seconds, self.visibility_timeout
+        )
+        self.leases.track(messages)
+        return messages
+
+    def _receive(self) -> asyncio.Future:
+        return asyncio.ensure_future(self._receive_and_track())
+
+    async def run(self):
+        """Receive and handle batches until stop() is called"""
+        self.running = True
+        self.leases.start(self.backend)
+        receive: Optional[asyncio.Future] = None
+        try:
+            while self.running:
+                try:
+                    if receive is None:
+                        receive = self._receive()
+                    elif receive.done():
+                        self.prefetched += 1
+                    waited = time.monotonic()
+                    try:
+                        messages = await receive
+                    finally:
+                        receive = None
+                        self.receive_wait_seconds += time.monotonic() - waited
+                    if not messages:
+                        continue
+                    if self.prefetch:
+                        receive = self._receive()
+
+                    self.batches += 1
+                    self.received += len(messages)
+                    started = time.monotonic()
+                    try:
+                        outcomes = await self.handler(messages)
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"Error handling batch from queue {self.queue}: {e!r}")
+                        outcomes = [e] * len(messages)
+                    self.handler_seconds += time.monotonic() - started
+                    await self._settle(messages, outcomes)
+
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error polling queue {self.queue}: {e}")
+                    await asyncio.sleep(5)
+        finally:
+            self.running = False
+            if receive is not None:
+                receive.cancel()
+            await self.leases.close()
+
+    async def _settle(self, messages: List[QueueMessage], outcomes: List[Optional[BaseException]]):
+        """Ack the done messages and hand the failed ones to the retry policy"""
+        await self.leases.release(messages)
+        done = [message for message, outcome in zip(messages, outcomes) if outcome is None]
+        failures = [(message, outcome) for message, outcome in zip(messages, outcomes) if outcome is not None]
+        if done:
+            acked = await self.backend.ack(self.queue, done)
+            self.acked += acked
+            self.ack_failures += len(done) - acked
+        if failures:
+            self.failed += len(failures)
+            await self.retry_policy.handle(self.backend, self.queue, failures)
+
+    def stop(self):
+        """
+        Stop after the current batch
+
+        Messages of a prefetched receive are not handled; they are made
+        visible again for other consumers.
+        """
+        self.running = False
+
+    def stats(self) -> dict:
+        return {
+            "queue": self.queue,
+            "running": self.running,
+            "batches": self.batches,
+            "received": self.received,
+            "acked": self.acked,
+            "ack_failures": self.ack_failures,
+            "errors": self.errors,
+            "failed": self.failed,
+            "retries": self.retry_policy.stats(),
+            "leases": self.leases.stats(),
+            "prefetched_batches": self.prefetched,
+            "handler_seconds": round(self.handler_seconds, 3),
+            "receive_wait_seconds": round(self.receive_wait_seconds, 3)
+        }
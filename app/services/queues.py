@@ -0,0 +1,554 @@
+"""
+Job queue backends
+
+Workers and the outbox relay talk to a QueueBackend instead of a boto3 client,
+so the same code runs against:
+- sqs: Amazon SQS (or an SQS-compatible stand-in via SQS_ENDPOINT_URL)
+- memory: asyncio queues inside the process; zero latency, no durability,
+  for single-process local runs, load tests and CI
+- sql: the queue_messages table in the application database; durable and
+  shared by processes, without AWS
+
+QUEUE_BACKEND selects one for the process (get_queue_backend()). All three have
+SQS semantics: a received message is hidden for its visibility timeout and
+redelivered unless acked with the receipt of its latest receive.
+scripts/queue_conformance.py runs the same redelivery and throughput checks
+against each of them.
+"""
+
+import asyncio
+import functools
+import heapq
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import boto3
+from botocore.config import Config
+from sqlalchemy import delete, insert, select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import QueuedMessage
+
+
+class QueueMessage:
+    """A received message"""
+
+    __slots__ = ("id", "body", "receipt", "receive_count", "attributes")
+
+    def __init__(self, id: str, body: str, receipt: str, receive_count: int = 1,
+                 attributes: Optional[Dict[str, str]] = None):
+        self.id = id
+        self.body = body
+        self.receipt = receipt
+        self.receive_count = receive_count
+        self.attributes = attributes or {}
+
+    def __repr__(self):
+        return f"QueueMessage(id={self.id!r}, receive_count={self.receive_count})"
+
+
+class QueueBackend(ABC):
+    """
+    Operations the workers need from a queue
+
+    Send entries are dicts with "id" (caller's id, echoed back), "body" and
+    optionally "attributes" (str -> str), "delay_seconds", "group_id" and
+    "dedup_id" (FIFO queues on SQS).
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.acked = 0
+        self.ack_failures = 0
+        self.extended = 0
+        self.extend_failures = 0
+
+    async def send(self, queue: str, body: str, attributes: Optional[Dict[str, str]] = None,
+                   delay_seconds: int = 0) -> str:
+        """Send one message; returns its id"""
+        accepted = await self.send_batch(queue, [
+            {"id": "0", "body": body, "attributes": attributes, "delay_seconds": delay_seconds}
+        ])
+        if "0" not in accepted:
+            raise RuntimeError(f"Message to {queue} was not accepted")
+        return accepted["0"]
+
+    @abstractmethod
+    async def send_batch(self, queue: str, entries: List[dict]) -> Dict[str, str]:
+        """
+        Send several messages
+
+        Returns:
+            Message id per accepted entry id
+        """
+
+    @abstractmethod
+    async def receive(self, queue: str, max_messages: int = 10, wait_seconds: float = 20,
+                      visibility_timeout: float = 60) -> List[QueueMessage]:
+        """Up to max_messages visible messages, waiting up to wait_seconds for one"""
+
+    @abstractmethod
+    async def ack(self, queue: str, messages: Iterable[QueueMessage]) -> int:
+        """Delete processed messages; returns how many were still held (receipt current)"""
+
+    @abstractmethod
+    async def extend_visibility(self, queue: str, messages: Iterable[QueueMessage], timeout: float) -> int:
+        """Hide messages for timeout more seconds (0 = visible now); returns how many were still held"""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "sent": self.sent,
+            "received": self.received,
+            "acked": self.acked,
+            "ack_failures": self.ack_failures,
+            "extended": self.extended,
+            "extend_failures": self.extend_failures
+        }
+
+
+class _MemoryState:
+    """One in-process queue: messages by id, ready ids in order, hidden ids by reappearance time"""
+
+    def __init__(self):
+        self.messages: Dict[str, dict] = {}
+        self.ready = deque()
+        self.hidden = []  # heap of (visible_at, seq, id); stale when visible_at changed since
+        self.changed = asyncio.Event()
+        self._seq = 0
+
+    def hide(self, message_id: str, visible_at: float):
+        self.messages[message_id]["visible_at"] = visible_at
+        self._seq += 1
+        heapq.heappush(self.hidden, (visible_at, self._seq, message_id))
+
+    def promote(self, now: float):
+        while self.hidden and self.hidden[0][0] <= now:
+            visible_at, _, message_id = heapq.heappop(self.hidden)
+            entry = self.messages.get(message_id)
+            if entry is not None and entry["visible_at"] == visible_at:
+                self.ready.append(message_id)
+
+
+class MemoryQueue(QueueBackend):
+    """In-process queues; messages are lost when the process exits"""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._queues: Dict[str, _MemoryState] = {}
+
+    def _state(self, queue: str) -> _MemoryState:
+        if queue not in self._queues:
+            self._queues[queue] = _MemoryState()
+        return self._queues[queue]
+
+    def _held(self, state: _MemoryState, message: QueueMessage) -> Optional[dict]:
+        entry = state.messages.get(message.id)
+        return entry if entry is not None and entry["receipt"] == message.receipt else None
+
+    async def send_batch(self, queue: str, entries: List[dict]) -> Dict[str, str]:
+        state = self._state(queue)
+        now = time.monotonic()
+        accepted = {}
+        for entry in entries:
+            message_id = uuid.uuid4().hex
+            state.messages[message_id] = {
+                "body": entry["body"],
+                "attributes": dict(entry.get("attributes") or {}),
+                "visible_at": now,
+                "receive_count": 0,
+                "receipt": None
+            }
+            if entry.get("delay_seconds"):
+                state.hide(message_id, now + entry["delay_seconds"])
+            else:
+                state.ready.append(message_id)
+            accepted[entry["id"]] = message_id
+        self.sent += len(accepted)
+        state.changed.set()
+        return accepted
+
+    def _claim(self, state: _MemoryState, max_messages: int, visibility_timeout: float) -> List[QueueMessage]:
+        now = time.monotonic()
+        state.promote(now)
+        claimed = []
+        while state.ready and len(claimed) < max_messages:
+            message_id = state.ready.popleft()
+            entry = state.messages.get(message_id)
+            if entry is None:  # Acked since it was queued
+                continue
+            entry["receive_count"] += 1
+            entry["receipt"] = uuid.uuid4().hex
+            state.hide(message_id, now + visibility_timeout)
+            claimed.append(QueueMessage(
+                message_id, entry["body"], entry["receipt"], entry["receive_count"], dict(entry["attributes"])
+            ))
+        return claimed
+
+    async def receive(self, queue: str, max_messages: int = 10, wait_seconds: float = 20,
+                      visibility_timeout: float = 60) -> List[QueueMessage]:
+        state = self._state(queue)
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            state.changed.clear()
+            messages = self._claim(state, max_messages, visibility_timeout)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                self.received += len(messages)
+                return messages
+            # Wake on a send, or when the next hidden message reappears
+            if state.hidden:
+                remaining = min(remaining, max(state.hidden[0][0] - time.monotonic(), 0.001))
+            try:
+                await asyncio.wait_for(state.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def ack(self, queue: str, messages: Iterable[QueueMessage]) -> int:
+        state = self._state(queue)
+        acked = failed = 0
+        for message in messages:
+            if self._held(state, message) is None:
+                failed += 1
+                continue
+            del state.messages[message.id]
+            acked += 1
+        self.acked += acked
+        self.ack_failures += failed
+        return acked
+
+    async def extend_visibility(self, queue: str, messages: Iterable[QueueMessage], timeout: float) -> int:
+        state = self._state(queue)
+        now = time.monotonic()
+        extended = failed = 0
+        for message in messages:
+            if self._held(state, message) is None:
+                failed += 1
+                continue
+            state.hide(message.id, now + timeout)
+            extended += 1
+        self.extended += extended
+        self.extend_failures += failed
+        if timeout <= 0 and extended:
+            state.changed.set()
+        return extended
+
+    def stats(self) -> dict:
+        return {**super().stats(), "depth": {queue: len(state.messages) for queue, state in self._queues.items()}}
+
+
+class SqlQueue(QueueBackend):
+    """
+    Queue table in the application database
+
+    A receive claims rows with one UPDATE ... RETURNING over the oldest
+    visible rows (FOR UPDATE SKIP LOCKED on PostgreSQL), so concurrent
+    consumers in any process never get the same message. Long polls re-check
+    every QUEUE_POLL_INTERVAL_SECONDS, or at once after a send from this
+    process.
+    """
+
+    name = "sql"
+
+    def __init__(self, poll_interval: float):
+        super().__init__()
+        self.poll_interval = poll_interval
+        self._changed: Dict[str, asyncio.Event] = {}
+
+    def _event(self, queue: str) -> asyncio.Event:
+        if queue not in self._changed:
+            self._changed[queue] = asyncio.Event()
+        return self._changed[queue]
+
+    async def send_batch(self, queue: str, entries: List[dict]) -> Dict[str, str]:
+        if not entries:
+            return {}
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            ids = (await db.execute(
+                insert(QueuedMessage).returning(QueuedMessage.id, sort_by_parameter_order=True),
+                [
+                    {
+                        "queue": queue,
+                        "body": entry["body"],
+                        "attributes": entry.get("attributes") or None,
+                        "receive_count": 0,
+                        "visible_at": now + timedelta(seconds=entry.get("delay_seconds") or 0)
+                    }
+                    for entry in entries
+                ]
+            )).scalars().all()
+            await db.commit()
+        self.sent += len(entries)
+        self._event(queue).set()
+        return {entry["id"]: str(message_id) for entry, message_id in zip(entries, ids)}
+
+    async def _claim(self, queue: str, max_messages: int, visibility_timeout: float) -> List[QueueMessage]:
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                update(QueuedMessage)
+                .where(QueuedMessage.id.in_(
+                    select(QueuedMessage.id)
+                    .where(QueuedMessage.queue == queue, QueuedMessage.visible_at <= now)
+                    .order_by(QueuedMessage.id)
+                    .limit(max_messages)
+                    .with_for_update(skip_locked=True)
+                ))
+                .values(
+                    receipt=token,
+                    visible_at=now + timedelta(seconds=visibility_timeout),
+                    receive_count=QueuedMessage.receive_count + 1
+                )
+                .returning(QueuedMessage.id, QueuedMessage.body, QueuedMessage.attributes,
+                           QueuedMessage.receive_count)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+        return [
+            QueueMessage(str(row.id), row.body, f"{row.id}:{token}", row.receive_count, row.attributes)
+            for row in sorted(rows, key=lambda row: row.id)
+        ]
+
+    async def receive(self, queue: str, max_messages: int = 10, wait_seconds: float = 20,
+                      visibility_timeout: float = 60) -> List[QueueMessage]:
+        deadline = time.monotonic() + wait_seconds
+        event = self._event(queue)
+        while True:
+            event.clear()
+            messages = await self._claim(queue, max_messages, visibility_timeout)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                self.received += len(messages)
+                return messages
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _by_token(messages: Iterable[QueueMessage]) -> Dict[str, List[int]]:
+        # Receipts are "<id>:<token>"; one receive shares its token
+        by_token = defaultdict(list)
+        for message in messages:
+            message_id, token = message.receipt.split(":", 1)
+            by_token[token].append(int(message_id))
+        return by_token
+
+    async def ack(self, queue: str, messages: Iterable[QueueMessage]) -> int:
+        messages = list(messages)
+        acked = 0
+        async with AsyncSessionLocal() as db:
+            for token, ids in self._by_token(messages).items():
+                acked += (await db.execute(
+                    delete(QueuedMessage)
+                    .where(QueuedMessage.id.in_(ids), QueuedMessage.receipt == token)
+                    .execution_options(synchronize_session=False)
+                )).rowcount
+            await db.commit()
+        self.acked += acked
+        self.ack_failures += len(messages) - acked
+        return acked
+
+    async def extend_visibility(self, queue: str, messages: Iterable[QueueMessage], timeout: float) -> int:
+        messages = list(messages)
+        visible_at = datetime.now(timezone.utc) + timedelta(seconds=timeout)
+        extended = 0
+        async with AsyncSessionLocal() as db:
+            for token, ids in self._by_token(messages).items():
+                extended += (await db.execute(
+                    update(QueuedMessage)
+                    .where(QueuedMessage.id.in_(ids), QueuedMessage.receipt == token)
+                    .values(visible_at=visible_at)
+                    .execution_options(synchronize_session=False)
+                )).rowcount
+            await db.commit()
+        self.extended += extended
+        self.extend_failures += len(messages) - extended
+        if timeout <= 0 and extended:
+            self._event(queue).set()
+        return extended
+
+
+def sqs_client(max_pool_connections: int = 10):
+    """New boto3 SQS client for the configured region and endpoint"""
+    return boto3.client(
+        'sqs',
+        region_name=settings.AWS_REGION,
+        endpoint_url=settings.SQS_ENDPOINT_URL or None,
+        config=Config(max_pool_connections=max_pool_connections)
+    )
+
+
+class SqsQueue(QueueBackend):
+    """
+    Amazon SQS
+
+    boto3 is synchronous, so every call runs on the backend's own thread
+    pool: a long poll holds one of its threads, never the event loop (or the
+    default executor used by asyncio.to_thread elsewhere).
+    """
+
+    name = "sqs"
+
+    def __init__(self, threads: int, client=None):
+        super().__init__()
+        self.threads = threads
+        self.client = client or sqs_client(threads)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue_urls: Dict[str, str] = {}
+
+    async def _call(self, func, *args, **kwargs):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="sqs")
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def queue_url(self, queue: str) -> str:
+        """Queue URL by name, resolved once"""
+        if queue not in self._queue_urls:
+            response = await self._call(self.client.get_queue_url, QueueName=queue)
+            self._queue_urls[queue] = response['QueueUrl']
+        return self._queue_urls[queue]
+
+    async def send_batch(self, queue: str, entries: List[dict]) -> Dict[str, str]:
+        queue_url = await self.queue_url(queue)
+        accepted = {}
+        for start in range(0, len(entries), 10):
+            batch = []
+            for entry in entries[start:start + 10]:
+                item = {"Id": entry["id"], "MessageBody": entry["body"]}
+                if entry.get("attributes"):
+                    item["MessageAttributes"] = {
+                        key: {"DataType": "String", "StringValue": str(value)}
+                        for key, value in entry["attributes"].items()
+                    }
+                if entry.get("delay_seconds"):
+                    # SQS caps delivery delays at 15 minutes
+                    item["DelaySeconds"] = min(int(entry["delay_seconds"]), 900)
+                if entry.get("group_id"):
+                    item["MessageGroupId"] = entry["group_id"]
+                if entry.get("dedup_id"):
+                    item["MessageDeduplicationId"] = entry["dedup_id"]
+                batch.append(item)
+            response = await self._call(self.client.send_message_batch, QueueUrl=queue_url, Entries=batch)
+            for failed in response.get('Failed', []):
+                print(f"Warning: Could not send message {failed['Id']} to {queue}: {failed.get('Message')}")
+            for ok in response.get('Successful', []):
+                accepted[ok['Id']] = ok['MessageId']
+        self.sent += len(accepted)
+        return accepted
+
+    async def receive(self, queue: str, max_messages: int = 10, wait_seconds: float = 20,
+                      visibility_timeout: float = 60) -> List[QueueMessage]:
+        response = await self._call(
+            self.client.receive_message,
+            QueueUrl=await self.queue_url(queue),
+            MaxNumberOfMessages=min(max_messages, 10),
+            WaitTimeSeconds=int(wait_seconds),  # Long polling
+            VisibilityTimeout=int(visibility_timeout),
+            AttributeNames=["ApproximateReceiveCount"],
+            MessageAttributeNames=["All"]
+        )
+        messages = [
+            QueueMessage(
+                msg['MessageId'],
+                msg['Body'],
+                msg['ReceiptHandle'],
+                int(msg.get('Attributes', {}).get('ApproximateReceiveCount', 1)),
+                {key: value.get('StringValue') for key, value in msg.get('MessageAttributes', {}).items()}
+            )
+            for msg in response.get('Messages', [])
+        ]
+        self.received += len(messages)
+        return messages
+
+    async def _batch(self, queue: str, messages: List[QueueMessage], method, **extra) -> int:
+        queue_url = await self.queue_url(queue)
+        done = 0
+        for start in range(0, len(messages), 10):
+            chunk = messages[start:start + 10]
+            try:
+                response = await self._call(method, QueueUrl=queue_url, Entries=[
+                    {"Id": str(i), "ReceiptHandle": message.receipt, **extra}
+                    for i, message in enumerate(chunk)
+                ])
+            except Exception as e:
+                print(f"Error calling {method.__name__} on {queue}: {e}")
+                continue
+            for failed in response.get('Failed', []):
+                print(f"Warning: {method.__name__} failed for {chunk[int(failed['Id'])].id}: {failed.get('Message')}")
+            done += len(response.get('Successful', []))
+        return done
+
+    async def ack(self, queue: str, messages: Iterable[QueueMessage]) -> int:
+        messages = list(messages)
+        acked = await self._batch(queue, messages, self.client.delete_message_batch)
+        self.acked += acked
+        self.ack_failures += len(messages) - acked
+        return acked
+
+    async def extend_visibility(self, queue: str, messages: Iterable[QueueMessage], timeout: float) -> int:
+        messages = list(messages)
+        extended = await self._batch(
+            queue, messages, self.client.change_message_visibility_batch, VisibilityTimeout=int(timeout)
+        )
+        self.extended += extended
+        self.extend_failures += len(messages) - extended
+        return extended
+
+    async def close(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def create_queue_backend(name: str) -> QueueBackend:
+    """Backend by QUEUE_BACKEND name"""
+    if name == "sqs":
+        return SqsQueue(settings.SQS_CLIENT_THREADS)
+    if name == "memory":
+        return MemoryQueue()
+    if name == "sql":
+        return SqlQueue(settings.QUEUE_POLL_INTERVAL_SECONDS)
+    raise ValueError(f"Unknown QUEUE_BACKEND {name!r} (expected sqs, memory or sql)")
+
+
+_backend: Optional[QueueBackend] = None
+
+
+def get_queue_backend() -> QueueBackend:
+    """
+    The process's QUEUE_BACKEND backend, created on first use
+
+    Importing this module builds nothing (no SQS client or thread pool)
+    until a worker, the relay or a script actually needs the queue.
+    """
+    global _backend
+    if _backend is None:
+        _backend = create_queue_backend(settings.QUEUE_BACKEND)
+    return _backend
+
+
+async def close_queue_backend():
+    """Close the process's backend, if one was created"""
+    global _backend
+    if _backend is not None:
+        await _backend.close()
+        _backend = None
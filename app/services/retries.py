@@ -0,0 +1,210 @@
+"""
+Retry policy for queue jobs
+
+A job that fails is classified:
+- transient (Twilio 429/5xx, network errors and timeouts, database
+  disconnects and lock timeouts, SQS throttling): retried with exponential
+  backoff and jitter. The job is sent again with a delivery delay of the
+  backoff and the failed message is acked, so the rest of its batch is not
+  held up and no worker sleeps.
+- permanent (malformed jobs, Twilio 4xx such as an invalid number, missing
+  rows): dead-lettered at once.
+
+A job's attempt number is carried in its "attempt" message attribute (1 when
+absent) and raised by each retry. It is not the queue's receive count: a
+message released on shutdown or after an expired lease comes back with the
+same attempt, so deploys do not use up retry budget. After RETRY_MAX_ATTEMPTS
+attempts a transient failure is dead-lettered too.
+Dead letters are kept in the dead_letters table; scripts/replay_dead_letters.py
+lists them and sends them back to their queue.
+"""
+
+import asyncio
+import random
+from typing import List, Tuple
+
+from sqlalchemy import exc as sa_exc, insert
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import DeadLetter
+from app.services.queues import QueueBackend, QueueMessage
+
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+ATTEMPT_ATTRIBUTE = "attempt"
+
+
+class TransientError(Exception):
+    """A job failure worth retrying"""
+
+
+class PermanentError(Exception):
+    """A job failure that retrying cannot fix"""
+
+
+def classify(error: BaseException) -> str:
+    """TRANSIENT or PERMANENT; unknown errors are treated as transient"""
+    if isinstance(error, PermanentError):
+        return PERMANENT
+    if isinstance(error, TransientError):
+        return TRANSIENT
+
+    # Twilio API errors carry the HTTP status
+    status = getattr(error, "status", None)
+    if type(error).__name__ == "TwilioRestException" and isinstance(status, int):
+        return TRANSIENT if status == 429 or status >= 500 else PERMANENT
+
+    # botocore ClientError: throttling and server-side errors are retryable
+    response = getattr(error, "response", None)
+    if isinstance(response, dict) and "Error" in response:
+        code = response["Error"].get("Code", "")
+        http_status = response.get("ResponseMetadata", {}).get("HTTPStatusCode", 500)
+        if "Throttl" in code or code in ("RequestThrottled", "ServiceUnavailable") or http_status >= 500:
+            return TRANSIENT
+        return PERMANENT
+
+    if isinstance(error, (sa_exc.OperationalError, sa_exc.InterfaceError, sa_exc.DisconnectionError,
+                          sa_exc.TimeoutError)):
+        return TRANSIENT
+    if isinstance(error, sa_exc.DBAPIError) and error.connection_invalidated:
+        return TRANSIENT
+    if isinstance(error, (sa_exc.IntegrityError, sa_exc.DataError)):
+        return PERMANENT
+    if isinstance(error, (ValueError, KeyError, TypeError, AttributeError)):
+        return PERMANENT
+    return TRANSIENT
+
+
+def attempt_of(message: QueueMessage) -> int:
+    """The message's attempt number, from its attempt attribute"""
+    try:
+        return max(1, int((message.attributes or {}).get(ATTEMPT_ATTRIBUTE, 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+class RetryPolicy:
+    """Backoff schedule and dead-lettering for one consumer's failed messages"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retried = 0
+        self.dead_lettered = 0
+        self.dead_letter_failures = 0
+        self.failures = {TRANSIENT: 0, PERMANENT: 0}
+
+    def backoff(self, attempt: int) -> int:
+        """
+        Delay before the attempt after `attempt`: exponential, with equal
+        jitter so messages that failed together do not all come back together
+
+        Whole seconds, as SQS visibility timeouts are.
+        """
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return max(1, round(random.uniform(delay / 2, delay)))
+
+    def will_retry(self, message: QueueMessage, error: BaseException) -> bool:
+        """Whether a failure of this attempt leads to another one"""
+        return classify(error) == TRANSIENT and attempt_of(message) < self.max_attempts
+
+    async def handle(self, backend: QueueBackend, queue: str,
+                     failures: List[Tuple[QueueMessage, BaseException]]) -> Tuple[int, int]:
+        """
+        Schedule retries and dead-letter the rest
+
+        Returns:
+            (retried, dead-lettered) counts
+        """
+        retries, dead = [], []
+        for message, error in failures:
+            kind = classify(error)
+            self.failures[kind] += 1
+            if self.will_retry(message, error):
+                retries.append((message, error))
+            else:
+                dead.append((message, error, kind))
+
+        async def retry(message: QueueMessage, error: BaseException):
+            attempt = attempt_of(message)
+            delay = self.backoff(attempt)
+            print(f"Retrying {queue} message {message.id} in {delay}s "
+                  f"(attempt {attempt}/{self.max_attempts}): {error!r}")
+            entry = {
+                "id": "0",
+                "body": message.body,
+                "attributes": {**(message.attributes or {}), ATTEMPT_ATTRIBUTE: str(attempt + 1)},
+                "delay_seconds": delay
+            }
+            if queue.endswith(".fifo"):
+                # FIFO queues take no per-message delay and need a group and dedup id
+                del entry["delay_seconds"]
+                entry["group_id"] = queue
+                entry["dedup_id"] = f"{message.id}-attempt-{attempt + 1}"
+            if "0" not in await backend.send_batch(queue, [entry]):
+                raise RuntimeError(f"Retry of {message.id} was not accepted")
+            return message
+
+        results = await asyncio.gather(*(retry(m, e) for m, e in retries), return_exceptions=True)
+        resent = []
+        for result in results:
+            if isinstance(result, BaseException):
+                # Not acked: the message reappears after its visibility timeout
+                # and the same attempt runs again
+                print(f"Error scheduling retry on {queue}: {result}")
+            else:
+                resent.append(result)
+        if resent:
+            await backend.ack(queue, resent)
+        self.retried += len(resent)
+
+        if dead:
+            try:
+                await dead_letter(queue, dead)
+            except Exception as e:
+                # Not acked: redelivered after the visibility timeout and dead-lettered then
+                self.dead_letter_failures += len(dead)
+                print(f"Error dead-lettering {len(dead)} {queue} messages: {e}")
+                return len(resent), 0
+            await backend.ack(queue, [message for message, _, _ in dead])
+            self.dead_lettered += len(dead)
+        return len(resent), len(dead)
+
+    def stats(self) -> dict:
+        return {
+            "max_attempts": self.max_attempts,
+            "failures": dict(self.failures),
+            "retried": self.retried,
+            "dead_lettered": self.dead_lettered,
+            "dead_letter_failures": self.dead_letter_failures
+        }
+
+
+async def dead_letter(queue: str, failures: List[Tuple[QueueMessage, BaseException, str]]):
+    """Record failed messages in the dead_letters table (commits)"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(DeadLetter), [
+            {
+                "queue": queue,
+                "message_id": message.id,
+                "body": message.body,
+                "attributes": message.attributes or None,
+                "attempts": attempt_of(message),
+                "error_kind": kind if kind == PERMANENT else "exhausted",
+                "error": f"{type(error).__name__}: {error}"[:2000]
+            }
+            for message, error, kind in failures
+        ])
+        await db.commit()
+    for message, error, kind in failures:
+        print(f"Dead-lettered {queue} message {message.id} after {attempt_of(message)} attempt(s): {error!r}")
+
+
+def default_policy() -> RetryPolicy:
+    return RetryPolicy(
+        settings.RETRY_MAX_ATTEMPTS,
+        settings.RETRY_BASE_DELAY_SECONDS,
+        settings.RETRY_MAX_DELAY_SECONDS
+    )
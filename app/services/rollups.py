@@ -0,0 +1,289 @@
+"""
+Hourly and daily fleet rollups
+
+Dashboard summaries (stops, dwell, SMS replies per vehicle, driver or the
+whole fleet) read the fleet_rollups table instead of aggregating events and
+messages. Rows are incremented in the transactions that write the data:
+- a stop counts in the bucket of its start_time; its dwell is added to that
+  same bucket when it closes, so average dwell = dwell_seconds / closed_stops
+- messages count in the bucket of their creation time, under their event's
+  vehicle (if any) and their driver.
+
+Like the event counters, rows are split over EVENT_COUNT_SHARDS shards so
+concurrent transactions rarely wait on the same row lock. compact_rollups
+recomputes a time range from the source tables and folds its shards into
+shard 0, picking up late-arriving data and writes made outside these paths
+(backfills) without blocking the writers; the
+rollup compactor worker runs it over the trailing
+ROLLUP_COMPACT_LOOKBACK_HOURS.
+"""
+
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import upsert_insert
+from app.models import Event, FleetRollup, Message
+
+GRANULARITIES = ("hour", "day")
+METRICS = ("stops", "closed_stops", "dwell_seconds", "outbound_messages", "inbound_messages")
+FLEET_KEY = "*"
+
+
+def _utc(ts: datetime) -> datetime:
+    # Naive timestamps are UTC, as stored
+    return ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    """Start (UTC) of the hour or day bucket containing ts"""
+    ts = _utc(ts).replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0) if granularity == "day" else ts
+
+
+def bucket_delta(granularity: str) -> timedelta:
+    return timedelta(days=1) if granularity == "day" else timedelta(hours=1)
+
+
+class RollupDeltas:
+    """Rollup increments collected for one transaction"""
+
+    def __init__(self):
+        self._rows = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+
+    def __bool__(self):
+        return bool(self._rows)
+
+    def _add(self, ts: datetime, vehicle_id: Optional[str], driver_id: Optional[int], **metrics):
+        keys = [("fleet", FLEET_KEY)]
+        if vehicle_id:
+            keys.append(("vehicle", str(vehicle_id)))
+        if driver_id:
+            keys.append(("driver", str(driver_id)))
+        for granularity in GRANULARITIES:
+            start = bucket_start(ts, granularity)
+            for dimension, key in keys:
+                row = self._rows[(granularity, start, dimension, key)]
+                for metric, value in metrics.items():
+                    row[metric] += value
+
+    def stop(self, vehicle_id: Optional[str], driver_id: Optional[int], start_time: datetime,
+             end_time: Optional[datetime] = None):
+        """A new stop event (possibly already closed)"""
+        self._add(start_time, vehicle_id, driver_id, stops=1)
+        if end_time is not None:
+            self.stop_closed(vehicle_id, driver_id, start_time, end_time)
+
+    def stop_closed(self, vehicle_id: Optional[str], driver_id: Optional[int], start_time: datetime,
+                    end_time: datetime):
+        """A stop event's end_time was set"""
+        dwell = max((_utc(end_time) - _utc(start_time)).total_seconds(), 0.0)
+        self._add(start_time, vehicle_id, driver_id, closed_stops=1, dwell_seconds=dwell)
+
+    def message(self, vehicle_id: Optional[str], driver_id: Optional[int], direction: str,
+                created_at: Optional[datetime] = None):
+        """A new message row"""
+        metric = "inbound_messages" if direction == "inbound" else "outbound_messages"
+        self._add(created_at or datetime.now(timezone.utc), vehicle_id, driver_id, **{metric: 1})
+
+    def rows(self, shard: int) -> List[dict]:
+        # Sorted keys keep the row lock order consistent across transactions
+        return [
+            {
+                "granularity": granularity, "bucket_start": start, "dimension": dimension,
+                "key": key, "shard": shard, **metrics
+            }
+            for (granularity, start, dimension, key), metrics in sorted(self._rows.items())
+        ]
+
+
+async def add_rollups(db: AsyncSession, deltas: RollupDeltas):
+    """Apply rollup increments in the current transaction (does not commit)"""
+    if not deltas:
+        return
+    statement = upsert_insert(db, FleetRollup)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["granularity", "dimension", "key", "bucket_start", "shard"],
+            set_={metric: getattr(FleetRollup, metric) + statement.excluded[metric] for metric in METRICS}
+        ),
+        deltas.rows(random.randrange(settings.EVENT_COUNT_SHARDS))
+    )
+
+
+async def read_rollups(
+    db: AsyncSession,
+    granularity: str,
+    dimension: str,
+    start: datetime,
+    end: datetime,
+    key: Optional[str] = None
+) -> list:
+    """
+    Rollup rows with bucket_start in [start, end), summed over shards
+
+    Returns:
+        Rows of (key, bucket_start, *METRICS), ordered by key and bucket
+    """
+    filters = [
+        FleetRollup.granularity == granularity,
+        FleetRollup.dimension == dimension,
+        FleetRollup.bucket_start >= start,
+        FleetRollup.bucket_start < end
+    ]
+    if key is not None:
+        filters.append(FleetRollup.key == key)
+    return (await db.execute(
+        select(
+            FleetRollup.key,
+            FleetRollup.bucket_start,
+            *(func.sum(getattr(FleetRollup, metric)).label(metric) for metric in METRICS)
+        )
+        .where(*filters)
+        .group_by(FleetRollup.key, FleetRollup.bucket_start)
+        .order_by(FleetRollup.key, FleetRollup.bucket_start)
+    )).all()
+
+
+def _increment(connection, rows: List[dict]):
+    """Add rows' metrics to the matching rollup rows, creating missing ones"""
+    statement = (sqlite.insert if connection.dialect.name == "sqlite" else postgresql.insert)(FleetRollup)
+    for offset in range(0, len(rows), 5000):
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=["granularity", "dimension", "key", "bucket_start", "shard"],
+                set_={metric: getattr(FleetRollup, metric) + statement.excluded[metric] for metric in METRICS}
+            ),
+            rows[offset:offset + 5000]
+        )
+
+
+def _collapse_day(connection, day: datetime):
+    """Fold the shards of one day's buckets into shard 0 and drop empty rows"""
+    in_day = (FleetRollup.bucket_start >= day, FleetRollup.bucket_start < day + timedelta(days=1))
+    moved = connection.execute(
+        delete(FleetRollup)
+        .where(*in_day, FleetRollup.shard > 0)
+        .returning(FleetRollup.granularity, FleetRollup.dimension, FleetRollup.key, FleetRollup.bucket_start,
+                   *(getattr(FleetRollup, metric) for metric in METRICS))
+    ).all()
+    _increment(connection, [
+        {
+            "granularity": row.granularity, "dimension": row.dimension, "key": row.key,
+            "bucket_start": row.bucket_start, "shard": 0, **{metric: getattr(row, metric) for metric in METRICS}
+        }
+        for row in moved
+    ])
+    # dwell_seconds only counts with closed_stops
+    connection.execute(
+        delete(FleetRollup).where(
+            *in_day, FleetRollup.stops == 0, FleetRollup.closed_stops == 0,
+            FleetRollup.outbound_messages == 0, FleetRollup.inbound_messages == 0
+        )
+    )
+
+
+def compact_rollups(connection, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """
+    Recompute the rollup buckets of whole days overlapping [start, end)
+
+    Takes a synchronous connection outside any transaction (use
+    AsyncConnection.run_sync from async code); the work is committed in
+    short transactions of its own. Without start/end the whole history is
+    recomputed.
+
+    The source rows and the current rollup sums are read from one snapshot
+    (REPEATABLE READ on PostgreSQL). Writers commit rows and their rollup
+    increments together, so the difference is exactly what the rollups
+    miss; it is added to shard 0 as an ordinary increment, one day per
+    transaction, and that day's other shards are folded into shard 0.
+    Nothing is locked beyond the rows being changed, so concurrent ingest
+    and message transactions are never held up for the whole recompute,
+    and no increment is lost or counted twice.
+
+    Returns:
+        Number of rollup rows corrected
+    """
+    with connection.begin():
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"))
+
+        if start is None:
+            firsts = [
+                connection.execute(select(func.min(column))).scalar()
+                for column in (Event.start_time, Message.created_at, FleetRollup.bucket_start)
+            ]
+            firsts = [_utc(first) for first in firsts if first is not None]
+            if not firsts:
+                return 0
+            start = min(firsts)
+        if end is None:
+            end = datetime.now(timezone.utc)
+        lo = bucket_start(start, "day")
+        hi = bucket_start(end, "day")
+        if hi < _utc(end):
+            hi += timedelta(days=1)
+
+        deltas = RollupDeltas()
+        for vehicle_id, driver_id, start_time, end_time in connection.execute(
+            select(Event.vehicle_id, Event.driver_id, Event.start_time, Event.end_time)
+            .where(Event.event_type == "stop", Event.start_time >= lo, Event.start_time < hi)
+            .execution_options(yield_per=10000)
+        ):
+            deltas.stop(vehicle_id, driver_id, start_time, end_time)
+        for vehicle_id, driver_id, direction, created_at in connection.execute(
+            select(Event.vehicle_id, Message.driver_id, Message.direction, Message.created_at)
+            .outerjoin(Event, Message.event_id == Event.id)
+            .where(Message.created_at >= lo, Message.created_at < hi)
+            .execution_options(yield_per=10000)
+        ):
+            deltas.message(vehicle_id, driver_id, direction, created_at)
+
+        current = {}
+        for row in connection.execute(
+            select(
+                FleetRollup.granularity, FleetRollup.bucket_start, FleetRollup.dimension, FleetRollup.key,
+                *(func.sum(getattr(FleetRollup, metric)).label(metric) for metric in METRICS)
+            )
+            .where(FleetRollup.bucket_start >= lo, FleetRollup.bucket_start < hi)
+            .group_by(FleetRollup.granularity, FleetRollup.bucket_start, FleetRollup.dimension, FleetRollup.key)
+            .execution_options(yield_per=10000)
+        ):
+            current[(row.granularity, _utc(row.bucket_start), row.dimension, row.key)] = {
+                metric: getattr(row, metric) or 0 for metric in METRICS
+            }
+
+    corrections = {}
+    for row in deltas.rows(0):
+        have = current.pop((row["granularity"], row["bucket_start"], row["dimension"], row["key"]), None)
+        if have is not None:
+            for metric in METRICS:
+                row[metric] -= have[metric]
+        corrections.setdefault(bucket_start(row["bucket_start"], "day"), []).append(row)
+    # Buckets whose source rows are gone
+    for (granularity, start_time, dimension, key), have in sorted(current.items()):
+        corrections.setdefault(bucket_start(start_time, "day"), []).append({
+            "granularity": granularity, "bucket_start": start_time, "dimension": dimension, "key": key,
+            "shard": 0, **{metric: -value for metric, value in have.items()}
+        })
+
+    corrected = 0
+    day = lo
+    while day < hi:
+        rows = [
+            row for row in corrections.get(day, [])
+            if any(round(row[metric], 6) for metric in METRICS)
+        ]
+        rows.sort(key=lambda row: (row["granularity"], row["bucket_start"], row["dimension"], row["key"]))
+        with connection.begin():
+            _increment(connection, rows)
+            _collapse_day(connection, day)
+        corrected += len(rows)
+        day += timedelta(days=1)
+    return corrected
@@ -0,0 +1,354 @@
+"""
+Raw telemetry storage
+
+Every accepted Samsara ping is kept in the `telemetry` table, which on
+PostgreSQL is range-partitioned by day (UTC) on recorded_at. Retention is
+enforced by dropping whole day partitions instead of DELETEing rows.
+
+Pings are not written on the webhook path: the ingest batch hands them to a
+buffered writer that flushes with COPY (asyncpg copy_records_to_table) once
+TELEMETRY_FLUSH_ROWS rows are buffered or TELEMETRY_FLUSH_INTERVAL_SECONDS
+have passed. Telemetry is best-effort: when the buffer is full the oldest
+pings are dropped and counted rather than slowing down ingestion.
+"""
+
+import asyncio
+import json
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import AsyncSessionLocal, async_engine, upsert_insert
+from app.models import Telemetry
+from app.schemas import SamsaraWebhookPayload
+
+TELEMETRY_COLUMNS = ["vehicle_id", "recorded_at", "driver_id", "latitude", "longitude",
+                     "speed", "heading", "metadata"]
+PARTITION_NAME = re.compile(r"^telemetry_(\d{8})$")
+
+
+def partition_name(day: date) -> str:
+    """Name of the partition holding one UTC day"""
+    return f"telemetry_{day:%Y%m%d}"
+
+
+def create_day_partitions(connection, days: Iterable[date]) -> List[str]:
+    """
+    Create the partitions holding the given UTC days
+
+    Takes a synchronous connection. No-op on databases other than PostgreSQL.
+
+    Returns:
+        Names of the partitions ensured
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    names = []
+    for day in sorted(set(days)):
+        name = partition_name(day)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF telemetry "
+            f"FOR VALUES FROM ('{day.isoformat()} 00:00:00+00') "
+            f"TO ('{(day + timedelta(days=1)).isoformat()} 00:00:00+00')"
+        ))
+        names.append(name)
+    return names
+
+
+def ensure_partitions(connection, today: Optional[date] = None,
+                      ahead_days: Optional[int] = None) -> List[str]:
+    """
+    Create the day partitions from today through `ahead_days` days ahead
+
+    Older (late or backfilled) days get their partition when a flush first
+    contains them; there is no default partition, whose rows retention could
+    not drop and which would block creating any day it held rows for.
+
+    Takes a synchronous connection (use AsyncConnection.run_sync from async
+    code). No-op on databases other than PostgreSQL.
+
+    Returns:
+        Names of the partitions ensured
+    """
+    today = today or datetime.now(timezone.utc).date()
+    ahead_days = settings.TELEMETRY_PARTITIONS_AHEAD_DAYS if ahead_days is None else ahead_days
+    return create_day_partitions(connection, (today + timedelta(days=offset) for offset in range(ahead_days + 1)))
+
+
+def retire_default_partition(connection) -> int:
+    """
+    Move the rows of the old catch-all telemetry_default partition into day
+    partitions and drop it
+
+    Takes a synchronous connection in a transaction. No-op on databases
+    other than PostgreSQL or when there is no default partition.
+
+    Returns:
+        Number of rows moved
+    """
+    if connection.dialect.name != "postgresql":
+        return 0
+    if connection.execute(text("SELECT to_regclass('telemetry_default')")).scalar() is None:
+        return 0
+    # Detached first: a day partition cannot be created while the default holds rows for it
+    connection.execute(text("ALTER TABLE telemetry DETACH PARTITION telemetry_default"))
+    days = connection.execute(text(
+        "SELECT DISTINCT (recorded_at AT TIME ZONE 'UTC')::date FROM telemetry_default"
+    )).scalars().all()
+    create_day_partitions(connection, days)
+    columns = ", ".join(TELEMETRY_COLUMNS + ["received_at"])
+    moved = connection.execute(text(
+        f"INSERT INTO telemetry ({columns}) SELECT {columns} FROM telemetry_default ON CONFLICT DO NOTHING"
+    )).rowcount
+    connection.execute(text("DROP TABLE telemetry_default"))
+    return moved
+
+
+def drop_expired_partitions(connection, today: Optional[date] = None,
+                            retention_days: Optional[int] = None) -> List[str]:
+    """
+    Drop day partitions older than `retention_days` days
+
+    Takes a synchronous connection. No-op on databases other than PostgreSQL.
+
+    Returns:
+        Names of the partitions dropped
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    today = today or datetime.now(timezone.utc).date()
+    retention_days = settings.TELEMETRY_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = today - timedelta(days=retention_days)
+
+    partitions = connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = 'telemetry'"
+    )).scalars().all()
+
+    dropped = []
+    for name in partitions:
+        match = PARTITION_NAME.match(name)
+        if not match:
+            continue
+        if datetime.strptime(match.group(1), "%Y%m%d").date() < cutoff:
+            connection.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    return dropped
+
+
+def _utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def telemetry_record(payload: SamsaraWebhookPayload, driver_id: Optional[int]) -> Tuple:
+    """One telemetry row, in TELEMETRY_COLUMNS order"""
+    return (
+        payload.vehicleId,
+        _utc(payload.timestamp),
+        driver_id,
+        payload.latitude,
+        payload.longitude,
+        payload.speed,
+        payload.heading,
+        payload.metadata
+    )
+
+
+class TelemetryWriter:
+    """Buffers telemetry rows and bulk-loads them in the background"""
+
+    def __init__(self, flush_rows: int, flush_interval_seconds: float, max_buffer_rows: int,
+                 enabled: bool = True):
+        self.flush_rows = flush_rows
+        self.flush_interval_seconds = flush_interval_seconds
+        self.max_buffer_rows = max_buffer_rows
+        self.enabled = enabled
+        self._buffer: List[Tuple] = []
+        self._flush_needed = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_maintenance = 0.0
+        self.rows_written = 0
+        self.flushes = 0
+        self.copy_flushes = 0
+        self.insert_flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_flush_rows = 0
+        self.last_flush_seconds = 0.0
+        self.partitions_created = 0
+        self.partitions_dropped = 0
+        self.expired_rows = 0  # older than the retention period when flushed
+        self._partition_days = set()  # days whose partition is known to exist
+
+    def add(self, records: Iterable[Tuple]):
+        """Buffer rows built with telemetry_record; never blocks"""
+        if not self.enabled:
+            return
+        self._buffer.extend(records)
+        overflow = len(self._buffer) - self.max_buffer_rows
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self.dropped += overflow
+        if len(self._buffer) >= self.flush_rows:
+            self._flush_needed.set()
+
+    async def start(self):
+        """Create today's partitions and start the flush task"""
+        if not self.enabled:
+            return
+        await self.maintain_partitions()
+        self._task = asyncio.create_task(self._run())
+        print("Telemetry writer started")
+
+    async def stop(self):
+        """Stop the flush task and write what is still buffered"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._buffer:
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write all buffered rows
+
+        Returns:
+            Number of rows written (failed rows go back into the buffer)
+        """
+        rows, self._buffer = self._buffer, []
+        self._flush_needed.clear()
+        # Late pings whose day retention has already dropped are not kept
+        cutoff = datetime.now(timezone.utc).date() - timedelta(days=settings.TELEMETRY_RETENTION_DAYS)
+        kept = [row for row in rows if row[1].date() >= cutoff]
+        self.expired_rows += len(rows) - len(kept)
+        rows = kept
+        if not rows:
+            return 0
+
+        started = time.monotonic()
+        try:
+            if async_engine.dialect.name == "postgresql":
+                await self._ensure_days({row[1].date() for row in rows})
+                try:
+                    await self._copy(rows)
+                    self.copy_flushes += 1
+                except Exception as e:
+                    # COPY is all-or-nothing; a redelivered ping (duplicate key)
+                    # fails it, so retry the batch as INSERT ... ON CONFLICT DO NOTHING
+                    print(f"Warning: telemetry COPY failed, falling back to INSERT: {e}")
+                    await self._insert(rows)
+                    self.insert_flushes += 1
+            else:
+                await self._insert(rows)
+                self.insert_flushes += 1
+        except Exception as e:
+            self.failed_flushes += 1
+            print(f"Error writing {len(rows)} telemetry rows: {e}")
+            self.add(rows)
+            return 0
+
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.last_flush_rows = len(rows)
+        self.last_flush_seconds = time.monotonic() - started
+        return len(rows)
+
+    async def _ensure_days(self, days: set):
+        """Create the partitions of days not seen before (late or backfilled pings)"""
+        missing = days - self._partition_days
+        if not missing:
+            return
+        async with async_engine.begin() as conn:
+            created = await conn.run_sync(create_day_partitions, missing)
+        self._partition_days |= missing
+        for name in created:
+            print(f"Ensured telemetry partition {name}")
+
+    async def maintain_partitions(self):
+        """Create upcoming day partitions and drop expired ones"""
+        self._last_maintenance = time.monotonic()
+        try:
+            async with async_engine.begin() as conn:
+                created = await conn.run_sync(ensure_partitions)
+                dropped = await conn.run_sync(drop_expired_partitions)
+            self.partitions_created = len(created)
+            self.partitions_dropped += len(dropped)
+            self._partition_days = {
+                datetime.strptime(PARTITION_NAME.match(name).group(1), "%Y%m%d").date()
+                for name in created
+            }
+            for name in dropped:
+                print(f"Dropped expired telemetry partition {name}")
+        except Exception as e:
+            print(f"Error maintaining telemetry partitions: {e}")
+
+    def stats(self) -> dict:
+        """Buffer depth and write throughput"""
+        return {
+            "enabled": self.enabled,
+            "buffered": len(self._buffer),
+            "max_buffer_rows": self.max_buffer_rows,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "copy_flushes": self.copy_flushes,
+            "insert_flushes": self.insert_flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "last_flush_rows": self.last_flush_rows,
+            "last_flush_seconds": round(self.last_flush_seconds, 4),
+            "partitions_ahead": self.partitions_created,
+            "partitions_dropped": self.partitions_dropped,
+            "expired_rows": self.expired_rows
+        }
+
+    async def _copy(self, rows: List[Tuple]):
+        records = [row[:-1] + (json.dumps(row[-1]) if row[-1] is not None else None,) for row in rows]
+        async with async_engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                Telemetry.__tablename__, records=records, columns=TELEMETRY_COLUMNS
+            )
+
+    async def _insert(self, rows: List[Tuple]):
+        params = [
+            {
+                "vehicle_id": row[0], "recorded_at": row[1], "driver_id": row[2],
+                "latitude": row[3], "longitude": row[4], "speed": row[5],
+                "heading": row[6], "ping_metadata": row[7]
+            }
+            for row in rows
+        ]
+        async with AsyncSessionLocal() as db:
+            await db.execute(upsert_insert(db, Telemetry).on_conflict_do_nothing(), params)
+            await db.commit()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+                if time.monotonic() - self._last_maintenance >= 3600:
+                    await self.maintain_partitions()
+            except Exception as e:
+                print(f"Error in telemetry writer: {e}")
+                await asyncio.sleep(5)
+
+
+telemetry_writer = TelemetryWriter(
+    flush_rows=settings.TELEMETRY_FLUSH_ROWS,
+    flush_interval_seconds=settings.TELEMETRY_FLUSH_INTERVAL_SECONDS,
+    max_buffer_rows=settings.TELEMETRY_MAX_BUFFER_ROWS,
+    enabled=settings.TELEMETRY_ENABLED
+)
@@ -0,0 +1,114 @@
+"""
+Hierarchical timer wheel
+
+Schedules very large numbers of timers (one per vehicle with a pending stop)
+without an asyncio task or heap entry per timer: inserting and cancelling are
+O(1), and advancing costs O(1) per tick plus the timers that expire or
+cascade down from a coarser wheel.
+"""
+
+from typing import Any, List
+
+
+class Timer:
+    """Handle for a scheduled timer; cancel() is O(1) (lazy removal)"""
+
+    __slots__ = ("expires_tick", "item", "cancelled")
+
+    def __init__(self, expires_tick: int, item: Any):
+        self.expires_tick = expires_tick
+        self.item = item
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class HierarchicalTimerWheel:
+    """
+    Timer wheel with `levels` wheels of `slots` slots each
+
+    Level 0 slots are one tick wide, level 1 slots are `slots` ticks wide and
+    so on, so with the defaults (1 s ticks, 4 levels of 64 slots) deadlines up
+    to ~194 days are scheduled exactly. Later deadlines are parked in the
+    coarsest wheel and re-scheduled as it turns.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 64, levels: int = 4, start_time: float = 0.0):
+        self.tick_seconds = tick_seconds
+        self.slots = slots
+        self.levels = levels
+        self._wheels: List[List[List[Timer]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._tick = int(start_time // tick_seconds)
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Number of scheduled timers, including cancelled ones not yet swept"""
+        return self._count
+
+    def schedule(self, deadline: float, item: Any) -> Timer:
+        """Schedule item to expire at `deadline` (same clock as advance)"""
+        expires_tick = max(int(-(-deadline // self.tick_seconds)), self._tick + 1)
+        timer = Timer(expires_tick, item)
+        self._insert(timer)
+        self._count += 1
+        return timer
+
+    def advance(self, now: float) -> List[Any]:
+        """
+        Move the wheel forward to `now`
+
+        Returns:
+            Items of all non-cancelled timers that expired
+        """
+        target = int(now // self.tick_seconds)
+        expired = []
+        if self._count == 0:
+            self._tick = max(self._tick, target)
+            return expired
+
+        while self._tick < target:
+            self._tick += 1
+            self._cascade()
+
+            bucket = self._wheels[0][self._tick % self.slots]
+            if not bucket:
+                continue
+            self._wheels[0][self._tick % self.slots] = []
+            for timer in bucket:
+                if timer.cancelled:
+                    self._count -= 1
+                elif timer.expires_tick <= self._tick:
+                    self._count -= 1
+                    expired.append(timer.item)
+                else:
+                    self._insert(timer)
+        return expired
+
+    def _insert(self, timer: Timer):
+        delta = timer.expires_tick - self._tick
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span or level == self.levels - 1:
+                slot = (timer.expires_tick // (span // self.slots)) % self.slots
+                self._wheels[level][slot].append(timer)
+                return
+            span *= self.slots
+
+    def _cascade(self):
+        # When a wheel completes a turn, re-insert the next slot of the coarser wheel
+        width = 1
+        for level in range(1, self.levels):
+            width *= self.slots
+            if self._tick % width:
+                return
+            slot = (self._tick // width) % self.slots
+            bucket = self._wheels[level][slot]
+            if not bucket:
+                continue
+            self._wheels[level][slot] = []
+            for timer in bucket:
+                if timer.cancelled:
+                    self._count -= 1
+                else:
+                    self._insert(timer)
@@ -1,26 +1,85 @@
 """
 Twilio SMS service
+
+send_sms is the blocking, one-off sender (scripts). The workers use
+twilio_sender: one long-lived async client whose HTTP connections are
+reused, with a concurrency limit and a token bucket per sending number
+matching Twilio's per-number throughput.
 """
 
+import asyncio
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from twilio.http.async_http_client import AsyncTwilioHttpClient
 from twilio.rest import Client
-from typing import Optional, Tuple
 from app.config import settings
+from app.services.retries import PermanentError, TransientError
+
+
+def _credentials() -> Optional[Tuple[str, str]]:
+    if not settings.TWILIO_ACCOUNT_SID or not settings.TWILIO_AUTH_TOKEN:
+        return None
+    return settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN
+
+
+def _configure(client: Client) -> Client:
+    if settings.TWILIO_API_BASE_URL:
+        # A local stand-in, e.g. scripts/benchmark_twilio.py
+        client.api.base_url = settings.TWILIO_API_BASE_URL.rstrip("/")
+    return client
 
 
+@lru_cache(maxsize=1)
 def get_twilio_client() -> Optional[Client]:
     """
     Get Twilio client with credentials from environment variables
     
+    The client (and its HTTP session) is created once and reused.
+    
     Returns:
         Twilio Client instance or None if credentials not available
     """
-    account_sid = settings.TWILIO_ACCOUNT_SID
-    auth_token = settings.TWILIO_AUTH_TOKEN
-    
-    if not account_sid or not auth_token:
+    credentials = _credentials()
+    if not credentials:
         return None
     
-    return Client(account_sid, auth_token)
+    return _configure(Client(*credentials))
+
+
+def _message_params(to_phone: str, message_body: str, from_number: str,
+                    status_callback_url: Optional[str]) -> dict:
+    message_params = {
+        "body": message_body,
+        "from_": from_number,
+        "to": to_phone
+    }
+    
+    # Add status callback if provided and valid
+    # This allows us to track delivery status updates
+    # Note: Invalid callback URLs can cause Twilio to reject the message
+    if status_callback_url:
+        # Validate that it's a proper HTTP/HTTPS URL
+        if status_callback_url.startswith(('http://', 'https://')):
+            message_params["status_callback"] = status_callback_url
+        else:
+            print(f"  Warning: Invalid status callback URL format, skipping: {status_callback_url}")
+    return message_params
+
+
+def _log_send_error(error_msg: str):
+    print(f"✗ Error sending SMS via Twilio: {error_msg}")
+    
+    # Provide helpful error messages
+    if "not verified" in error_msg.lower() or "unverified" in error_msg.lower():
+        print("  → Twilio trial accounts can only send to verified numbers.")
+        print("  → Verify the number in Twilio Console or upgrade your account.")
+    elif "invalid" in error_msg.lower() and "phone" in error_msg.lower():
+        print("  → Phone number format is invalid. Use E.164 format: +1234567890")
+    elif "insufficient" in error_msg.lower() or "balance" in error_msg.lower():
+        print("  → Twilio account has insufficient balance.")
 
 
 def send_sms(to_phone: str, message_body: str, status_callback_url: Optional[str] = None) -> Tuple[bool, Optional[str]]:
@@ -52,25 +111,9 @@ def send_sms(to_phone: str, message_body: str, status_callback_url: Optional[str
         
         print(f"Attempting to send SMS from {from_number} to {to_phone}...")
         
-        # Build message parameters
-        message_params = {
-            "body": message_body,
-            "from_": from_number,
-            "to": to_phone
-        }
-        
-        # Add status callback if provided and valid
-        # This allows us to track delivery status updates
-        # Note: Invalid callback URLs can cause Twilio to reject the message
-        if status_callback_url:
-            # Validate that it's a proper HTTP/HTTPS URL
-            if status_callback_url.startswith(('http://', 'https://')):
-                message_params["status_callback"] = status_callback_url
-                print(f"  Status callback URL: {status_callback_url}")
-            else:
-                print(f"  Warning: Invalid status callback URL format, skipping: {status_callback_url}")
-        
-        message = client.messages.create(**message_params)
+        message = client.messages.create(
+            **_message_params(to_phone, message_body, from_number, status_callback_url)
+        )
         
         # If we got a message SID, Twilio accepted the message
         # For virtual-to-virtual, this means it was processed even if status shows differently
@@ -82,17 +125,174 @@ def send_sms(to_phone: str, message_body: str, status_callback_url: Optional[str
         return True, message.sid
     
     except Exception as e:
-        error_msg = str(e)
-        print(f"✗ Error sending SMS via Twilio: {error_msg}")
+        _log_send_error(str(e))
+        return False, None
+
+
+class TokenBucket:
+    """
+    Rate limiter handing out send slots at `rate` per second, with bursts of
+    up to `burst` (GCRA: each caller reserves the next slot, so waiters are
+    served in arrival order without polling)
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.interval = 1.0 / rate
+        self.tolerance = (max(burst, 1) - 1) * self.interval
+        self._theoretical_arrival = 0.0
+
+    def reserve(self) -> float:
+        """Reserve the next slot; returns how many seconds to wait for it"""
+        now = time.monotonic()
+        arrival = max(self._theoretical_arrival, now)
+        self._theoretical_arrival = arrival + self.interval
+        return max(arrival - self.tolerance - now, 0.0)
+
+    async def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class TwilioSender:
+    """
+    Long-lived async Twilio sender
+
+    One aiohttp session (keep-alive connection pool) is shared by all sends.
+    At most `concurrency` requests are in flight, and each sending number
+    is limited to `rate_per_number` messages per second by its own token
+    bucket. Waiting for a slot does not hold a concurrency permit.
+    """
+
+    def __init__(self, concurrency: int, rate_per_number: float, burst: int, timeout_seconds: float):
+        self.concurrency = concurrency
+        self.rate_per_number = rate_per_number
+        self.burst = burst
+        self.timeout_seconds = timeout_seconds
+        self._client: Optional[Client] = None
+        self._http_client: Optional[AsyncTwilioHttpClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._buckets: Dict[str, TokenBucket] = {}
+        self.sent = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.rate_limited = 0
+        self.rate_limit_wait_seconds = 0.0
+
+    async def start(self):
+        """Open the HTTP session (on the running event loop)"""
+        credentials = _credentials()
+        if not credentials or self._client is not None:
+            return
+        self._http_client = AsyncTwilioHttpClient(pool_connections=False, timeout=self.timeout_seconds)
+        self._http_client.session = ClientSession(
+            connector=TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+            timeout=ClientTimeout(total=self.timeout_seconds)
+        )
+        self._client = _configure(Client(*credentials, http_client=self._http_client))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def stop(self):
+        """Close the HTTP session"""
+        if self._http_client is not None:
+            await self._http_client.close()
+        self._client = None
+        self._http_client = None
+
+    def _bucket(self, from_number: str) -> TokenBucket:
+        bucket = self._buckets.get(from_number)
+        if bucket is None:
+            bucket = self._buckets[from_number] = TokenBucket(self.rate_per_number, self.burst)
+        return bucket
+
+    async def send(self, to_phone: str, message_body: str, from_number: Optional[str] = None,
+                   status_callback_url: Optional[str] = None,
+                   raise_errors: bool = False) -> Tuple[bool, Optional[str]]:
+        """
+        Send one SMS (same contract as send_sms)
+
+        With raise_errors, failures are raised instead of returned, so the
+        caller can tell a retryable error (TwilioRestException 429/5xx,
+        network errors) from a permanent one (see app.services.retries).
+
+        Returns:
+            Tuple of (success: bool, message_sid: Optional[str])
+        """
+        if self._client is None:
+            await self.start()
+        if self._client is None:
+            print("Error: Twilio client not available. Check TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN")
+            if raise_errors:
+                raise PermanentError("Twilio client not available")
+            return False, None
+        from_number = from_number or settings.TWILIO_NUMBER
+        if not from_number:
+            print("Error: Twilio phone number not configured. Set TWILIO_NUMBER environment variable")
+            if raise_errors:
+                raise PermanentError("TWILIO_NUMBER not configured")
+            return False, None
         
-        # Provide helpful error messages
-        if "not verified" in error_msg.lower() or "unverified" in error_msg.lower():
-            print("  → Twilio trial accounts can only send to verified numbers.")
-            print("  → Verify the number in Twilio Console or upgrade your account.")
-        elif "invalid" in error_msg.lower() and "phone" in error_msg.lower():
-            print("  → Phone number format is invalid. Use E.164 format: +1234567890")
-        elif "insufficient" in error_msg.lower() or "balance" in error_msg.lower():
-            print("  → Twilio account has insufficient balance.")
+        waited = await self._bucket(from_number).acquire()
+        if waited:
+            self.rate_limited += 1
+            self.rate_limit_wait_seconds += waited
         
-        return False, None
+        async with self._semaphore:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            try:
+                # The Twilio client passes timeout=None to aiohttp, overriding the
+                # session's ClientTimeout, so the deadline is enforced here
+                message = await asyncio.wait_for(
+                    self._client.messages.create_async(
+                        **_message_params(to_phone, message_body, from_number, status_callback_url)
+                    ),
+                    self.timeout_seconds
+                )
+            except asyncio.TimeoutError:
+                self.failed += 1
+                self.timeouts += 1
+                _log_send_error(f"Twilio request timed out after {self.timeout_seconds}s")
+                if raise_errors:
+                    raise TransientError(f"Twilio request timed out after {self.timeout_seconds}s")
+                return False, None
+            except Exception as e:
+                self.failed += 1
+                _log_send_error(str(e))
+                if raise_errors:
+                    raise
+                return False, None
+            finally:
+                self.in_flight -= 1
+        
+        self.sent += 1
+        return True, message.sid
+
+    async def send_many(self, messages: Iterable[Tuple[str, str]]) -> List[Tuple[bool, Optional[str]]]:
+        """Send (to_phone, body) pairs concurrently; results in input order"""
+        return await asyncio.gather(*(self.send(to_phone, body) for to_phone, body in messages))
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "concurrency": self.concurrency,
+            "rate_per_number": self.rate_per_number,
+            "rate_limited": self.rate_limited,
+            "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 3)
+        }
+
+
+twilio_sender = TwilioSender(
+    settings.TWILIO_MAX_CONCURRENCY,
+    settings.TWILIO_RATE_PER_NUMBER,
+    settings.TWILIO_BURST_PER_NUMBER,
+    settings.TWILIO_TIMEOUT_SECONDS
+)
 
@@ -0,0 +1,107 @@
+"""
+In-memory per-vehicle state store for stop/move detection
+"""
+
+import threading
+from collections import OrderedDict
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Iterable, Optional
+
+from app.config import settings
+from app.services.event_detector import get_vehicle_states
+
+
+class VehicleState:
+    """Current detection state of one vehicle"""
+
+    __slots__ = ("state", "open_event_id")
+
+    def __init__(self, state: str = "move", open_event_id: Optional[int] = None):
+        self.state = state
+        self.open_event_id = open_event_id
+
+
+class VehicleStateStore:
+    """
+    Bounded LRU cache of vehicle states
+
+    Entries are warmed lazily from the events table on first use and then
+    kept current as a write-through: callers must call `set` only after the
+    transaction that changed the state has committed, and `invalidate` when
+    it rolled back.
+
+    The store is per process. When running several app processes, route a
+    vehicle's webhooks to one process or keep the cache size at 0.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, VehicleState]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get_many(self, db: AsyncSession, vehicle_ids: Iterable[str]) -> Dict[str, VehicleState]:
+        """
+        Get states for several vehicles, loading all misses with one query
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for vehicle_id in set(vehicle_ids):
+                entry = self._entries.get(vehicle_id)
+                if entry is None:
+                    missing.append(vehicle_id)
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(vehicle_id)
+                    found[vehicle_id] = entry
+                    self.hits += 1
+
+        if missing:
+            for vehicle_id, (state, open_event) in (await get_vehicle_states(db, missing)).items():
+                entry = VehicleState(state=state, open_event_id=open_event.id if open_event else None)
+                found[vehicle_id] = entry
+                self._put(vehicle_id, entry)
+
+        return found
+
+    async def get(self, db: AsyncSession, vehicle_id: str) -> VehicleState:
+        """Get state for one vehicle, loading it from the database on a miss"""
+        return (await self.get_many(db, [vehicle_id]))[vehicle_id]
+
+    def set(self, vehicle_id: str, state: str, open_event_id: Optional[int]):
+        """Record a committed state change"""
+        self._put(vehicle_id, VehicleState(state, open_event_id))
+
+    def invalidate(self, vehicle_ids: Iterable[str]):
+        """Drop vehicles so their states are reloaded from the database"""
+        with self._lock:
+            for vehicle_id in vehicle_ids:
+                self._entries.pop(vehicle_id, None)
+
+    def stats(self) -> dict:
+        """Cache size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+    def _put(self, vehicle_id: str, entry: VehicleState):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[vehicle_id] = entry
+            self._entries.move_to_end(vehicle_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+vehicle_state_store = VehicleStateStore(settings.VEHICLE_STATE_CACHE_SIZE)
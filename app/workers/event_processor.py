@@ -1,144 +1,269 @@
 """
-Background worker to process events from SQS
+Background worker to process events from the events queue
 """
 
 import asyncio
 import json
-import boto3
-from sqlalchemy.orm import Session
-from typing import Optional
+import time
+from typing import List, Optional
 
-from app.database import SessionLocal
+from sqlalchemy import insert, select
+
+from app.database import AsyncSessionLocal
 from app.models import Driver, Event, Message
 from app.config import settings
+from app.services.event_cache import event_detail_cache
+from app.services.live_feed import live_feed, publish_message_status
+from app.services.rollups import RollupDeltas, add_rollups
 from app.services.slack import send_slack_notification
+from app.services.queue_consumer import QueueConsumer
+from app.services.outbox import add_to_outbox
+from app.services.queues import QueueMessage
+from app.services.retries import PermanentError
 
-sqs = boto3.client('sqs', region_name=settings.AWS_REGION)
 _running = False
 _task: Optional[asyncio.Task] = None
 
 
-async def process_event_message(message_body: str):
+class BatchTimings:
+    """Time spent per phase of processed batches"""
+
+    PHASES = ("load", "insert", "enqueue", "notify")
+
+    def __init__(self):
+        self.batches = 0
+        self.messages = 0
+        self.sms_jobs = 0
+        self.seconds = dict.fromkeys(self.PHASES + ("total",), 0.0)
+        self.max_batch_seconds = 0.0
+        self.last: dict = {}
+
+    def record(self, messages: int, sms_jobs: int, phases: dict):
+        total = sum(phases.values())
+        self.batches += 1
+        self.messages += messages
+        self.sms_jobs += sms_jobs
+        for phase, seconds in phases.items():
+            self.seconds[phase] += seconds
+        self.seconds["total"] += total
+        self.max_batch_seconds = max(self.max_batch_seconds, total)
+        self.last = {"messages": messages, "sms_jobs": sms_jobs, **{p: round(s, 4) for p, s in phases.items()}}
+        print(
+            f"Event batch: {messages} messages, {sms_jobs} SMS jobs in {total * 1000:.0f} ms ("
+            + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items()) + ")"
+        )
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "messages": self.messages,
+            "sms_jobs": self.sms_jobs,
+            "seconds": {phase: round(seconds, 3) for phase, seconds in self.seconds.items()},
+            "avg_batch_ms": round(self.seconds["total"] / self.batches * 1000, 1) if self.batches else None,
+            "max_batch_ms": round(self.max_batch_seconds * 1000, 1),
+            "last_batch": self.last
+        }
+
+
+timings = BatchTimings()
+
+
+def _parse(message: QueueMessage) -> Optional[dict]:
+    try:
+        data = json.loads(message.body)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) and data.get("event_id") is not None else None
+
+
+async def _notify(slack_messages: List[str]):
+    """Post Slack notifications concurrently, at most EVENT_NOTIFY_CONCURRENCY at a time"""
+    semaphore = asyncio.Semaphore(settings.EVENT_NOTIFY_CONCURRENCY)
+
+    async def post(text: str):
+        async with semaphore:
+            await asyncio.to_thread(send_slack_notification, text)
+
+    await asyncio.gather(*(post(text) for text in slack_messages), return_exceptions=True)
+
+
+async def process_batch(messages: List[QueueMessage]) -> List[Optional[BaseException]]:
     """
-    Process a single event message from SQS
-    
-    Creates SMS job and sends Slack notification
+    Process a received batch of event messages together
+
+    Events, drivers and the events already messaged are loaded with one IN
+    query each (a redelivered event is skipped, within the batch too), the
+    outbound Message rows are inserted with one statement, their SMS jobs
+    are staged in the outbox in the same transaction (the outbox relay
+    delivers them), everything is committed once and Slack notifications
+    are posted concurrently.
+
+    Returns:
+        One outcome per message: None if done, else the error it failed
+        with. Malformed messages and missing events fail permanently; if
+        the batch cannot be committed, every other message fails with that
+        error and is retried.
     """
+    phases = dict.fromkeys(BatchTimings.PHASES, 0.0)
+    started = time.monotonic()
+    outcomes: List[Optional[BaseException]] = [None] * len(messages)
+    jobs = []
+    for i, msg in enumerate(messages):
+        data = _parse(msg)
+        if data is None:
+            outcomes[i] = PermanentError(f"Malformed event message: {msg.body[:200]!r}")
+        else:
+            jobs.append((i, data))
+    if not jobs:
+        return outcomes
+
     try:
-        event_data = json.loads(message_body)
-        event_id = event_data.get("event_id")
-        driver_id = event_data.get("driver_id")
-        vehicle_id = event_data.get("vehicle_id")
-        latitude = event_data.get("latitude")
-        longitude = event_data.get("longitude")
-        timestamp = event_data.get("timestamp")
-        
-        db = SessionLocal()
-        try:
-            # Get event
-            event = db.query(Event).filter(Event.id == event_id).first()
-            if not event:
-                print(f"Event {event_id} not found")
-                return
-            
-            # Get driver
-            driver = None
-            if driver_id:
-                driver = db.query(Driver).filter(Driver.id == driver_id).first()
-            
-            if not driver or not driver.phone:
-                print(f"Driver {driver_id} not found or has no phone number")
-                return
-            
-            # Compose SMS message
-            sms_body = (
-                f"DriverBuddy: Vehicle {vehicle_id} stopped at "
-                f"{latitude:.4f},{longitude:.4f} at {timestamp}. "
-                f"Reply to this SMS."
-            )
-            
-            # Create outbound message record
-            message = Message(
-                event_id=event_id,
-                driver_id=driver_id,
-                direction="outbound",
-                body=sms_body,
-                from_phone=settings.TWILIO_NUMBER,
-                to_phone=driver.phone,
-                status="pending"
-            )
-            db.add(message)
-            db.commit()
-            db.refresh(message)
-            
-            # Enqueue SMS job to SMS queue
-            queue_url = sqs.get_queue_url(QueueName=settings.SQS_SMS_QUEUE)['QueueUrl']
-            sqs.send_message(
-                QueueUrl=queue_url,
-                MessageBody=json.dumps({
+        async with AsyncSessionLocal() as db:
+            event_ids = {data["event_id"] for _, data in jobs}
+            driver_ids = {data["driver_id"] for _, data in jobs if data.get("driver_id")}
+            events = {
+                event.id: event
+                for event in (await db.execute(select(Event).where(Event.id.in_(event_ids)))).scalars()
+            }
+            drivers = {
+                driver.id: driver
+                for driver in (await db.execute(select(Driver).where(Driver.id.in_(driver_ids)))).scalars()
+            } if driver_ids else {}
+            # Events already messaged: redeliveries (lost acks or leases,
+            # retries, duplicate relay sends) must not text the driver again
+            messaged = set((await db.execute(
+                select(Message.event_id).where(Message.event_id.in_(event_ids), Message.direction == "outbound")
+            )).scalars())
+            phases["load"] = time.monotonic() - started
+
+            sends = []
+            for i, data in jobs:
+                event_id = data["event_id"]
+                driver_id = data.get("driver_id")
+                event = events.get(event_id)
+                driver = drivers.get(driver_id)
+                if not event:
+                    # Events are committed with their outbox entries
+                    outcomes[i] = PermanentError(f"Event {event_id} not found")
+                elif event_id in messaged:
+                    print(f"Event {event_id} already has an outbound message, skipping")
+                elif not driver or not driver.phone:
+                    print(f"Driver {driver_id} not found or has no phone number")
+                else:
+                    try:
+                        # Compose SMS message
+                        sms_body = (
+                            f"DriverBuddy: Vehicle {data.get('vehicle_id')} stopped at "
+                            f"{data['latitude']:.4f},{data['longitude']:.4f} at {data.get('timestamp')}. "
+                            f"Reply to this SMS."
+                        )
+                    except (KeyError, TypeError, ValueError) as e:
+                        outcomes[i] = PermanentError(f"Malformed event message: {e!r}")
+                    else:
+                        sends.append((data, event, driver, sms_body))
+                        messaged.add(event_id)
+            if not sends:
+                timings.record(len(messages), 0, phases)
+                return outcomes
+
+            # Create outbound message records
+            insert_started = time.monotonic()
+            rows = (await db.scalars(
+                insert(Message).returning(Message, sort_by_parameter_order=True),
+                [
+                    {
+                        "event_id": event.id,
+                        "driver_id": driver.id,
+                        "direction": "outbound",
+                        "body": sms_body,
+                        "from_phone": settings.TWILIO_NUMBER,
+                        "to_phone": driver.phone,
+                        "status": "pending"
+                    }
+                    for _, event, driver, sms_body in sends
+                ]
+            )).all()
+            rollups = RollupDeltas()
+            for _, event, driver, _ in sends:
+                rollups.message(event.vehicle_id, driver.id, "outbound")
+            await add_rollups(db, rollups)
+            phases["insert"] = time.monotonic() - insert_started
+
+            # Stage SMS jobs: committed with their Message rows or not at all
+            enqueue_started = time.monotonic()
+            await add_to_outbox(db, settings.SQS_SMS_QUEUE, [
+                {
                     "message_id": message.id,
-                    "to_phone": driver.phone,
-                    "body": sms_body,
-                    "event_id": event_id
-                })
-            )
-            
-            # Send Slack notification
-            slack_message = (
-                f"🚛 Vehicle {vehicle_id} stopped\n"
-                f"Driver: {driver.name} ({driver.phone})\n"
-                f"Location: {latitude:.4f}, {longitude:.4f}\n"
-                f"Time: {timestamp}"
-            )
-            send_slack_notification(slack_message)
-            
-        finally:
-            db.close()
-    
+                    "to_phone": message.to_phone,
+                    "body": message.body,
+                    "event_id": message.event_id
+                }
+                for message in rows
+            ])
+            await db.commit()
+            phases["enqueue"] = time.monotonic() - enqueue_started
     except Exception as e:
-        print(f"Error processing event message: {e}")
+        print(f"Error processing event batch: {e!r}")
+        # Nothing was committed: every parsed message is retried or dead-lettered
+        for i, _ in jobs:
+            if outcomes[i] is None:
+                outcomes[i] = e
+        return outcomes
+
+    # Committed with their SMS jobs: from here on failures are logged, the
+    # messages are still done (a retry would insert their Message rows again)
+    for message in rows:
+        event_detail_cache.invalidate(message.event_id)
+    if live_feed.subscribers:
+        try:
+            async with AsyncSessionLocal() as db:
+                for message, (_, event, _, _) in zip(rows, sends):
+                    await publish_message_status(db, message, event.vehicle_id)
+        except Exception as e:
+            print(f"Error publishing message status: {e}")
 
+    # Send Slack notifications
+    notify_started = time.monotonic()
+    await _notify([
+        f"🚛 Vehicle {data.get('vehicle_id')} stopped\n"
+        f"Driver: {driver.name} ({driver.phone})\n"
+        f"Location: {data['latitude']:.4f}, {data['longitude']:.4f}\n"
+        f"Time: {data.get('timestamp')}"
+        for data, _, driver, _ in sends
+    ])
+    phases["notify"] = time.monotonic() - notify_started
 
-async def poll_sqs_queue():
+    timings.record(len(messages), len(rows), phases)
+    return outcomes
+
+
+consumer = QueueConsumer(
+    "events",
+    settings.SQS_EVENTS_QUEUE,
+    process_batch,
+    wait_seconds=settings.QUEUE_WAIT_SECONDS,
+    visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT_SECONDS,
+    prefetch=settings.QUEUE_PREFETCH
+)
+
+
+async def poll_queue():
     """
-    Poll SQS queue for event messages
+    Poll the events queue until stopped
     """
-    queue_url = sqs.get_queue_url(QueueName=settings.SQS_EVENTS_QUEUE)['QueueUrl']
-    
-    while _running:
-        try:
-            # Receive messages from SQS
-            response = sqs.receive_message(
-                QueueUrl=queue_url,
-                MaxNumberOfMessages=10,
-                WaitTimeSeconds=20,  # Long polling
-                VisibilityTimeout=60
-            )
-            
-            messages = response.get('Messages', [])
-            for msg in messages:
-                try:
-                    await process_event_message(msg['Body'])
-                    # Delete message after successful processing
-                    sqs.delete_message(
-                        QueueUrl=queue_url,
-                        ReceiptHandle=msg['ReceiptHandle']
-                    )
-                except Exception as e:
-                    print(f"Error processing message: {e}")
-                    # Message will become visible again after visibility timeout
-                    # and will be retried (up to maxReceiveCount)
-        
-        except Exception as e:
-            print(f"Error polling SQS queue: {e}")
-            await asyncio.sleep(5)
+    await consumer.run()
+
+
+def stats() -> dict:
+    """Consumer counters and batch timings"""
+    return {**consumer.stats(), "batch_timings": timings.stats()}
 
 
 async def start():
     """Start the event processor worker"""
     global _running, _task
     _running = True
-    _task = asyncio.create_task(poll_sqs_queue())
+    _task = asyncio.create_task(poll_queue())
     print("Event processor worker started")
 
 
@@ -146,6 +271,7 @@ def stop():
     """Stop the event processor worker"""
     global _running
     _running = False
+    consumer.stop()
     if _task:
         _task.cancel()
 
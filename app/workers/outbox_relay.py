@@ -0,0 +1,186 @@
+"""
+Background worker relaying outbox rows to the job queue backend
+"""
+
+import asyncio
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, or_, select, update
+from typing import Optional
+
+from app.database import AsyncSessionLocal
+from app.models import DeadLetter, OutboxMessage
+from app.config import settings
+from app.services.queues import get_queue_backend
+from app.services.retries import RetryPolicy
+
+PURGE_INTERVAL_SECONDS = 300
+PURGE_CHUNK_ROWS = 5000
+
+# Same backoff schedule as the queue consumers, with the outbox's own cap
+backoff = RetryPolicy(
+    settings.OUTBOX_MAX_ATTEMPTS, settings.RETRY_BASE_DELAY_SECONDS, settings.RETRY_MAX_DELAY_SECONDS
+)
+
+_running = False
+_task: Optional[asyncio.Task] = None
+
+
+async def _send_batch(queue: str, rows: list) -> set:
+    """
+    Send outbox rows with one send_batch call
+
+    Returns:
+        Ids of the rows the queue accepted
+    """
+    entries = []
+    for row in rows:
+        # A relay dying between send and commit sends the row again; the
+        # consumers are idempotent (events already messaged and SMS already
+        # sent are skipped)
+        entry = {"id": str(row.id), "body": json.dumps(row.payload)}
+        if queue.endswith(".fifo"):
+            entry["dedup_id"] = str(row.id)
+            entry["group_id"] = str(row.payload.get("vehicle_id") or queue)
+        entries.append(entry)
+
+    accepted = await get_queue_backend().send_batch(queue, entries)
+    return {int(entry_id) for entry_id in accepted}
+
+
+async def relay_batch() -> int:
+    """
+    Deliver one batch of due, undelivered outbox rows
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several relays
+    can run in parallel without sending the same row twice. The row locks are
+    held until delivery is recorded.
+
+    A row that fails to send is retried after an exponential backoff (so a
+    broken queue's rows do not crowd out the others' every poll) and moved to
+    dead_letters after OUTBOX_MAX_ATTEMPTS sends.
+
+    Returns:
+        Number of rows delivered
+    """
+    now = datetime.now(timezone.utc)
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            select(OutboxMessage)
+            .where(
+                OutboxMessage.delivered_at.is_(None),
+                or_(OutboxMessage.next_attempt_at.is_(None), OutboxMessage.next_attempt_at <= now)
+            )
+            .order_by(OutboxMessage.id)
+            .limit(settings.OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )).scalars().all()
+        if not rows:
+            return 0
+
+        by_queue = defaultdict(list)
+        for row in rows:
+            by_queue[row.queue].append(row)
+
+        delivered_ids = set()
+        errors = {}
+        for queue, queue_rows in by_queue.items():
+            try:
+                delivered_ids |= await _send_batch(queue, queue_rows)
+            except Exception as e:
+                errors[queue] = f"{type(e).__name__}: {e}"
+                print(f"Error relaying outbox messages to {queue}: {e}")
+
+        if delivered_ids:
+            await db.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(delivered_ids))
+                .values(delivered_at=now, attempts=OutboxMessage.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+        dead = []
+        for row in rows:
+            if row.id in delivered_ids:
+                continue
+            row.attempts += 1
+            if row.attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                row.next_attempt_at = now + timedelta(seconds=backoff.backoff(row.attempts))
+                continue
+            dead.append(row)
+            db.add(DeadLetter(
+                queue=row.queue,
+                message_id=f"outbox:{row.id}",
+                body=json.dumps(row.payload),
+                attempts=row.attempts,
+                error_kind="exhausted",
+                error=errors.get(row.queue, "Not accepted by the queue")[:2000]
+            ))
+            await db.delete(row)
+        await db.commit()
+        for row in dead:
+            print(f"Dead-lettered outbox row {row.id} for {row.queue} after {row.attempts} attempts")
+
+        return len(delivered_ids)
+
+
+async def purge_delivered() -> int:
+    """
+    Delete rows delivered more than OUTBOX_RETENTION_HOURS ago, a chunk per transaction
+
+    Returns:
+        Number of rows deleted
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+    purged = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            ids = (await db.execute(
+                select(OutboxMessage.id)
+                .where(OutboxMessage.delivered_at < cutoff)
+                .limit(PURGE_CHUNK_ROWS)
+            )).scalars().all()
+            if not ids:
+                return purged
+            await db.execute(delete(OutboxMessage).where(OutboxMessage.id.in_(ids)))
+            await db.commit()
+        purged += len(ids)
+
+
+async def poll_outbox():
+    """
+    Relay outbox rows until stopped, sleeping only when the outbox is drained
+
+    Delivered rows past their retention are purged every PURGE_INTERVAL_SECONDS.
+    """
+    last_purge = None
+    while _running:
+        try:
+            if last_purge is None or time.monotonic() - last_purge >= PURGE_INTERVAL_SECONDS:
+                last_purge = time.monotonic()
+                purged = await purge_delivered()
+                if purged:
+                    print(f"Purged {purged} delivered outbox rows")
+            delivered = await relay_batch()
+            if delivered < settings.OUTBOX_BATCH_SIZE:
+                await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL_SECONDS)
+        except Exception as e:
+            print(f"Error relaying outbox: {e}")
+            await asyncio.sleep(5)
+
+
+async def start():
+    """Start the outbox relay worker"""
+    global _running, _task
+    _running = True
+    _task = asyncio.create_task(poll_outbox())
+    print("Outbox relay worker started")
+
+
+def stop():
+    """Stop the outbox relay worker"""
+    global _running
+    _running = False
+    if _task:
+        _task.cancel()
@@ -0,0 +1,63 @@
+"""
+Background worker recomputing recent fleet rollup buckets
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from app.database import async_engine
+from app.config import settings
+from app.services.rollups import compact_rollups
+
+_running = False
+_task: Optional[asyncio.Task] = None
+
+
+async def compact_recent() -> int:
+    """
+    Recompute the days overlapping the last ROLLUP_COMPACT_LOOKBACK_HOURS
+
+    Picks up late-arriving events and messages and collapses the counter
+    shards of those buckets into one row each.
+
+    Returns:
+        Number of rollup rows corrected
+    """
+    now = datetime.now(timezone.utc)
+    async with async_engine.connect() as conn:
+        return await conn.run_sync(
+            compact_rollups, now - timedelta(hours=settings.ROLLUP_COMPACT_LOOKBACK_HOURS), now
+        )
+
+
+async def poll_compaction():
+    """
+    Compact every ROLLUP_COMPACT_INTERVAL_SECONDS until stopped
+    """
+    while _running:
+        await asyncio.sleep(settings.ROLLUP_COMPACT_INTERVAL_SECONDS)
+        try:
+            started = asyncio.get_running_loop().time()
+            rows = await compact_recent()
+            print(f"Rollups compacted: {rows} rows in {asyncio.get_running_loop().time() - started:.2f}s")
+        except Exception as e:
+            print(f"Error compacting rollups: {e}")
+
+
+async def start():
+    """Start the rollup compactor worker"""
+    global _running, _task
+    if settings.ROLLUP_COMPACT_INTERVAL_SECONDS <= 0:
+        return
+    _running = True
+    _task = asyncio.create_task(poll_compaction())
+    print("Rollup compactor worker started")
+
+
+def stop():
+    """Stop the rollup compactor worker"""
+    global _running
+    _running = False
+    if _task:
+        _task.cancel()
@@ -4,106 +4,120 @@ Background worker to send SMS messages via Twilio
 
 import asyncio
 import json
-import boto3
-from sqlalchemy.orm import Session
-from typing import Optional
+from typing import List, Optional
 
-from app.database import SessionLocal
+from app.database import AsyncSessionLocal
 from app.models import Message
 from app.config import settings
-from app.services.twilio_service import send_sms
+from app.services.event_cache import event_detail_cache
+from app.services.live_feed import live_feed, publish_message_status
+from app.services.queue_consumer import QueueConsumer
+from app.services.queues import QueueMessage
+from app.services.retries import PermanentError
+from app.services.twilio_service import twilio_sender
 
-sqs = boto3.client('sqs', region_name=settings.AWS_REGION)
 _running = False
 _task: Optional[asyncio.Task] = None
 
 
-async def process_sms_message(message_body: str):
+async def process_sms_message(msg: QueueMessage):
     """
-    Process a single SMS message from SQS
+    Process a single SMS message from the SMS queue
     
-    Sends SMS via Twilio and updates message record
+    Sends SMS via Twilio and updates message record. Errors are raised for
+    the retry policy; the message is marked failed once it will not be
+    retried (a permanent error or the last attempt).
     """
     try:
-        sms_data = json.loads(message_body)
-        message_id = sms_data.get("message_id")
-        to_phone = sms_data.get("to_phone")
-        body = sms_data.get("body")
-        event_id = sms_data.get("event_id")
+        sms_data = json.loads(msg.body)
+        message_id = sms_data["message_id"]
+        to_phone = sms_data["to_phone"]
+        body = sms_data["body"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise PermanentError(f"Malformed SMS job: {e!r}") from e
+    
+    async with AsyncSessionLocal() as db:
+        # Get message record
+        message = await db.get(Message, message_id)
+        if not message:
+            # The row is committed before its job is enqueued
+            raise PermanentError(f"Message {message_id} not found")
+        if message.twilio_sid:
+            # Sent on an earlier delivery whose delete was lost
+            print(f"Message {message_id} already sent: {message.twilio_sid}")
+            return
+        # Release the connection while the SMS is sent (objects stay loaded)
+        await db.commit()
         
-        db = SessionLocal()
+        # Send SMS via Twilio
+        # Note: For status callbacks, we'd need the request URL, but in worker context
+        # we don't have it. Status callbacks are better handled at webhook level.
+        # For now, we'll rely on Twilio's initial response.
         try:
-            # Get message record
-            message = db.query(Message).filter(Message.id == message_id).first()
-            if not message:
-                print(f"Message {message_id} not found")
-                return
-            
-            # Send SMS via Twilio
-            # Note: For status callbacks, we'd need the request URL, but in worker context
-            # we don't have it. Status callbacks are better handled at webhook level.
-            # For now, we'll rely on Twilio's initial response.
-            success, twilio_sid = send_sms(to_phone, body)
-            
-            if success and twilio_sid:
-                message.twilio_sid = twilio_sid
-                message.status = "sent"
-                print(f"SMS sent successfully: {twilio_sid}")
-                print(f"  Note: For virtual-to-virtual numbers, status may show differently on each side")
-                print(f"  Message was accepted by Twilio (has SID), delivery status may vary")
-            else:
+            success, twilio_sid = await twilio_sender.send(to_phone, body, raise_errors=True)
+        except Exception as e:
+            if not consumer.retry_policy.will_retry(msg, e):
                 message.status = "failed"
                 print(f"Failed to send SMS to {to_phone}")
-            
-            db.commit()
+                await _save(db, message)
+            raise
         
-        finally:
-            db.close()
-    
-    except Exception as e:
-        print(f"Error processing SMS message: {e}")
+        message.twilio_sid = twilio_sid
+        message.status = "sent"
+        print(f"SMS sent successfully: {twilio_sid}")
+        print(f"  Note: For virtual-to-virtual numbers, status may show differently on each side")
+        print(f"  Message was accepted by Twilio (has SID), delivery status may vary")
+        try:
+            await _save(db, message)
+        except Exception as e:
+            # Retrying would send the SMS again; the status callback still updates the row
+            print(f"Error saving sent SMS {message_id} ({twilio_sid}): {e}")
 
 
-async def poll_sqs_queue():
+async def _save(db, message: Message):
+    await db.commit()
+    event_detail_cache.invalidate(message.event_id)
+    if live_feed.subscribers:
+        await publish_message_status(db, message)
+
+
+async def process_batch(messages: List[QueueMessage]) -> List[Optional[BaseException]]:
     """
-    Poll SQS queue for SMS messages
+    Send a received batch concurrently; the sender enforces the concurrency
+    and per-number rate limits
+
+    Returns:
+        One outcome per message: None if done, else the error it failed with
     """
-    queue_url = sqs.get_queue_url(QueueName=settings.SQS_SMS_QUEUE)['QueueUrl']
-    
-    while _running:
-        try:
-            # Receive messages from SQS
-            response = sqs.receive_message(
-                QueueUrl=queue_url,
-                MaxNumberOfMessages=10,
-                WaitTimeSeconds=20,  # Long polling
-                VisibilityTimeout=60
-            )
-            
-            messages = response.get('Messages', [])
-            for msg in messages:
-                try:
-                    await process_sms_message(msg['Body'])
-                    # Delete message after successful processing
-                    sqs.delete_message(
-                        QueueUrl=queue_url,
-                        ReceiptHandle=msg['ReceiptHandle']
-                    )
-                except Exception as e:
-                    print(f"Error processing SMS message: {e}")
-                    # Message will become visible again after visibility timeout
-                    # and will be retried (up to maxReceiveCount)
-        
-        except Exception as e:
-            print(f"Error polling SQS queue: {e}")
-            await asyncio.sleep(5)
+    results = await asyncio.gather(
+        *(process_sms_message(msg) for msg in messages),
+        return_exceptions=True
+    )
+    return [result if isinstance(result, BaseException) else None for result in results]
+
+
+consumer = QueueConsumer(
+    "sms",
+    settings.SQS_SMS_QUEUE,
+    process_batch,
+    wait_seconds=settings.QUEUE_WAIT_SECONDS,
+    visibility_timeout=settings.QUEUE_VISIBILITY_TIMEOUT_SECONDS,
+    prefetch=settings.QUEUE_PREFETCH
+)
+
+
+async def poll_queue():
+    """
+    Poll the SMS queue until stopped
+    """
+    await consumer.run()
 
 
 async def start():
     """Start the SMS worker"""
     global _running, _task
     _running = True
-    _task = asyncio.create_task(poll_sqs_queue())
+    _task = asyncio.create_task(poll_queue())
     print("SMS worker started")
 
 
@@ -111,6 +125,7 @@ def stop():
     """Stop the SMS worker"""
     global _running
     _running = False
+    consumer.stop()
     if _task:
         _task.cancel()
 
@@ -11,9 +11,20 @@ import asyncio
 from typing import Optional
 
 from app.database import init_db, get_db
-from app.routers import webhooks, events, auth
-from app.workers import event_processor, sms_worker
+from app.routers import webhooks, events, auth, stats
+from app.workers import event_processor, sms_worker, outbox_relay, rollup_compactor
+from app.services.dispatcher import dispatcher
+from app.services.event_cache import event_detail_cache
+from app.services.hotspots import hotspot_cache
+from app.services.ingest_pipeline import ingest_pipeline
+from app.services.live_feed import live_feed
+from app.services.idempotency import delivery_filter
+from app.services.pending_stops import pending_stops
+from app.services.queues import close_queue_backend, get_queue_backend
+from app.services.telemetry import telemetry_writer
+from app.services.twilio_service import twilio_sender
 from app.config import settings
+from app.services.vehicle_state import vehicle_state_store
 
 # Background tasks
 background_tasks = []
@@ -24,23 +35,53 @@ async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     # Startup
     print("Starting DriverBuddy FastAPI application...")
-    init_db()
+    await init_db()
+    
+    # Start side-effect dispatcher and the shared Twilio sender
+    await dispatcher.start()
+    await twilio_sender.start()
+    
+    # Start raw telemetry writer
+    await telemetry_writer.start()
+    
+    # Start vehicle-sharded ingest pipeline
+    await ingest_pipeline.start()
+    await pending_stops.start(ingest_pipeline.submit)
+    
+    # Job queue backend shared by the workers and the outbox relay
+    get_queue_backend()
     
     # Start background workers
     event_task = asyncio.create_task(event_processor.start())
     sms_task = asyncio.create_task(sms_worker.start())
-    background_tasks.extend([event_task, sms_task])
+    outbox_task = asyncio.create_task(outbox_relay.start())
+    rollup_task = asyncio.create_task(rollup_compactor.start())
+    background_tasks.extend([event_task, sms_task, outbox_task, rollup_task])
     
     print("Background workers started")
     yield
     
     # Shutdown
     print("Shutting down background workers...")
+    live_feed.close_all()
+    pending_stops.stop()
     event_processor.stop()
     sms_worker.stop()
+    outbox_relay.stop()
+    rollup_compactor.stop()
     for task in background_tasks:
         task.cancel()
     await asyncio.gather(*background_tasks, return_exceptions=True)
+    # Let the queue consumers hand back the messages they still hold
+    await asyncio.gather(
+        *(task for task in (event_processor._task, sms_worker._task) if task),
+        return_exceptions=True
+    )
+    await ingest_pipeline.stop()
+    await telemetry_writer.stop()
+    await dispatcher.stop()
+    await twilio_sender.stop()
+    await close_queue_backend()
     print("Application shut down")
 
 
@@ -63,6 +104,7 @@ app.add_middleware(
 # Include routers
 app.include_router(webhooks.router, prefix="/webhook", tags=["webhooks"])
 app.include_router(events.router, prefix="/events", tags=["events"])
+app.include_router(stats.router, prefix="/stats", tags=["stats"])
 app.include_router(auth.router, prefix="/auth", tags=["authentication"])
 
 
@@ -84,7 +126,31 @@ async def health():
         "database": "connected",  # TODO: Add actual DB health check
         "workers": {
             "event_processor": "running",
-            "sms_worker": "running"
+            "sms_worker": "running",
+            "outbox_relay": "running"
+        },
+        "ingest_pipeline": "saturated" if ingest_pipeline.saturated() else "ok"
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """In-process pipeline, cache and dispatcher metrics"""
+    return {
+        "ingest_pipeline": ingest_pipeline.stats(),
+        "vehicle_state_cache": vehicle_state_store.stats(),
+        "event_detail_cache": event_detail_cache.stats(),
+        "hotspot_cache": hotspot_cache.stats(),
+        "live_feed": live_feed.stats(),
+        "idempotency": delivery_filter.stats(),
+        "pending_stops": pending_stops.stats(),
+        "telemetry_writer": telemetry_writer.stats(),
+        "dispatcher": dispatcher.stats(),
+        "twilio_sender": twilio_sender.stats(),
+        "queue_backend": get_queue_backend().stats(),
+        "queue_consumers": {
+            "events": event_processor.stats(),
+            "sms": sms_worker.consumer.stats()
         }
     }
 
@@ -0,0 +1,179 @@
+"""
+Recompute stop events from raw telemetry
+Replays the telemetry table through the vectorized detector
+(app/services/batch_detector.py), fanning vehicles out over a process pool.
+Use after changing STOP_SPEED_THRESHOLD / STOP_DURATION_SECONDS, or to
+rebuild events for a time range.
+
+Example:
+    python scripts/backfill_events.py --start 2024-01-01 --end 2024-02-01 --workers 8 --replace
+
+Stop events are upserted on (vehicle_id, event_type, start_time). With
+--replace, stop events in the range that the detector no longer finds are
+deleted, unless messages reference them. Event counters are rebuilt and
+the range's fleet rollups recomputed at the end. Restart the API afterwards
+so its vehicle state cache is reloaded.
+"""
+
+import sys
+import os
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, select
+
+from app.config import settings
+from app.database import SessionLocal, engine, upsert_insert
+from app.models import Event, Message, Telemetry
+from app.services.batch_detector import detect_stop_events
+from app.services.event_counts import rebuild_event_counts
+from app.services.rollups import compact_rollups
+
+
+def _parse_time(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused
+    engine.dispose(close=False)
+
+
+def backfill_vehicle(
+    vehicle_id: str,
+    start: datetime,
+    end: datetime,
+    stop_threshold: float,
+    stop_duration_seconds: float,
+    replace: bool,
+    dry_run: bool
+) -> dict:
+    """Detect and store the stop events of one vehicle (runs in a worker process)"""
+    with SessionLocal() as db:
+        pings = db.execute(
+            select(
+                Telemetry.recorded_at, Telemetry.speed, Telemetry.latitude, Telemetry.longitude,
+                Telemetry.driver_id, Telemetry.ping_metadata
+            )
+            .where(
+                Telemetry.vehicle_id == vehicle_id,
+                Telemetry.recorded_at >= start,
+                Telemetry.recorded_at < end
+            )
+            .order_by(Telemetry.recorded_at)
+        ).all()
+        timestamps, speeds, latitudes, longitudes, driver_ids, metadata = (
+            [list(column) for column in zip(*pings)] if pings else ([],) * 6
+        )
+
+        rows = detect_stop_events(
+            vehicle_id, timestamps, speeds, latitudes, longitudes, driver_ids, metadata,
+            stop_threshold=stop_threshold,
+            stop_duration_seconds=stop_duration_seconds
+        )
+
+        deleted = 0
+        if not dry_run:
+            if rows:
+                statement = upsert_insert(db, Event)
+                db.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["vehicle_id", "event_type", "start_time"],
+                        set_={
+                            Event.driver_id: statement.excluded.driver_id,
+                            Event.end_time: statement.excluded.end_time,
+                            Event.latitude: statement.excluded.latitude,
+                            Event.longitude: statement.excluded.longitude,
+                            Event.geohash: statement.excluded.geohash,
+                            Event.event_metadata: statement.excluded.event_metadata
+                        }
+                    ),
+                    rows
+                )
+            if replace:
+                deleted = db.execute(
+                    delete(Event)
+                    .where(
+                        Event.vehicle_id == vehicle_id,
+                        Event.event_type == "stop",
+                        Event.start_time >= start,
+                        Event.start_time < end,
+                        Event.start_time.not_in([row["start_time"] for row in rows]),
+                        ~select(Message.id).where(Message.event_id == Event.id).exists()
+                    )
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            db.commit()
+
+    return {"vehicle_id": vehicle_id, "pings": len(pings), "events": len(rows), "deleted": deleted}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute stop events from raw telemetry")
+    parser.add_argument("--start", required=True, help="Range start (ISO date/time, UTC if naive)")
+    parser.add_argument("--end", required=True, help="Range end, exclusive")
+    parser.add_argument("--vehicle", action="append", help="Only this vehicle (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--stop-threshold", type=float, default=settings.STOP_SPEED_THRESHOLD)
+    parser.add_argument("--stop-duration", type=float, default=settings.STOP_DURATION_SECONDS)
+    parser.add_argument("--replace", action="store_true",
+                        help="Delete stop events in the range the detector no longer finds")
+    parser.add_argument("--dry-run", action="store_true", help="Detect only, write nothing")
+    args = parser.parse_args()
+
+    start, end = _parse_time(args.start), _parse_time(args.end)
+    vehicles = args.vehicle
+    if not vehicles:
+        with SessionLocal() as db:
+            vehicles = db.execute(
+                select(Telemetry.vehicle_id).distinct()
+                .where(Telemetry.recorded_at >= start, Telemetry.recorded_at < end)
+            ).scalars().all()
+    print(f"Backfilling {len(vehicles)} vehicles from {start.isoformat()} to {end.isoformat()}")
+
+    started = time.monotonic()
+    totals = {"pings": 0, "events": 0, "deleted": 0}
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        futures = {
+            pool.submit(
+                backfill_vehicle, vehicle_id, start, end, args.stop_threshold,
+                args.stop_duration, args.replace, args.dry_run
+            ): vehicle_id
+            for vehicle_id in vehicles
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Error backfilling {futures[future]}: {e}")
+                continue
+            for key in totals:
+                totals[key] += result[key]
+
+    if not args.dry_run:
+        # Upserts and deletes bypass the listing counters and rollups
+        with engine.begin() as conn:
+            rebuild_event_counts(conn)
+        with engine.connect() as conn:
+            compact_rollups(conn, start, end)
+
+    elapsed = time.monotonic() - started
+    print(
+        f"Done in {elapsed:.1f}s: {totals['pings']} pings, {totals['events']} stop events"
+        f"{' (dry run)' if args.dry_run else ''}, {totals['deleted']} stale events deleted, "
+        f"{failed} vehicles failed ({totals['pings'] / elapsed if elapsed else 0:.0f} pings/s)"
+    )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+Query-plan benchmark
+Seeds synthetic events and messages, then runs every hot query used by the
+routers and workers, recording latency and EXPLAIN plans. Exits non-zero if
+any plan reads a checked table with a sequential scan.
+
+Run against a local, disposable PostgreSQL (DB_* settings or DATABASE_URL),
+after python scripts/migrate.py:
+    python scripts/benchmark_queries.py --events 2000000 --messages 1000000
+
+SQLite (DATABASE_URL=sqlite+aiosqlite:///...) works too for a quick check,
+using EXPLAIN QUERY PLAN.
+"""
+
+import sys
+import os
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, func, or_, select, text, tuple_, update
+
+from app.database import engine
+from app.models import Driver, Event, EventCount, Message, OutboxMessage
+from app.services.geo import bbox_around, cover_bbox, geohash_encode
+
+BENCH_PREFIX = "bench-"
+BENCH_DRIVER_BASE = 1_000_000
+BENCH_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _series(dialect: str) -> str:
+    if dialect == "postgresql":
+        return "generate_series(1, :count) AS g(n)"
+    return ("(WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < :count) "
+            "SELECT n FROM s) AS g")
+
+
+def _minutes_after_start(dialect: str, minutes: str) -> str:
+    if dialect == "postgresql":
+        return f"(TIMESTAMPTZ '{BENCH_START:%Y-%m-%d %H:%M:%S}+00' + ({minutes}) * INTERVAL '1 minute')"
+    return f"datetime('{BENCH_START:%Y-%m-%d %H:%M:%S}', '+' || ({minutes}) || ' minutes')"
+
+
+def seed(conn, events: int, messages: int, vehicles: int, drivers: int):
+    """Insert synthetic drivers, events and messages (skipped if already seeded)"""
+    dialect = conn.dialect.name
+    existing = conn.execute(
+        select(func.count(Event.id)).where(Event.vehicle_id.like(f"{BENCH_PREFIX}%"))
+    ).scalar_one()
+    if existing >= events:
+        print(f"Using {existing} existing benchmark events")
+        return
+
+    started = time.monotonic()
+    series = _series(dialect)
+    conn.execute(text(
+        f"INSERT INTO drivers (id, name, phone) "
+        f"SELECT {BENCH_DRIVER_BASE} + g.n, 'Bench Driver ' || g.n, '+1999' || ({BENCH_DRIVER_BASE} + g.n) "
+        f"FROM {series} WHERE NOT EXISTS (SELECT 1 FROM drivers WHERE id = {BENCH_DRIVER_BASE} + g.n)"
+    ), {"count": drivers})
+
+    start_time = _minutes_after_start(dialect, "g.n")
+    # The last event of each vehicle stays open
+    conn.execute(text(
+        f"INSERT INTO events (driver_id, vehicle_id, event_type, start_time, end_time, latitude, longitude) "
+        f"SELECT {BENCH_DRIVER_BASE} + 1 + g.n % {drivers}, '{BENCH_PREFIX}' || (g.n % {vehicles}), "
+        f"CASE WHEN g.n % 10 = 0 THEN 'move' ELSE 'stop' END, {start_time}, "
+        f"CASE WHEN g.n > :count - {vehicles} THEN NULL ELSE {_minutes_after_start(dialect, 'g.n + 5')} END, "
+        f"40 + (g.n % 1000) / 1000.0, -100 + (g.n % 997) / 997.0 "
+        f"FROM {series}"
+    ), {"count": events})
+
+    # Geohashes by id, one executemany per chunk; positions repeat, so each
+    # distinct one is encoded once
+    geohashes = {}
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(Event.id, Event.latitude, Event.longitude)
+            .where(Event.id > last_id, Event.vehicle_id.like(f"{BENCH_PREFIX}%"), Event.geohash.is_(None))
+            .order_by(Event.id)
+            .limit(10000)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        values = []
+        for event_id, latitude, longitude in rows:
+            position = (float(latitude), float(longitude))
+            if position not in geohashes:
+                geohashes[position] = geohash_encode(*position)
+            values.append({"event_id": event_id, "event_geohash": geohashes[position]})
+        conn.execute(
+            update(Event.__table__)
+            .where(Event.__table__.c.id == bindparam("event_id"))
+            .values(geohash=bindparam("event_geohash")),
+            values
+        )
+
+    conn.execute(text(
+        "INSERT INTO messages (event_id, driver_id, direction, body, twilio_sid, from_phone, to_phone, status, created_at) "
+        "SELECT id, driver_id, CASE WHEN id % 3 = 0 THEN 'inbound' ELSE 'outbound' END, 'bench', "
+        "'SMbench' || id, '+15550000000', '+15550000001', 'delivered', start_time "
+        f"FROM events WHERE vehicle_id LIKE '{BENCH_PREFIX}%' ORDER BY id LIMIT :count"
+    ), {"count": messages})
+
+    if dialect == "postgresql":
+        conn.execute(text("ANALYZE drivers"))
+        conn.execute(text("ANALYZE events"))
+        conn.execute(text("ANALYZE messages"))
+    else:
+        conn.execute(text("ANALYZE"))
+    print(f"Seeded {events} events and {messages} messages in {time.monotonic() - started:.1f}s")
+
+
+def hot_queries(conn) -> dict:
+    """The statements issued by the routers and workers, with benchmark values"""
+    vehicle_id = f"{BENCH_PREFIX}7"
+    driver_id = BENCH_DRIVER_BASE + 8
+    phone = f"+1999{driver_id}"
+    event_id, cursor_time = conn.execute(
+        select(Event.id, Event.start_time).where(Event.vehicle_id == vehicle_id)
+        .order_by(Event.start_time.desc()).offset(50).limit(1)
+    ).one()
+    listing = select(Event).order_by(Event.start_time.desc(), Event.id.desc()).limit(21)
+
+    ranked = select(
+        Event.id.label("id"),
+        func.row_number().over(partition_by=Event.vehicle_id, order_by=Event.start_time.desc()).label("rn")
+    ).where(Event.vehicle_id.in_([f"{BENCH_PREFIX}{i}" for i in range(50)])).subquery()
+
+    return {
+        # GET /events
+        "list_events": listing,
+        "list_events_by_vehicle": listing.where(Event.vehicle_id == vehicle_id),
+        "list_events_by_driver": listing.where(Event.driver_id == driver_id),
+        "list_events_by_type": listing.where(Event.event_type == "move"),
+        "list_events_by_driver_type": listing.where(Event.driver_id == driver_id, Event.event_type == "stop"),
+        "list_events_by_vehicle_cursor": listing.where(
+            Event.vehicle_id == vehicle_id,
+            tuple_(Event.start_time, Event.id) < tuple_(cursor_time, event_id)
+        ),
+        "count_events_by_vehicle": select(func.count()).select_from(
+            select(Event).where(Event.vehicle_id == vehicle_id).subquery()
+        ),
+        "event_counter": select(EventCount.filter_key, func.sum(EventCount.count))
+        .where(EventCount.filter_key.in_([f"vehicle:{vehicle_id}", "_seeded"]))
+        .group_by(EventCount.filter_key),
+        # GET /events/nearby and /events/bbox candidates
+        "events_nearby_candidates": select(Event.id, Event.latitude, Event.longitude, Event.start_time).where(
+            or_(*[Event.geohash.like(f"{prefix}%") for prefix in cover_bbox(*bbox_around(40.5, -99.5, 2))])
+        ),
+        # GET /events/{id}
+        "get_event": select(Event).where(Event.id == event_id),
+        "get_event_messages": select(Message).where(Message.event_id == event_id).order_by(Message.created_at),
+        # POST /webhook/twilio/inbound
+        "driver_by_phone": select(Driver).where(Driver.phone == phone),
+        "open_event_by_driver": select(Event)
+        .where(Event.driver_id == driver_id, Event.end_time.is_(None))
+        .order_by(Event.start_time.desc()).limit(1),
+        "recent_event_by_driver": select(Event)
+        .where(Event.driver_id == driver_id, Event.start_time >= cursor_time - timedelta(hours=1))
+        .order_by(Event.start_time.desc()).limit(1),
+        # POST /webhook/twilio/status
+        "message_by_twilio_sid": select(Message).where(Message.twilio_sid == f"SMbench{event_id}"),
+        # Ingest: vehicle states and retried-delivery check
+        "vehicle_states": select(Event).join(ranked, Event.id == ranked.c.id).where(ranked.c.rn == 1),
+        "existing_stop": select(Event.id).where(
+            Event.vehicle_id == vehicle_id, Event.event_type == "stop", Event.start_time == cursor_time
+        ),
+        # Outbox relay
+        "outbox_undelivered": select(OutboxMessage).where(
+            OutboxMessage.delivered_at.is_(None),
+            or_(OutboxMessage.next_attempt_at.is_(None), OutboxMessage.next_attempt_at <= BENCH_START)
+        ).order_by(OutboxMessage.id).limit(100),
+    }
+
+
+def explain(conn, statement) -> tuple:
+    """
+    Plan of a statement and the tables it reads with a sequential scan
+
+    Returns:
+        Tuple of (plan, set of sequentially scanned tables)
+    """
+    sql = str(statement.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    if conn.dialect.name == "postgresql":
+        plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")).scalar_one()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        scanned = set()
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            if node["Node Type"] == "Seq Scan":
+                scanned.add(node.get("Relation Name"))
+            nodes.extend(node.get("Plans", []))
+        return plan, scanned
+
+    rows = conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+    plan = [row[-1] for row in rows]
+    scanned = {
+        detail.split()[1] for detail in plan
+        if detail.startswith("SCAN ") and " USING " not in detail
+    }
+    return plan, scanned
+
+
+def time_query(conn, statement, iterations: int) -> list:
+    """Latencies in ms of `iterations` executions"""
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        conn.execute(statement).all()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hot queries and check their plans")
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--vehicles", type=int, default=5_000)
+    parser.add_argument("--drivers", type=int, default=2_000)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--check-tables", default="events,messages",
+                        help="Tables that must not be sequentially scanned")
+    parser.add_argument("--output", help="Write latencies and plans to this JSON file")
+    args = parser.parse_args()
+    checked = set(args.check_tables.split(","))
+
+    with engine.begin() as conn:
+        seed(conn, args.events, args.messages, args.vehicles, args.drivers)
+
+    report = {}
+    failures = []
+    with engine.connect() as conn:
+        for name, statement in hot_queries(conn).items():
+            plan, scanned = explain(conn, statement)
+            conn.rollback()
+            latencies = time_query(conn, statement, args.iterations)
+            conn.rollback()
+            seq_scans = sorted(scanned & checked)
+            report[name] = {
+                "p50_ms": round(statistics.median(latencies), 3),
+                "p95_ms": round(sorted(latencies)[int(0.95 * (len(latencies) - 1))], 3),
+                "seq_scans": seq_scans,
+                "plan": plan
+            }
+            if seq_scans:
+                failures.append(name)
+            print(f"{name:32} p50 {report[name]['p50_ms']:9.3f} ms   p95 {report[name]['p95_ms']:9.3f} ms"
+                  f"{'   SEQ SCAN on ' + ', '.join(seq_scans) if seq_scans else ''}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    if failures:
+        print(f"\nSequential scans in: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nAll plans use indexes")
+
+
+if __name__ == "__main__":
+    main()
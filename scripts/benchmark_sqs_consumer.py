@@ -0,0 +1,145 @@
+"""
+SQS consumer benchmark
+Fills a queue on the local SQS stand-in (scripts/fake_sqs.py, with simulated
+round-trip latency) and drains it with a handler that takes a fixed time per
+batch, measuring messages/second and the worst event loop stall for:
+- baseline: the old loop (blocking receive_message and one delete_message per
+  message, called on the event loop)
+- consumer: app.services.queue_consumer.QueueConsumer on the SQS backend,
+  without prefetch
+- prefetch: the same, receiving the next batch while the handler runs
+
+Example:
+    python scripts/benchmark_sqs_consumer.py --messages 500 --latency-ms 20 --handler-ms 50
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import json
+import time
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8798
+os.environ["SQS_ENDPOINT_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+os.environ["QUEUE_BACKEND"] = "sqs"
+
+from fake_sqs import FakeSqs
+from app.services.queue_consumer import QueueConsumer
+from app.services.queues import SqsQueue, sqs_client
+
+
+class LoopMonitor:
+    """Largest gap between 10 ms ticks, i.e. how long the loop was blocked"""
+
+    def __init__(self):
+        self.max_stall = 0.0
+        self._task = None
+
+    async def _tick(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(0.01)
+            now = time.monotonic()
+            self.max_stall = max(self.max_stall, now - last - 0.01)
+            last = now
+
+    def start(self):
+        self._task = asyncio.create_task(self._tick())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+def fill(client, queue: str, count: int):
+    queue_url = client.get_queue_url(QueueName=queue)['QueueUrl']
+    for start in range(0, count, 10):
+        client.send_message_batch(QueueUrl=queue_url, Entries=[
+            {"Id": str(i), "MessageBody": json.dumps({"n": start + i})}
+            for i in range(min(10, count - start))
+        ])
+
+
+async def run_baseline(client, queue: str, count: int, handler_seconds: float, wait_seconds: int):
+    # The old worker loop: blocking client calls made on the event loop
+    queue_url = client.get_queue_url(QueueName=queue)['QueueUrl']
+    handled = 0
+    while handled < count:
+        messages = client.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=wait_seconds, VisibilityTimeout=60
+        ).get('Messages', [])
+        if messages:
+            await asyncio.sleep(handler_seconds)
+        for msg in messages:
+            client.delete_message(QueueUrl=queue_url, ReceiptHandle=msg['ReceiptHandle'])
+            handled += 1
+
+
+async def run_consumer(client, queue: str, count: int, handler_seconds: float, wait_seconds: int,
+                       prefetch: bool) -> QueueConsumer:
+    async def handler(messages):
+        await asyncio.sleep(handler_seconds)
+        return [None] * len(messages)
+
+    backend = SqsQueue(threads=4, client=client)
+    consumer = QueueConsumer("benchmark", queue, handler, backend=backend, wait_seconds=wait_seconds,
+                             visibility_timeout=60, prefetch=prefetch)
+    task = asyncio.create_task(consumer.run())
+    while consumer.acked < count:
+        await asyncio.sleep(0.005)
+    consumer.stop()
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await backend.close()
+    return consumer
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQS consumers against a local SQS stand-in")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated SQS round trip")
+    parser.add_argument("--handler-ms", type=float, default=50, help="Handler time per batch")
+    parser.add_argument("--wait-seconds", type=int, default=1, help="Long poll wait")
+    args = parser.parse_args()
+
+    # Served from its own thread so the blocking baseline cannot stall it
+    fake = FakeSqs(PORT, args.latency_ms / 1000)
+    fake.start_in_thread()
+    client = sqs_client()
+    handler_seconds = args.handler_ms / 1000
+    try:
+        for mode in ("baseline", "consumer", "prefetch"):
+            queue = f"benchmark-{mode}"
+            await asyncio.to_thread(fill, client, queue, args.messages)
+            fake.calls.clear()
+            monitor = LoopMonitor()
+            monitor.start()
+            started = time.perf_counter()
+            if mode == "baseline":
+                await run_baseline(client, queue, args.messages, handler_seconds, args.wait_seconds)
+                extra = ""
+            else:
+                consumer = await run_consumer(client, queue, args.messages, handler_seconds,
+                                              args.wait_seconds, prefetch=mode == "prefetch")
+                extra = f", prefetched batches: {consumer.prefetched}"
+            elapsed = time.perf_counter() - started
+            await monitor.stop()
+            left = len(fake.queue(queue).messages)
+            calls = ", ".join(f"{action}={n}" for action, n in sorted(fake.calls.items()))
+            print(f"{mode:9s} {args.messages:5d} msgs in {elapsed:6.2f}s = {args.messages / elapsed:7.1f} msg/s  "
+                  f"(max loop stall: {monitor.max_stall * 1000:6.1f} ms, left in queue: {left}{extra})")
+            print(f"          calls: {calls}")
+            if left:
+                sys.exit(1)
+    finally:
+        fake.stop_thread()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
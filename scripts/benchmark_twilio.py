@@ -0,0 +1,172 @@
+"""
+Twilio sender benchmark
+Starts a local fake Twilio Messages API (with simulated latency) and
+measures messages/second for:
+- baseline: a new Client per message, sent one at a time (the old path)
+- pooled: the shared async sender (app.services.twilio_service.TwilioSender)
+  sending the whole set concurrently, rate-limited per sending number
+
+The fake server also checks that no sending number exceeded its rate, and
+a final check makes the fake answer slower than the sender's timeout: the
+send must fail (TransientError with raise_errors) once the timeout passes.
+
+Example:
+    python scripts/benchmark_twilio.py --messages 200 --numbers 20 --rate 1 --latency-ms 150
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8799
+os.environ["TWILIO_API_BASE_URL"] = f"http://127.0.0.1:{PORT}"
+os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+os.environ.setdefault("TWILIO_AUTH_TOKEN", "benchmark")
+
+from aiohttp import web
+from twilio.rest import Client
+
+from app.config import settings
+from app.services.retries import TransientError
+from app.services.twilio_service import TwilioSender, _configure
+
+
+class FakeTwilio:
+    """Messages.json endpoint answering after a fixed latency"""
+
+    def __init__(self, latency_seconds: float):
+        self.latency_seconds = latency_seconds
+        self.sent_at = defaultdict(list)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.connections = set()
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.connections.add(request.transport.get_extra_info("peername"))
+        try:
+            form = await request.post()
+            self.sent_at[form["From"]].append(time.monotonic())
+            await asyncio.sleep(self.latency_seconds)
+            count = sum(len(times) for times in self.sent_at.values())
+            return web.json_response({
+                "sid": f"SM{count:032d}",
+                "status": "queued",
+                "from": form["From"],
+                "to": form["To"],
+                "body": form["Body"]
+            }, status=201)
+        finally:
+            self.in_flight -= 1
+
+    def max_rate(self, window: float = 1.0) -> float:
+        """Highest per-number message count seen in any `window` seconds"""
+        worst = 0
+        for times in self.sent_at.values():
+            times = sorted(times)
+            start = 0
+            for end in range(len(times)):
+                while times[end] - times[start] >= window:
+                    start += 1
+                worst = max(worst, end - start + 1)
+        return worst / window
+
+    def reset(self):
+        self.sent_at.clear()
+        self.max_in_flight = 0
+        self.connections.clear()
+
+
+def _baseline_send(to_phone: str, from_number: str):
+    # The old path: a new Client (and HTTP session) per message
+    client = _configure(Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN))
+    return client.messages.create(body="benchmark", from_=from_number, to=to_phone).sid
+
+
+async def check_timeout(fake: FakeTwilio, from_number: str, timeout: float = 0.5) -> bool:
+    """A send to a fake answering after 4x the timeout fails at the timeout, not the answer"""
+    latency = fake.latency_seconds
+    fake.latency_seconds = timeout * 4
+    sender = TwilioSender(1, 100, 100, timeout_seconds=timeout)
+    await sender.start()
+    try:
+        started = time.perf_counter()
+        result = await sender.send("+19990000000", "timeout", from_number=from_number)
+        returned_after = time.perf_counter() - started
+        try:
+            await sender.send("+19990000001", "timeout", from_number=from_number, raise_errors=True)
+            raised = None
+        except TransientError as e:
+            raised = e
+    finally:
+        await sender.stop()
+        fake.latency_seconds = latency
+    ok = result == (False, None) and returned_after < timeout * 2 and raised is not None and sender.in_flight == 0
+    print(f"timeout   send returned {result} after {returned_after:.2f}s (timeout {timeout}s, "
+          f"answer after {timeout * 4}s), raise_errors -> {raised!r}: {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Twilio sender against a fake Twilio API")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--numbers", type=int, default=20, help="Sending numbers to spread messages over")
+    parser.add_argument("--rate", type=float, default=1.0, help="Messages/second per sending number")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=settings.TWILIO_MAX_CONCURRENCY)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--baseline-messages", type=int, default=30,
+                        help="Messages for the (slow) one-at-a-time baseline; 0 skips it")
+    args = parser.parse_args()
+
+    fake = FakeTwilio(args.latency_ms / 1000)
+    app = web.Application()
+    app.router.add_post("/2010-04-01/Accounts/{account}/Messages.json", fake.create_message)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    numbers = [f"+1500555{i:04d}" for i in range(args.numbers)]
+    try:
+        if args.baseline_messages:
+            started = time.perf_counter()
+            for i in range(args.baseline_messages):
+                await asyncio.to_thread(_baseline_send, f"+1999{i:07d}", numbers[i % len(numbers)])
+            elapsed = time.perf_counter() - started
+            print(f"baseline  {args.baseline_messages:5d} msgs in {elapsed:7.2f}s = "
+                  f"{args.baseline_messages / elapsed:8.1f} msg/s  (connections: {len(fake.connections)})")
+            fake.reset()
+
+        sender = TwilioSender(args.concurrency, args.rate, args.burst, timeout_seconds=30)
+        await sender.start()
+        started = time.perf_counter()
+        results = await asyncio.gather(*(
+            sender.send(f"+1999{i:07d}", "benchmark", from_number=numbers[i % len(numbers)])
+            for i in range(args.messages)
+        ))
+        elapsed = time.perf_counter() - started
+        await sender.stop()
+        ok = sum(1 for success, _ in results if success)
+        print(f"pooled    {args.messages:5d} msgs in {elapsed:7.2f}s = {args.messages / elapsed:8.1f} msg/s  "
+              f"(connections: {len(fake.connections)}, max in flight: {fake.max_in_flight}, "
+              f"ok: {ok}, rate-limited waits: {sender.rate_limited})")
+        print(f"ceiling   {args.numbers * args.rate:8.1f} msg/s from {args.numbers} numbers at {args.rate}/s "
+              f"(+ burst {args.burst})")
+        max_rate = fake.max_rate()
+        print(f"max per-number rate seen: {max_rate:.1f} msg/s (limit {args.rate}/s, burst {args.burst})")
+        timeout_ok = await check_timeout(fake, numbers[0])
+        if ok != args.messages or max_rate > args.rate + args.burst or not timeout_ok:
+            sys.exit(1)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+"""
+Stop hotspot checks
+Seeds stops around UTC midnights in a disposable database and checks that
+stop_hotspots gives the same cells for a window however its bounds are
+written (UTC or another offset), and that the per-day cache is keyed and
+filled by UTC day: cached answers must equal uncached ones.
+
+Example:
+    python scripts/check_hotspots.py
+"""
+
+import sys
+import os
+import asyncio
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.gettempdir()}/driverbuddy_check_hotspots.db"
+
+from sqlalchemy import delete
+
+from app.database import AsyncSessionLocal, init_db
+from app.models import Event
+from app.services.geo import geohash_encode
+from app.services.hotspots import hotspot_cache, stop_hotspots
+
+VEHICLE = "check-hotspots"
+PRECISION = 6
+LATITUDE, LONGITUDE = 59.3293, 18.0686
+# Stops just before and after UTC midnights, so a window cut at local midnight
+# (or a day bucketed by local date) would count them in the wrong day
+STOP_TIMES = [
+    datetime(2024, 1, 1, 21, 30, tzinfo=timezone.utc),
+    datetime(2024, 1, 1, 23, 30, tzinfo=timezone.utc),
+    datetime(2024, 1, 2, 0, 30, tzinfo=timezone.utc),
+    datetime(2024, 1, 2, 12, 0, tzinfo=timezone.utc),
+    datetime(2024, 1, 2, 23, 0, tzinfo=timezone.utc),
+    datetime(2024, 1, 3, 1, 0, tzinfo=timezone.utc),
+    datetime(2024, 1, 3, 22, 30, tzinfo=timezone.utc),
+]
+# [2024-01-01 22:00, 2024-01-03 23:00) UTC
+WINDOW = (datetime(2024, 1, 1, 22, 0, tzinfo=timezone.utc), datetime(2024, 1, 3, 23, 0, tzinfo=timezone.utc))
+OFFSETS = [timedelta(0), timedelta(hours=2), timedelta(hours=-5), timedelta(hours=5, minutes=30)]
+
+
+async def seed():
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Event).where(Event.vehicle_id == VEHICLE))
+        db.add_all(
+            Event(
+                vehicle_id=VEHICLE,
+                event_type="stop",
+                start_time=start,
+                end_time=start + timedelta(minutes=10),
+                latitude=LATITUDE,
+                longitude=LONGITUDE,
+                geohash=geohash_encode(LATITUDE, LONGITUDE)
+            )
+            for start in STOP_TIMES
+        )
+        await db.commit()
+
+
+async def counts(start: datetime, end: datetime) -> dict:
+    async with AsyncSessionLocal() as db:
+        cells, _, _ = await stop_hotspots(db, start, end, PRECISION, vehicle_id=VEHICLE)
+    return {cell: stats.stop_count for cell, stats in cells.items()}
+
+
+async def main():
+    await init_db()
+    await seed()
+    start, end = WINDOW
+    expected_count = sum(1 for ts in STOP_TIMES if start <= ts < end)
+    ok = True
+
+    for offset in OFFSETS:
+        zone = timezone(offset)
+        local = (start.astimezone(zone), end.astimezone(zone))
+        hotspot_cache.clear()
+        uncached = await counts(*local)
+        # Whole days are now cached (by whichever day key the query used)
+        cached_utc = await counts(start, end)
+        cached_local = await counts(*local)
+        passed = sum(uncached.values()) == expected_count and uncached == cached_utc == cached_local
+        ok = ok and passed
+        print(f"  UTC{offset.total_seconds() / 3600:+05.1f}  uncached {uncached}  cached (UTC bounds) {cached_utc}  "
+              f"cached {cached_local}  expected {expected_count} stops: {'ok' if passed else 'FAIL'}")
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Event).where(Event.vehicle_id == VEHICLE))
+        await db.commit()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
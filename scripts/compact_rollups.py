@@ -0,0 +1,47 @@
+"""
+Recompute fleet rollups from events and messages
+Replaces the hourly/daily rollup rows of whole days overlapping the range
+(the whole history without --start/--end), collapsing counter shards. The
+API's rollup compactor does this for recent days on its own; run this after
+editing events or messages directly.
+
+Example:
+    python scripts/compact_rollups.py --start 2024-01-01 --end 2024-02-01
+"""
+
+import sys
+import os
+import argparse
+import time
+from datetime import datetime, timezone
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.services.rollups import compact_rollups
+
+
+def _parse_time(value: str) -> datetime:
+    timestamp = datetime.fromisoformat(value)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute fleet rollups")
+    parser.add_argument("--start", help="Range start (ISO date/time, UTC if naive)")
+    parser.add_argument("--end", help="Range end, exclusive")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    with engine.connect() as conn:
+        rows = compact_rollups(
+            conn,
+            _parse_time(args.start) if args.start else None,
+            _parse_time(args.end) if args.end else None
+        )
+    print(f"{rows} rollup rows corrected in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
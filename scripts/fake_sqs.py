@@ -0,0 +1,297 @@
+"""
+Local SQS stand-in
+Speaks the SQS JSON protocol used by boto3 for the calls this app makes:
+create/get queue URL, send (batch), long-poll receive with visibility
+timeouts, delete (batch) and change visibility (batch). Every response can be
+delayed to simulate the network round trip.
+
+Queues are created on first use. Run it and point the app at it:
+
+    python scripts/fake_sqs.py --port 9324 --latency-ms 10
+    SQS_ENDPOINT_URL=http://127.0.0.1:9324 uvicorn main:app
+
+Not a full SQS: no FIFO ordering guarantees, redrive policies or message
+attribute filtering.
+"""
+
+import sys
+import argparse
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from aiohttp import web
+
+
+def _md5(text: str) -> str:
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+class FakeQueue:
+    def __init__(self, name: str):
+        self.name = name
+        self.messages = OrderedDict()  # message id -> message
+        self.receipts = {}  # receipt handle -> message id
+        self.changed = asyncio.Event()
+
+    def send(self, body: str, delay_seconds: int = 0, attributes=None) -> dict:
+        message_id = str(uuid.uuid4())
+        self.messages[message_id] = {
+            "id": message_id,
+            "body": body,
+            "attributes": attributes or {},
+            "visible_at": time.monotonic() + delay_seconds,
+            "receive_count": 0,
+            "sent_at": time.time()
+        }
+        self.changed.set()
+        return {"MessageId": message_id, "MD5OfMessageBody": _md5(body)}
+
+    def receive(self, max_messages: int, visibility_timeout: float) -> list:
+        now = time.monotonic()
+        received = []
+        for message in self.messages.values():
+            if message["visible_at"] > now:
+                continue
+            message["visible_at"] = now + visibility_timeout
+            message["receive_count"] += 1
+            receipt = uuid.uuid4().hex
+            message["receipt"] = receipt
+            self.receipts[receipt] = message["id"]
+            entry = {
+                "MessageId": message["id"],
+                "ReceiptHandle": receipt,
+                "Body": message["body"],
+                "MD5OfBody": _md5(message["body"]),
+                "Attributes": {
+                    "ApproximateReceiveCount": str(message["receive_count"]),
+                    "SentTimestamp": str(int(message["sent_at"] * 1000))
+                }
+            }
+            if message["attributes"]:
+                entry["MessageAttributes"] = message["attributes"]
+            received.append(entry)
+            if len(received) >= max_messages:
+                break
+        return received
+
+    def _message(self, receipt: str):
+        message = self.messages.get(self.receipts.get(receipt))
+        # Only the latest receipt of a message is valid
+        if message is None or message.get("receipt") != receipt:
+            raise KeyError(receipt)
+        return message
+
+    def delete(self, receipt: str):
+        message = self._message(receipt)
+        del self.messages[message["id"]]
+        self.receipts.pop(receipt, None)
+
+    def change_visibility(self, receipt: str, timeout: float):
+        message = self._message(receipt)
+        message["visible_at"] = time.monotonic() + timeout
+        self.changed.set()
+
+    def next_visible_in(self) -> float:
+        now = time.monotonic()
+        return min((m["visible_at"] - now for m in self.messages.values()), default=None)
+
+
+class FakeSqs:
+    """In-memory SQS served over HTTP"""
+
+    def __init__(self, port: int, latency_seconds: float = 0.0):
+        self.port = port
+        self.latency_seconds = latency_seconds
+        self.queues = {}
+        self.calls = {}
+        self._runner = None
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def queue(self, name: str) -> FakeQueue:
+        if name not in self.queues:
+            self.queues[name] = FakeQueue(name)
+        return self.queues[name]
+
+    def _queue_from_url(self, url: str) -> FakeQueue:
+        return self.queue(url.rstrip("/").rsplit("/", 1)[-1])
+
+    def queue_url(self, name: str) -> str:
+        return f"{self.endpoint_url}/000000000000/{name}"
+
+    async def handle(self, request: web.Request) -> web.Response:
+        action = request.headers.get("X-Amz-Target", "").split(".")[-1]
+        self.calls[action] = self.calls.get(action, 0) + 1
+        params = json.loads(await request.read() or b"{}")
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        handler = getattr(self, f"_{action}", None)
+        if handler is None:
+            return self._error("InvalidAction", f"Unsupported action {action}")
+        try:
+            result = handler(params)
+            if asyncio.iscoroutine(result):
+                result = await result
+        except KeyError as e:
+            return self._error("ReceiptHandleIsInvalid", f"Invalid receipt handle {e}")
+        return web.Response(body=json.dumps(result), content_type="application/x-amz-json-1.0")
+
+    def _error(self, code: str, message: str) -> web.Response:
+        return web.Response(
+            status=400,
+            body=json.dumps({"__type": f"com.amazonaws.sqs#{code}", "message": message}),
+            content_type="application/x-amz-json-1.0",
+            headers={"x-amzn-query-error": f"AWS.SimpleQueueService.{code};Sender"}
+        )
+
+    def _CreateQueue(self, params):
+        self.queue(params["QueueName"])
+        return {"QueueUrl": self.queue_url(params["QueueName"])}
+
+    def _GetQueueUrl(self, params):
+        self.queue(params["QueueName"])
+        return {"QueueUrl": self.queue_url(params["QueueName"])}
+
+    def _SendMessage(self, params):
+        return self._queue_from_url(params["QueueUrl"]).send(
+            params["MessageBody"], params.get("DelaySeconds", 0), params.get("MessageAttributes")
+        )
+
+    def _SendMessageBatch(self, params):
+        queue = self._queue_from_url(params["QueueUrl"])
+        return {"Successful": [
+            {"Id": entry["Id"], **queue.send(
+                entry["MessageBody"], entry.get("DelaySeconds", 0), entry.get("MessageAttributes")
+            )}
+            for entry in params["Entries"]
+        ], "Failed": []}
+
+    async def _ReceiveMessage(self, params):
+        queue = self._queue_from_url(params["QueueUrl"])
+        max_messages = params.get("MaxNumberOfMessages", 1)
+        visibility_timeout = params.get("VisibilityTimeout", 30)
+        deadline = time.monotonic() + params.get("WaitTimeSeconds", 0)
+        while True:
+            messages = queue.receive(max_messages, visibility_timeout)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return {"Messages": messages} if messages else {}
+            # Wake on a send/visibility change or when the next message reappears
+            queue.changed.clear()
+            next_visible = queue.next_visible_in()
+            if next_visible is not None:
+                remaining = min(remaining, max(next_visible, 0.005))
+            try:
+                await asyncio.wait_for(queue.changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def _DeleteMessage(self, params):
+        self._queue_from_url(params["QueueUrl"]).delete(params["ReceiptHandle"])
+        return {}
+
+    def _batch(self, params, func):
+        successful, failed = [], []
+        for entry in params["Entries"]:
+            try:
+                func(entry)
+                successful.append({"Id": entry["Id"]})
+            except KeyError:
+                failed.append({
+                    "Id": entry["Id"], "SenderFault": True,
+                    "Code": "ReceiptHandleIsInvalid", "Message": "Invalid receipt handle"
+                })
+        return {"Successful": successful, "Failed": failed}
+
+    def _DeleteMessageBatch(self, params):
+        queue = self._queue_from_url(params["QueueUrl"])
+        return self._batch(params, lambda entry: queue.delete(entry["ReceiptHandle"]))
+
+    def _ChangeMessageVisibility(self, params):
+        self._queue_from_url(params["QueueUrl"]).change_visibility(
+            params["ReceiptHandle"], params["VisibilityTimeout"]
+        )
+        return {}
+
+    def _ChangeMessageVisibilityBatch(self, params):
+        queue = self._queue_from_url(params["QueueUrl"])
+        return self._batch(
+            params, lambda entry: queue.change_visibility(entry["ReceiptHandle"], entry["VisibilityTimeout"])
+        )
+
+    def _GetQueueAttributes(self, params):
+        queue = self._queue_from_url(params["QueueUrl"])
+        now = time.monotonic()
+        visible = sum(1 for m in queue.messages.values() if m["visible_at"] <= now)
+        return {"Attributes": {
+            "ApproximateNumberOfMessages": str(visible),
+            "ApproximateNumberOfMessagesNotVisible": str(len(queue.messages) - visible)
+        }}
+
+    def _PurgeQueue(self, params):
+        queue = self._queue_from_url(params["QueueUrl"])
+        queue.messages.clear()
+        queue.receipts.clear()
+        return {}
+
+    async def start(self):
+        app = web.Application(client_max_size=1024 ** 2)
+        app.router.add_post("/", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def start_in_thread(self):
+        """Serve from a background thread with its own event loop (for blocking clients)"""
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(self.start())
+            started.set()
+            loop.run_forever()
+            loop.run_until_complete(self.stop())
+
+        self._loop = loop
+        self._thread = threading.Thread(target=serve, name="fake-sqs", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run a local SQS stand-in")
+    parser.add_argument("--port", type=int, default=9324)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    fake = FakeSqs(args.port, args.latency_ms / 1000)
+    await fake.start()
+    print(f"Fake SQS listening on {fake.endpoint_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -1,16 +1,242 @@
 """
 Database migration script
-Creates all tables in the database
+Creates all tables in the database, then applies the schema migrations
+below that create_all cannot (new indexes on existing tables)
 """
 
 import sys
 import os
+import re
 
 # Add parent directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from sqlalchemy import bindparam, delete, func, inspect, select, text, update
+
 from app.database import init_db, engine, Base
 from app.models import Driver, Event, Message
+from app.services.event_counts import rebuild_event_counts
+from app.services.geo import geohash_encode
+from app.services.rollups import compact_rollups
+from app.services.telemetry import ensure_partitions, retire_default_partition
+
+
+def _add_event_geohash(bind):
+    """Add events.geohash and fill it for existing events, one transaction per batch"""
+    with bind.begin() as conn:
+        if "geohash" not in {column["name"] for column in inspect(conn).get_columns("events")}:
+            conn.execute(text("ALTER TABLE events ADD COLUMN geohash TEXT"))
+    last_id = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(Event.id, Event.latitude, Event.longitude)
+                .where(Event.id > last_id)
+                .order_by(Event.id)
+                .limit(5000)
+            ).all()
+            if not rows:
+                return
+            last_id = rows[-1].id
+            values = [
+                {"event_id": row.id, "event_geohash": geohash_encode(float(row.latitude), float(row.longitude))}
+                for row in rows
+                if row.latitude is not None and row.longitude is not None
+            ]
+            if values:
+                conn.execute(
+                    update(Event.__table__)
+                    .where(Event.__table__.c.id == bindparam("event_id"))
+                    .values(geohash=bindparam("event_geohash")),
+                    values
+                )
+
+
+def _add_outbox_next_attempt(bind):
+    """Add outbox.next_attempt_at (the relay's backoff)"""
+    with bind.begin() as conn:
+        if "next_attempt_at" not in {column["name"] for column in inspect(conn).get_columns("outbox")}:
+            conn.execute(text("ALTER TABLE outbox ADD COLUMN next_attempt_at TIMESTAMP WITH TIME ZONE"))
+
+
+def _seed_fleet_rollups(bind):
+    """Compute fleet_rollups from the existing events and messages"""
+    with bind.connect() as conn:
+        print(f"  {compact_rollups(conn)} rollup rows corrected")
+
+
+def _dedupe_events(bind):
+    """
+    Merge events sharing (vehicle_id, event_type, start_time) into the oldest
+    one, so uq_events_vehicle_type_start can be built
+
+    Such duplicates were written by retried webhook deliveries before
+    ingestion was idempotent. Messages move to the kept event, which also
+    takes a duplicate's end time if it has none.
+    """
+    kept = (
+        select(Event.vehicle_id, Event.event_type, Event.start_time, func.min(Event.id).label("keep_id"))
+        .group_by(Event.vehicle_id, Event.event_type, Event.start_time)
+        .having(func.count() > 1)
+        .subquery()
+    )
+    with bind.begin() as conn:
+        pairs = conn.execute(
+            select(Event.id, kept.c.keep_id, Event.end_time)
+            .join(kept, (Event.vehicle_id == kept.c.vehicle_id)
+                  & (Event.event_type == kept.c.event_type)
+                  & (Event.start_time == kept.c.start_time))
+            .where(Event.id != kept.c.keep_id)
+        ).all()
+        if not pairs:
+            return 0
+        end_times = {}
+        for _, keep_id, end_time in pairs:
+            if end_time is not None:
+                end_times[keep_id] = max(end_times.get(keep_id, end_time), end_time)
+        duplicate_ids = [duplicate_id for duplicate_id, _, _ in pairs]
+        for start in range(0, len(pairs), 1000):
+            conn.execute(
+                update(Message.__table__)
+                .where(Message.__table__.c.event_id == bindparam("duplicate_id"))
+                .values(event_id=bindparam("keep_id")),
+                [{"duplicate_id": duplicate_id, "keep_id": keep_id} for duplicate_id, keep_id, _ in pairs[start:start + 1000]]
+            )
+        if end_times:
+            conn.execute(
+                update(Event.__table__)
+                .where(Event.__table__.c.id == bindparam("keep_id"), Event.__table__.c.end_time.is_(None))
+                .values(end_time=bindparam("duplicate_end_time")),
+                [{"keep_id": keep_id, "duplicate_end_time": end_time} for keep_id, end_time in end_times.items()]
+            )
+        for start in range(0, len(duplicate_ids), 1000):
+            conn.execute(delete(Event.__table__).where(Event.__table__.c.id.in_(duplicate_ids[start:start + 1000])))
+    print(f"  {len(duplicate_ids)} duplicate events merged")
+    return len(duplicate_ids)
+
+
+CREATE_INDEX = re.compile(r"CREATE (?:UNIQUE )?INDEX \{concurrently\} IF NOT EXISTS (\w+)")
+
+
+def _dedupe_events_and_rollups(bind):
+    """_dedupe_events on a database whose fleet rollups already counted the duplicates"""
+    if _dedupe_events(bind):
+        _seed_fleet_rollups(bind)
+
+
+def _drop_invalid_index(conn, name: str):
+    """
+    Drop an index left INVALID by a failed CREATE INDEX CONCURRENTLY, which
+    IF NOT EXISTS would otherwise skip (PostgreSQL only)
+    """
+    invalid = conn.execute(text(
+        "SELECT 1 FROM pg_index JOIN pg_class ON pg_class.oid = pg_index.indexrelid "
+        "WHERE pg_class.relname = :name AND NOT pg_index.indisvalid"
+    ), {"name": name}).first()
+    if invalid:
+        print(f"  Dropping invalid index {name}")
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+
+def _retire_telemetry_default(bind):
+    """Move rows out of the catch-all telemetry_default partition into day partitions and drop it"""
+    with bind.begin() as conn:
+        moved = retire_default_partition(conn)
+    print(f"  {moved} telemetry rows moved out of telemetry_default")
+
+
+# Applied in order, once each; recorded in schema_migrations. Steps are SQL
+# strings or callables taking the engine (for work done in batches).
+# {concurrently} becomes CONCURRENTLY on PostgreSQL so large tables stay writable.
+MIGRATIONS = [
+    ("0001_event_listing_indexes", [
+        _dedupe_events,
+        "CREATE UNIQUE INDEX {concurrently} IF NOT EXISTS uq_events_vehicle_type_start "
+        "ON events(vehicle_id, event_type, start_time)",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_time_id ON events(start_time, id)",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_vehicle_time_id ON events(vehicle_id, start_time, id)",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_driver_time_id ON events(driver_id, start_time, id)",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_type_time_id ON events(event_type, start_time, id)",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_driver_type_time_id "
+        "ON events(driver_id, event_type, start_time, id)",
+        # Prefixes of the indexes above
+        "DROP INDEX {concurrently} IF EXISTS idx_events_vehicle_time",
+        "DROP INDEX {concurrently} IF EXISTS idx_events_driver_time",
+    ]),
+    ("0002_hot_query_indexes", [
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_driver_open "
+        "ON events(driver_id, start_time) WHERE end_time IS NULL",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_messages_event_created ON messages(event_id, created_at)",
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_messages_twilio_sid ON messages(twilio_sid)",
+        # Prefix of idx_messages_event_created
+        "DROP INDEX {concurrently} IF EXISTS idx_messages_event",
+    ]),
+    ("0003_event_geohash", [
+        _add_event_geohash,
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_events_geohash ON events(geohash{pattern_ops})",
+    ]),
+    ("0004_fleet_rollups", [
+        "CREATE INDEX {concurrently} IF NOT EXISTS idx_messages_created ON messages(created_at)",
+        _seed_fleet_rollups,
+    ]),
+    ("0005_telemetry_drop_default_partition", [
+        _retire_telemetry_default,
+    ]),
+    # Databases where 0001 ran without the deduplication were left with an
+    # INVALID unique index; rebuild it
+    ("0006_rebuild_event_unique_index", [
+        _dedupe_events_and_rollups,
+        "CREATE UNIQUE INDEX {concurrently} IF NOT EXISTS uq_events_vehicle_type_start "
+        "ON events(vehicle_id, event_type, start_time)",
+    ]),
+    ("0007_outbox_backoff", [
+        _add_outbox_next_attempt,
+    ]),
+]
+
+
+def apply_migrations(bind=engine) -> list:
+    """
+    Apply pending MIGRATIONS
+
+    Statements run in autocommit mode (CREATE INDEX CONCURRENTLY cannot run
+    in a transaction) and use IF [NOT] EXISTS, so a migration interrupted
+    half-way is simply re-run. An index a failed concurrent build left
+    INVALID is dropped before its CREATE INDEX is retried.
+
+    Returns:
+        Names of the migrations applied
+    """
+    with bind.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version TEXT PRIMARY KEY, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        done = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+    postgresql = bind.dialect.name == "postgresql"
+    options = {
+        "concurrently": "CONCURRENTLY" if postgresql else "",
+        "pattern_ops": " text_pattern_ops" if postgresql else ""
+    }
+    applied = []
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for version, statements in MIGRATIONS:
+            if version in done:
+                continue
+            print(f"Applying migration {version}...")
+            for statement in statements:
+                if callable(statement):
+                    statement(bind)
+                    continue
+                index = CREATE_INDEX.match(statement)
+                if index and postgresql:
+                    _drop_invalid_index(conn, index.group(1))
+                conn.execute(text(statement.format(**options)))
+            conn.execute(text("INSERT INTO schema_migrations (version) VALUES (:version)"), {"version": version})
+            applied.append(version)
+    return applied
+
 
 if __name__ == "__main__":
     # First, ensure the database exists
@@ -28,7 +254,15 @@ if __name__ == "__main__":
     try:
         Base.metadata.create_all(bind=engine)
         print("Database tables created successfully!")
+        applied = apply_migrations()
+        print(f"Migrations applied: {', '.join(applied)}" if applied else "Migrations up to date")
+        with engine.begin() as conn:
+            partitions = ensure_partitions(conn)
+        if partitions:
+            print(f"Telemetry partitions ensured: {', '.join(partitions)}")
+        with engine.begin() as conn:
+            rebuild_event_counts(conn)
+        print("Event counters rebuilt")
     except Exception as e:
         print(f"Error creating tables: {e}")
         sys.exit(1)
-
@@ -0,0 +1,31 @@
+"""
+Standalone outbox relay
+Runs the outbox relay outside the API process; start as many as needed,
+they claim rows with SKIP LOCKED and never deliver the same row twice
+"""
+
+import sys
+import os
+import asyncio
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.workers import outbox_relay
+
+
+async def main():
+    """Run the relay until interrupted"""
+    await outbox_relay.start()
+    try:
+        await outbox_relay._task
+    except asyncio.CancelledError:
+        pass
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        outbox_relay.stop()
+        print("Outbox relay stopped")
@@ -0,0 +1,229 @@
+"""
+Queue backend conformance and throughput checks
+Runs the same checks against each job queue backend (app.services.queues):
+- memory: in-process
+- sql: the queue_messages table (DATABASE_URL, default a temporary SQLite file)
+- sqs: SqsQueue against the local SQS stand-in (scripts/fake_sqs.py), or a
+  real endpoint with --sqs-endpoint
+
+Checks: send/receive/ack, batches, attributes, delays, redelivery after the
+visibility timeout (with an incremented receive count and the old receipt
+rejected), visibility extension, long polls woken by a send, and a
+throughput run with several concurrent consumers that must deliver every
+message exactly once.
+
+Example:
+    python scripts/queue_conformance.py --backends memory,sql,sqs --messages 2000 --consumers 4
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import uuid
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PORT = 8796
+if not os.environ.get("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{tempfile.gettempdir()}/driverbuddy_queue_conformance.db"
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "conformance")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "conformance")
+os.environ.setdefault("QUEUE_POLL_INTERVAL_SECONDS", "0.05")
+
+from app.database import init_db
+from app.services.queues import MemoryQueue, SqlQueue, SqsQueue, sqs_client
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise CheckFailed(message)
+
+
+async def check_send_receive_ack(backend, queue):
+    message_id = await backend.send(queue, "hello", attributes={"kind": "greeting"})
+    check(bool(message_id), "send returned no id")
+    messages = await backend.receive(queue, wait_seconds=1, visibility_timeout=30)
+    check(len(messages) == 1, f"expected 1 message, got {len(messages)}")
+    check(messages[0].body == "hello", "body changed")
+    check(messages[0].attributes.get("kind") == "greeting", f"attributes lost: {messages[0].attributes}")
+    check(messages[0].receive_count == 1, f"receive_count {messages[0].receive_count} on first receive")
+    check(await backend.ack(queue, messages) == 1, "ack failed")
+    check(await backend.receive(queue, wait_seconds=0) == [], "acked message delivered again")
+
+
+async def check_batches(backend, queue):
+    accepted = await backend.send_batch(queue, [{"id": str(i), "body": f"m{i}"} for i in range(25)])
+    check(sorted(accepted, key=int) == [str(i) for i in range(25)], f"send_batch accepted {len(accepted)}/25")
+    bodies = []
+    while len(bodies) < 25:
+        messages = await backend.receive(queue, max_messages=10, wait_seconds=1, visibility_timeout=30)
+        check(messages, f"queue ran dry after {len(bodies)} of 25")
+        check(len(messages) <= 10, "receive returned more than max_messages")
+        bodies.extend(message.body for message in messages)
+        check(await backend.ack(queue, messages) == len(messages), "batch ack failed")
+    check(sorted(bodies) == sorted(f"m{i}" for i in range(25)), "batch bodies lost or duplicated")
+
+
+async def check_redelivery(backend, queue):
+    await backend.send(queue, "retry me")
+    first = await backend.receive(queue, wait_seconds=1, visibility_timeout=1)
+    check(len(first) == 1, "message not received")
+    check(await backend.receive(queue, wait_seconds=0) == [], "message visible during its visibility timeout")
+    second = await backend.receive(queue, wait_seconds=3, visibility_timeout=30)
+    check(len(second) == 1, "message not redelivered after its visibility timeout")
+    check(second[0].receive_count == 2, f"receive_count {second[0].receive_count} on redelivery")
+    check(await backend.ack(queue, first) == 0, "ack with a stale receipt succeeded")
+    check(await backend.ack(queue, second) == 1, "ack of the redelivered message failed")
+
+
+async def check_extend_visibility(backend, queue):
+    await backend.send(queue, "long job")
+    messages = await backend.receive(queue, wait_seconds=1, visibility_timeout=1)
+    check(await backend.extend_visibility(queue, messages, 4) == 1, "extend_visibility failed")
+    check(await backend.receive(queue, wait_seconds=2) == [], "message redelivered despite the extension")
+    check(await backend.extend_visibility(queue, messages, 0) == 1, "release (timeout 0) failed")
+    again = await backend.receive(queue, wait_seconds=2, visibility_timeout=30)
+    check(len(again) == 1, "released message not redelivered")
+    await backend.ack(queue, again)
+
+
+async def check_delay(backend, queue):
+    await backend.send(queue, "later", delay_seconds=1)
+    check(await backend.receive(queue, wait_seconds=0) == [], "delayed message visible at once")
+    messages = await backend.receive(queue, wait_seconds=3, visibility_timeout=30)
+    check(len(messages) == 1, "delayed message never became visible")
+    await backend.ack(queue, messages)
+
+
+async def check_long_poll(backend, queue):
+    started = time.monotonic()
+    receive = asyncio.create_task(backend.receive(queue, wait_seconds=5, visibility_timeout=30))
+    await asyncio.sleep(0.3)
+    await backend.send(queue, "wake up")
+    messages = await receive
+    waited = time.monotonic() - started
+    check(len(messages) == 1, "long poll returned nothing")
+    check(waited < 2, f"long poll took {waited:.2f}s to see a send")
+    await backend.ack(queue, messages)
+
+
+CHECKS = [
+    check_send_receive_ack,
+    check_batches,
+    check_redelivery,
+    check_extend_visibility,
+    check_delay,
+    check_long_poll,
+]
+
+
+async def throughput(backend, queue: str, count: int, consumers: int) -> float:
+    """Send count messages and drain them with concurrent consumers; messages/second end to end"""
+    seen = {}
+    done = asyncio.Event()
+
+    async def produce():
+        for start in range(0, count, 10):
+            await backend.send_batch(queue, [
+                {"id": str(i), "body": json.dumps({"n": start + i})}
+                for i in range(min(10, count - start))
+            ])
+
+    async def consume():
+        while not done.is_set():
+            messages = await backend.receive(queue, max_messages=10, wait_seconds=1, visibility_timeout=60)
+            for message in messages:
+                n = json.loads(message.body)["n"]
+                seen[n] = seen.get(n, 0) + 1
+            if messages:
+                await backend.ack(queue, messages)
+            if len(seen) >= count:
+                done.set()
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(consume()) for _ in range(consumers)]
+    await produce()
+    try:
+        await asyncio.wait_for(done.wait(), 120)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+    duplicates = sum(n - 1 for n in seen.values())
+    check(len(seen) == count, f"throughput run delivered {len(seen)} of {count}")
+    check(duplicates == 0, f"throughput run delivered {duplicates} duplicates")
+    return count / elapsed
+
+
+async def run_backend(name: str, backend, args) -> bool:
+    ok = True
+    run = uuid.uuid4().hex[:8]
+    for check_func in CHECKS:
+        queue = f"conformance-{run}-{check_func.__name__}"
+        started = time.perf_counter()
+        try:
+            await check_func(backend, queue)
+            print(f"  {name:6s} {check_func.__name__:28s} ok    {time.perf_counter() - started:6.2f}s")
+        except CheckFailed as e:
+            ok = False
+            print(f"  {name:6s} {check_func.__name__:28s} FAIL  {e}")
+    try:
+        rate = await throughput(backend, f"conformance-{run}-throughput", args.messages, args.consumers)
+        print(f"  {name:6s} {'throughput':28s} ok    {rate:8.0f} msg/s "
+              f"({args.messages} messages, {args.consumers} consumers)")
+    except CheckFailed as e:
+        ok = False
+        print(f"  {name:6s} {'throughput':28s} FAIL  {e}")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run the queue backend conformance checks")
+    parser.add_argument("--backends", default="memory,sql,sqs")
+    parser.add_argument("--messages", type=int, default=2000, help="Messages for the throughput run")
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--sqs-endpoint", default="", help="Use this SQS endpoint instead of the local fake")
+    parser.add_argument("--sqs-latency-ms", type=float, default=0, help="Simulated round trip of the local fake")
+    args = parser.parse_args()
+
+    fake = None
+    ok = True
+    for name in args.backends.split(","):
+        if name == "memory":
+            backend = MemoryQueue()
+        elif name == "sql":
+            await init_db()
+            backend = SqlQueue(float(os.environ["QUEUE_POLL_INTERVAL_SECONDS"]))
+        elif name == "sqs":
+            if args.sqs_endpoint:
+                os.environ["SQS_ENDPOINT_URL"] = args.sqs_endpoint
+            else:
+                from fake_sqs import FakeSqs
+                fake = FakeSqs(PORT, args.sqs_latency_ms / 1000)
+                fake.start_in_thread()
+            from app.config import settings
+            settings.SQS_ENDPOINT_URL = args.sqs_endpoint or fake.endpoint_url
+            backend = SqsQueue(threads=args.consumers + 4, client=sqs_client(args.consumers + 4))
+        else:
+            parser.error(f"unknown backend {name}")
+        print(f"{name}:")
+        ok = await run_backend(name, backend, args) and ok
+        await backend.close()
+
+    if fake:
+        fake.stop_thread()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
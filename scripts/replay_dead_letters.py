@@ -0,0 +1,117 @@
+"""
+List and replay dead-lettered queue jobs
+Jobs that failed permanently or ran out of retries are kept in the
+dead_letters table (see app.services.retries). Replaying sends a job back to
+its queue (or --to-queue) as a new message, with a fresh attempt count, and
+marks the row replayed.
+
+The memory queue backend lives inside the API process; replay into it from
+here is not seen by the workers. Use the sqs or sql backend.
+
+Example:
+    python scripts/replay_dead_letters.py --list
+    python scripts/replay_dead_letters.py --queue driverbuddy-sms-queue --limit 100
+    python scripts/replay_dead_letters.py --ids 12,13 --dry-run
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, update
+
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import DeadLetter
+from app.services.queues import close_queue_backend, get_queue_backend
+from app.services.retries import ATTEMPT_ATTRIBUTE
+
+
+async def list_dead_letters(query):
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query)).scalars().all()
+    for row in rows:
+        print(f"{row.id:>8}  {row.queue}  {row.error_kind:9s}  attempts={row.attempts}  "
+              f"{row.failed_at:%Y-%m-%d %H:%M:%S}  {row.error}")
+    print(f"{len(rows)} pending dead letters")
+
+
+async def replay(query, to_queue: str, dry_run: bool) -> int:
+    """Send the selected dead letters back, 10 per batch; returns how many were sent"""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(query)).scalars().all()
+    replayed = 0
+    for start in range(0, len(rows), 10):
+        chunk = rows[start:start + 10]
+        by_queue = {}
+        for row in chunk:
+            by_queue.setdefault(to_queue or row.queue, []).append(row)
+        for queue, queue_rows in by_queue.items():
+            if dry_run:
+                for row in queue_rows:
+                    print(f"Would replay dead letter {row.id} to {queue}")
+                continue
+            entries = []
+            for row in queue_rows:
+                attributes = {key: value for key, value in (row.attributes or {}).items()
+                              if key != ATTEMPT_ATTRIBUTE}
+                entry = {
+                    "id": str(row.id),
+                    "body": row.body,
+                    "attributes": {**attributes, "dead_letter_id": str(row.id)}
+                }
+                if queue.endswith(".fifo"):
+                    entry["dedup_id"] = f"dead-letter-{row.id}"
+                    entry["group_id"] = queue
+                entries.append(entry)
+            accepted = await get_queue_backend().send_batch(queue, entries)
+            sent_ids = [row.id for row in queue_rows if str(row.id) in accepted]
+            for row in queue_rows:
+                if str(row.id) not in accepted:
+                    print(f"Dead letter {row.id} was not accepted by {queue}")
+            if sent_ids:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(DeadLetter).where(DeadLetter.id.in_(sent_ids)).values(replayed_at=func.now())
+                    )
+                    await db.commit()
+            replayed += len(sent_ids)
+    return replayed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="List or replay dead-lettered queue jobs")
+    parser.add_argument("--list", action="store_true", help="List pending dead letters and exit")
+    parser.add_argument("--queue", help="Only dead letters of this queue")
+    parser.add_argument("--ids", help="Comma-separated dead letter ids")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--to-queue", help="Send to this queue instead of the original one")
+    parser.add_argument("--dry-run", action="store_true", help="Show what would be replayed")
+    args = parser.parse_args()
+
+    if settings.QUEUE_BACKEND == "memory" and not args.list:
+        print("Warning: QUEUE_BACKEND=memory; replayed jobs stay in this process and are lost")
+
+    query = select(DeadLetter).where(DeadLetter.replayed_at.is_(None)).order_by(DeadLetter.id).limit(args.limit)
+    if args.queue:
+        query = query.where(DeadLetter.queue == args.queue)
+    if args.ids:
+        query = query.where(DeadLetter.id.in_([int(i) for i in args.ids.split(",")]))
+
+    try:
+        if args.list:
+            await list_dead_letters(query)
+        else:
+            replayed = await replay(query, args.to_queue, args.dry_run)
+            if not args.dry_run:
+                print(f"{replayed} dead letters replayed")
+    finally:
+        await close_queue_backend()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
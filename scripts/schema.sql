@@ -17,6 +17,7 @@ CREATE TABLE IF NOT EXISTS events (
   end_time TIMESTAMPTZ,
   latitude NUMERIC(10, 7),
   longitude NUMERIC(10, 7),
+  geohash TEXT, -- of (latitude, longitude), for spatial search
   metadata JSONB,
   created_at TIMESTAMPTZ DEFAULT now()
 );
@@ -34,12 +35,99 @@ CREATE TABLE IF NOT EXISTS messages (
   created_at TIMESTAMPTZ DEFAULT now()
 );
 
+CREATE TABLE IF NOT EXISTS outbox (
+  id BIGSERIAL PRIMARY KEY,
+  queue TEXT NOT NULL, -- SQS queue name
+  payload JSONB NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ DEFAULT now(),
+  delivered_at TIMESTAMPTZ,
+  next_attempt_at TIMESTAMPTZ -- Backoff after a failed send
+);
+
+-- Job queue of the SQL queue backend (QUEUE_BACKEND=sql)
+CREATE TABLE IF NOT EXISTS queue_messages (
+  id BIGSERIAL PRIMARY KEY,
+  queue TEXT NOT NULL,
+  body TEXT NOT NULL,
+  attributes JSON,
+  receive_count INTEGER NOT NULL DEFAULT 0,
+  receipt TEXT, -- token of the latest receive; acks must match it
+  visible_at TIMESTAMPTZ NOT NULL,
+  created_at TIMESTAMPTZ DEFAULT now()
+);
+
+-- Queue jobs that failed permanently or ran out of retries
+CREATE TABLE IF NOT EXISTS dead_letters (
+  id BIGSERIAL PRIMARY KEY,
+  queue TEXT NOT NULL,
+  message_id TEXT,
+  body TEXT NOT NULL,
+  attributes JSON,
+  attempts INTEGER NOT NULL,
+  error_kind VARCHAR(20) NOT NULL, -- 'permanent' or 'exhausted'
+  error TEXT,
+  failed_at TIMESTAMPTZ DEFAULT now(),
+  replayed_at TIMESTAMPTZ -- set when sent back to its queue
+);
+
+-- Event counters per listing filter key ('all', 'vehicle:<id>', 'driver:<id>', 'type:<type>')
+CREATE TABLE IF NOT EXISTS event_counts (
+  filter_key TEXT NOT NULL,
+  shard SMALLINT NOT NULL, -- spreads concurrent increments over several rows
+  count BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (filter_key, shard)
+);
+
+-- Hourly/daily stop and message totals per vehicle, driver or the fleet ('*')
+-- (see app/services/rollups.py)
+CREATE TABLE IF NOT EXISTS fleet_rollups (
+  granularity TEXT NOT NULL, -- 'hour' or 'day'
+  dimension TEXT NOT NULL, -- 'vehicle', 'driver' or 'fleet'
+  key TEXT NOT NULL,
+  bucket_start TIMESTAMPTZ NOT NULL,
+  shard SMALLINT NOT NULL, -- spreads concurrent increments over several rows
+  stops INTEGER NOT NULL DEFAULT 0,
+  closed_stops INTEGER NOT NULL DEFAULT 0,
+  dwell_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+  outbound_messages INTEGER NOT NULL DEFAULT 0,
+  inbound_messages INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (granularity, dimension, key, bucket_start, shard)
+);
+
+-- Raw telemetry pings, one partition per UTC day (see app/services/telemetry.py);
+-- the writer creates the partition of each day it writes, so there is no default partition
+CREATE TABLE IF NOT EXISTS telemetry (
+  vehicle_id TEXT NOT NULL,
+  recorded_at TIMESTAMPTZ NOT NULL,
+  driver_id INTEGER,
+  latitude DOUBLE PRECISION,
+  longitude DOUBLE PRECISION,
+  speed DOUBLE PRECISION, -- km/h
+  heading DOUBLE PRECISION,
+  metadata JSON,
+  received_at TIMESTAMPTZ DEFAULT now(),
+  PRIMARY KEY (vehicle_id, recorded_at)
+) PARTITION BY RANGE (recorded_at);
+
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_events_vehicle_time ON events(vehicle_id, start_time);
-CREATE INDEX IF NOT EXISTS idx_events_driver_time ON events(driver_id, start_time);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_events_vehicle_type_start ON events(vehicle_id, event_type, start_time);
+CREATE INDEX IF NOT EXISTS idx_events_time_id ON events(start_time, id);
+CREATE INDEX IF NOT EXISTS idx_events_vehicle_time_id ON events(vehicle_id, start_time, id);
+CREATE INDEX IF NOT EXISTS idx_events_driver_time_id ON events(driver_id, start_time, id);
+CREATE INDEX IF NOT EXISTS idx_events_type_time_id ON events(event_type, start_time, id);
+CREATE INDEX IF NOT EXISTS idx_events_driver_type_time_id ON events(driver_id, event_type, start_time, id);
+CREATE INDEX IF NOT EXISTS idx_events_driver_open ON events(driver_id, start_time) WHERE end_time IS NULL;
+CREATE INDEX IF NOT EXISTS idx_events_geohash ON events(geohash text_pattern_ops);
 CREATE INDEX IF NOT EXISTS idx_events_vehicle_end_time ON events(vehicle_id, end_time) WHERE end_time IS NULL;
 CREATE INDEX IF NOT EXISTS idx_messages_driver_time ON messages(driver_id, created_at);
-CREATE INDEX IF NOT EXISTS idx_messages_event ON messages(event_id);
+CREATE INDEX IF NOT EXISTS idx_messages_event_created ON messages(event_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_messages_twilio_sid ON messages(twilio_sid);
+CREATE INDEX IF NOT EXISTS idx_messages_created ON messages(created_at);
+CREATE INDEX IF NOT EXISTS idx_fleet_rollups_bucket ON fleet_rollups(granularity, dimension, bucket_start);
+CREATE INDEX IF NOT EXISTS idx_outbox_undelivered ON outbox(id) WHERE delivered_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_queue_messages_visible ON queue_messages(queue, visible_at, id);
+CREATE INDEX IF NOT EXISTS idx_dead_letters_pending ON dead_letters(queue, id) WHERE replayed_at IS NULL;
 
 -- Sample driver (for testing)
 INSERT INTO drivers (id, name, phone) VALUES (1, 'Test Driver', '+17652590506')